@@ -0,0 +1,338 @@
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from operator import itemgetter
+
+import crytography_machine as cm
+from byte_ciphers import UPPER, upper_shift_table
+from cli import CIPHERS, make_stream
+from numpy_backend import _from_codes, _key_indices, _to_codes, np
+from parallel import SQUARE_NORMALIZE, _square_digraphs
+
+BLOCK_SIZE = 1 << 18  # Characters packed per step; keeps the temporary arrays small enough to stay in cache
+SQUARES = ('playfair', 'two-square', 'four-square')
+X = ord('X')
+
+
+def _blocks(texts, block_size):
+    """Splits texts into consecutive slices of about block_size characters (a longer text gets a slice alone)."""
+    ends = list(accumulate(map(len, texts)))
+    start = 0
+    while start < len(texts):
+        stop = max(start + 1, bisect_left(ends, (ends[start - 1] if start else 0) + block_size, start))
+        yield texts[start:stop]
+        start = stop
+
+
+def _pack(texts, upper=UPPER):
+    """Packs texts into one code array (uint8 for ASCII, uint32 otherwise) and the offsets of every text.
+
+    Text i is codes[offsets[i]:offsets[i + 1]]. ASCII text is translated with the bytes table upper
+    (upper-casing by default), other text is upper-cased; None keeps the text as it is.
+    """
+    joined = ''.join(texts)
+    if joined.isascii():
+        data = joined.encode('ascii')
+        codes = np.frombuffer(data.translate(upper) if upper else data, dtype=np.uint8)
+    elif upper is None:
+        codes = _to_codes(joined)
+    else:
+        upper = joined.upper()
+        if len(upper) != len(joined):
+            texts = [text.upper() for text in texts]  # Some character, like 'ß', upper-cases to several
+        codes = _to_codes(upper)
+    return codes, np.fromiter(accumulate(map(len, texts), initial=0), dtype=np.int64, count=len(texts) + 1)
+
+
+def _split(joined, offsets):
+    offsets = offsets.tolist()
+    return [joined[a:b] for a, b in zip(offsets, offsets[1:])]
+
+
+def _offsets_of(mask, offsets):
+    """Message offsets among the packed codes selected by mask."""
+    return offsets - np.searchsorted(np.flatnonzero(~mask), offsets)
+
+
+def _starts(offsets):
+    """Flags the first code of every message."""
+    starts = np.zeros(offsets[-1] + 1, dtype=bool)
+    starts[offsets] = True
+    return starts
+
+
+def _positions(offsets):
+    """Index of every packed code within its own message."""
+    return np.arange(offsets[-1]) - np.repeat(offsets[:-1], np.diff(offsets))
+
+
+def _cycle(key, length, start=0):
+    """key repeated over length positions, so position p holds key[(p - start) % len(key)]."""
+    return np.resize(np.roll(key, start), length)
+
+
+def _reference(cipher, encrypt, key, key2, shift, rails):
+    """The one-message function of crytography_machine for a cipher and its parameters."""
+    if cipher == 'caesar':
+        return lambda text: cm.caesar_cipher(text, shift, encrypt)
+    if cipher == 'rot13':
+        return cm.rot13
+    if cipher == 'vigenere':
+        return lambda text: cm.vigenere_cipher(text, key, encrypt)
+    if cipher == 'autokey':
+        return lambda text: cm.autokey_cipher(text, key, encrypt)
+    if cipher == 'beaufort':
+        return lambda text: cm.beaufort_cipher(text, key)
+    if cipher == 'playfair':
+        return lambda text: cm.playfair_cipher(text, key, encrypt)
+    if cipher == 'two-square':
+        function = cm.two_square_cipher_encrypt if encrypt else cm.two_square_cipher_decrypt
+        return lambda text: function(text, key, key2)
+    if cipher == 'four-square':
+        function = cm.four_square_cipher_encrypt if encrypt else cm.four_square_cipher_decrypt
+        return lambda text: function(text, key, key2)
+    return lambda text: cm.rail_fence_cipher(text, rails, encrypt)
+
+
+def _caesar(texts, shift):
+    joined = ''.join(texts)
+    if joined.isascii():
+        joined = joined.encode('ascii').translate(upper_shift_table(shift)).decode('ascii')
+    else:
+        joined = cm.caesar_cipher(joined, shift)  # Upper-casing may lengthen a text; split the results again
+        if len(joined) != sum(map(len, texts)):
+            return [cm.caesar_cipher(text, shift) for text in texts]
+    offsets = list(accumulate(map(len, texts), initial=0))
+    return [joined[a:b] for a, b in zip(offsets, offsets[1:])]
+
+
+def _vigenere(codes, offsets, shifts):
+    letters = codes - 65  # Wraps around for codes below 'A', so one comparison finds the letters
+    mask = letters < 26
+    # Letters up to each code within its message, as the key restarts with every message:
+    # the r-th letter takes shifts[r - 1]
+    counts = np.cumsum(mask, dtype=np.int32)
+    ranks = counts - np.repeat(np.concatenate(([0], counts))[offsets[:-1]], np.diff(offsets))
+    stream = _cycle(shifts, int(ranks.max(initial=0)) + 1, 1)[ranks]
+    return np.where(mask, (letters + stream) % 26 + 65, codes), offsets
+
+
+def _beaufort(codes, offsets, key):
+    kept = codes != 32  # Spaces are dropped, and the key advances on every other character
+    codes, offsets = codes[kept], _offsets_of(kept, offsets)
+    letters = codes - 65
+    positions = _positions(offsets)
+    stream = _cycle(key, int(positions.max(initial=0)) + 1)[positions]
+    return np.where(letters < 26, (stream + 26 - letters) % 26 + 65, codes), offsets
+
+
+def _autokey(codes, offsets, key, encrypt):
+    mask = (codes - 65) < 26
+    letters = (codes[mask] - 65).astype(np.int32)
+    if not letters.size:
+        return codes, offsets
+    counts = _offsets_of(mask, offsets)
+    ranks = _positions(counts)
+    size = len(key)
+    if encrypt:
+        # Each letter is combined with the plaintext size letters back, the first size of a message with the key
+        stream = np.empty_like(letters)
+        stream[size:] = letters[:-size]
+        primed = ranks < size
+        stream[primed] = key[ranks[primed]]
+        out = letters + stream
+    else:
+        # Laid out in rows of size letters, each message from a fresh row, plaintext row k is
+        # ciphertext row k minus plaintext row k - 1, so p_k = (-1)^k (c_0 - c_1 + ... ± c_k - key):
+        # one alternating cumulative sum down the rows, restarted for every message.
+        rows = np.concatenate(([0], np.cumsum(-(-np.diff(counts) // size))))
+        cells = ranks + np.repeat(rows[:-1] * size, np.diff(counts))
+        grid = np.zeros((rows[-1], size), dtype=np.int32)
+        grid.reshape(-1)[cells] = letters
+        signs = (1 - 2 * (_positions(rows) % 2)).astype(np.int32)[:, None]
+        sums = np.cumsum(grid * signs, axis=0)
+        sums -= np.repeat(np.concatenate((np.zeros((1, size), dtype=np.int32), sums))[rows[:-1]], np.diff(rows), axis=0)
+        out = (signs * (sums - key)).reshape(-1)[cells]
+    codes = codes.copy()
+    codes[mask] = (out % 26 + 65).astype(codes.dtype)
+    return codes, offsets
+
+
+@lru_cache(maxsize=256)
+def _digraph_codes(cipher, key, key2, encrypt):
+    """A 65536-entry table mapping every digraph, read as a little-endian uint16, to its output; 0 marks invalid ones."""
+    digraphs = _square_digraphs(cipher, key, key2, encrypt)
+    table = np.zeros(1 << 16, dtype=np.uint16)
+    table[np.frombuffer(''.join(digraphs).encode('latin-1'), dtype=np.uint16)] = \
+        np.frombuffer(''.join(digraphs.values()).encode('latin-1'), dtype=np.uint16)
+    return table
+
+
+def _square(codes, offsets, cipher, key, key2, encrypt):
+    """The Playfair family; None when some message is invalid, so the reference can raise its error."""
+    if codes.dtype != np.uint8:
+        return None  # Non-ASCII characters are never in the squares
+    kept = codes != 32
+    codes, offsets = codes[kept], _offsets_of(kept, offsets)
+    if cipher == 'playfair' or (cipher == 'two-square' and encrypt):
+        # A doubled letter starting a digraph gets an 'X'. After any doubled letter at position d the
+        # digraphs start at positions of parity d + 1, so the next doubled letter e starts one exactly
+        # when e - d is odd; the first one of a message when it is at an even position.
+        doubled = np.flatnonzero((codes[:-1] == codes[1:]) & ~_starts(offsets)[1:-1])
+        at = doubled - offsets[np.searchsorted(offsets, doubled, 'right') - 1]
+        follows = np.concatenate(([False], doubled[:-1] >= (doubled - at)[1:]))  # Same message as the previous one
+        gap = at - np.concatenate(([0], at[:-1] + 1))
+        inserted = doubled[np.where(follows, gap, at) % 2 == 0] + 1
+        codes = np.insert(codes, inserted, X)
+        offsets = offsets + np.searchsorted(inserted, offsets)
+    odd = np.diff(offsets) % 2
+    if odd.any():
+        if not encrypt and cipher != 'playfair':
+            return None  # Odd-length ciphertext
+        codes = np.insert(codes, offsets[1:][odd.astype(bool)], X)  # A lone last letter gets an 'X'
+        offsets = offsets + np.concatenate(([0], np.cumsum(odd)))
+    codes = _digraph_codes(cipher, key, key2, encrypt)[codes.view(np.uint16)]
+    if not codes.all():
+        return None  # A character outside the squares
+    codes = codes.view(np.uint8)
+    if encrypt:
+        return codes, offsets
+    if cipher == 'two-square':
+        # An 'X' between two equal letters of a message is padding
+        inner = ~_starts(offsets)  # Not the first code of a message
+        kept = np.ones(len(codes), dtype=bool)
+        kept[1:-1] = ~((codes[1:-1] == X) & inner[1:-2] & inner[2:-1] & (codes[:-2] == codes[2:]))
+    else:
+        kept = np.ones(len(codes), dtype=bool)
+        ends = offsets[1:][np.diff(offsets) > 0] - 1
+        kept[ends[codes[ends] == X]] = False  # Trailing 'X' padding
+    return codes[kept], _offsets_of(kept, offsets)
+
+
+def _rail_fence(codes, offsets, permutations, rails, encrypt):
+    out = codes.copy()
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    # Messages of one length share a permutation: move them all with one gather
+    for length in np.unique(lengths[lengths > 1]).tolist():
+        permutation = permutations.get(length)
+        if permutation is None:
+            permutation = cm.rail_fence_permutation(length, rails, encrypt)
+            permutation = permutations[length] = np.frombuffer(permutation, dtype=np.int64)
+        rows = starts[lengths == length][:, None]
+        out[rows + np.arange(length)] = codes[rows + permutation]
+    return out, offsets
+
+
+def _rail_fence_loop(texts, rails, encrypt):
+    getters = {}
+    results = []
+    for text in texts:
+        getter = getters.get(len(text))
+        if getter is None:
+            permutation = cm.rail_fence_permutation(len(text), rails, encrypt)
+            getter = getters[len(text)] = itemgetter(*permutation) if len(text) > 1 else str
+        results.append(''.join(getter(text)))
+    return results
+
+
+def _kernel(cipher, encrypt, key, key2, rails):
+    """The vectorized transform (codes, offsets) -> (codes, offsets) for a cipher, with its key set up once."""
+    if cipher == 'vigenere':
+        shifts = _key_indices(key.upper())
+        shifts = shifts if encrypt else (26 - shifts) % 26
+        return lambda codes, offsets: _vigenere(codes, offsets, shifts)
+    if cipher == 'beaufort':
+        key = _key_indices(key.upper().replace(' ', ''))
+        return lambda codes, offsets: _beaufort(codes, offsets, key)
+    if cipher == 'autokey':
+        key = np.array(cm.AutokeyState(key.upper()).ring, dtype=np.int32)
+        return lambda codes, offsets: _autokey(codes, offsets, key, encrypt)
+    if cipher == 'rail-fence':
+        permutations = {}  # Message length -> permutation, for the whole batch
+        return lambda codes, offsets: _rail_fence(codes, offsets, permutations, rails, encrypt)
+    return lambda codes, offsets: _square(codes, offsets, cipher, key, key2, encrypt)
+
+
+def transform_many(texts, cipher, encrypt=True, key=None, key2=None, shift=None, rails=None, block_size=BLOCK_SIZE):
+    """Encrypts or decrypts many messages with one cipher and key; returns the results in the same order.
+
+    The key is set up once for the whole batch, and the messages are packed, block_size characters
+    at a time, into one code array with an offsets array, so each cipher runs over thousands of
+    messages in a few vectorized passes instead of once per message. Results equal the
+    crytography_machine functions message by message; when a message is invalid, the same
+    error is raised.
+    """
+    if cipher not in CIPHERS:
+        raise ValueError(f"Unknown cipher: {cipher}")
+    make_stream(cipher, encrypt, key, key2, shift, rails)  # Reject missing or invalid keys like the other front ends
+    texts = list(texts)
+    if cipher in ('caesar', 'rot13'):
+        return _caesar(texts, 13 if cipher == 'rot13' else shift if encrypt else -shift)
+    reference = _reference(cipher, encrypt, key, key2, shift, rails)
+    if cipher == 'rail-fence' and rails <= 1:
+        return texts
+    if np is None:
+        if cipher == 'rail-fence':
+            return _rail_fence_loop(texts, rails, encrypt)
+        return list(map(reference, texts))
+    kernel = _kernel(cipher, encrypt, key, key2, rails)
+    upper = None if cipher == 'rail-fence' else SQUARE_NORMALIZE if cipher in SQUARES else UPPER
+    results = []
+    for block in _blocks(texts, block_size):
+        codes, offsets = _pack(block, upper)
+        transformed = kernel(codes, offsets)
+        if transformed is None:
+            results.extend(map(reference, block))
+        else:
+            results.extend(_split(_from_codes(transformed[0]), transformed[1]))
+    return results
+
+
+def encrypt_many(messages, cipher, key=None, **options):
+    """Encrypts a batch of messages, e.g. encrypt_many(["attack at dawn", ...], 'vigenere', 'LEMON')."""
+    return transform_many(messages, cipher, True, key, **options)
+
+
+def decrypt_many(messages, cipher, key=None, **options):
+    """Decrypts a batch of messages."""
+    return transform_many(messages, cipher, False, key, **options)
+
+
+import unittest
+
+
+class TestBatch(unittest.TestCase):
+    MESSAGES = ["Attack at dawn", "", "Hold the bridge, balloon and all!", "x", "Meet me by the old mill",
+                "Straße über Zürich", "Tee off at noon; keep the ball rolling", "JJ", "a b"]
+
+    def test_matches_one_message_functions(self):
+        from unittest import mock
+        options = {'key': "LEMON", 'key2': "EXAMPLE", 'shift': 3, 'rails': 4}
+        squares = [text for text in self.MESSAGES if text.isascii() and not any(c in text for c in ',!;')]
+        for numpy_module in {np, None}:
+            with mock.patch(__name__ + '.np', numpy_module):
+                for cipher in CIPHERS:
+                    messages = squares if cipher in SQUARES else self.MESSAGES
+                    for encrypt in (True, False):
+                        reference = _reference(cipher, encrypt, **options)
+                        if not encrypt and cipher in ('two-square', 'four-square'):
+                            messages = encrypt_many(messages, cipher, **options)
+                        self.assertEqual(transform_many(messages, cipher, encrypt, **options),
+                                         list(map(reference, messages)), (cipher, encrypt, numpy_module))
+
+    def test_errors(self):
+        self.assertEqual(encrypt_many([], 'caesar', shift=1), [])
+        with self.assertRaises(KeyError):
+            encrypt_many(["fine", "not fine: 1"], 'playfair', "KEY")
+        with self.assertRaises(ValueError):
+            decrypt_many(["ABC"], 'two-square', "KEY", key2="OTHER")  # Odd-length ciphertext
+        with self.assertRaises(ValueError):
+            encrypt_many(["text"], 'vigenere')  # Missing key
+        with self.assertRaises(ValueError):
+            encrypt_many(["text"], 'beaufort', " ")  # No key letters
+        with self.assertRaises(ValueError):
+            encrypt_many(["text"], 'enigma')
+
+
+if __name__ == "__main__":
+    unittest.main()
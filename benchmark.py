@@ -0,0 +1,210 @@
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+import timeit
+from collections import namedtuple
+
+import crytography_machine as cm
+import testing
+
+DEFAULT_SIZES = [16, 1024, 64 * 1024, 1024 * 1024]
+FULL_SIZES = [16, 1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+DEFAULT_KEY_LENGTHS = [1, 8, 64, 1024]
+TEXT_KINDS = ['letters', 'mixed']
+
+# keyed: the key length matters; letters: the cipher rejects punctuation, so 'mixed' text only adds spaces;
+# prepare turns plaintext into the function's input (ciphertext for the decrypt-only functions)
+Case = namedtuple('Case', 'name run keyed letters prepare')
+
+
+def _case(name, run, keyed=True, letters=False, prepare=None):
+    return Case(name, run, keyed, letters, prepare)
+
+
+def _second_key(key):
+    return key[::-1] + 'SECOND'
+
+
+CASES = [
+    _case('caesar_cipher', lambda t, k: cm.caesar_cipher(t, 3), keyed=False),
+    _case('rot13', lambda t, k: cm.rot13(t), keyed=False),
+    _case('vigenere_cipher', lambda t, k: cm.vigenere_cipher(t, k)),
+    _case('autokey_cipher', lambda t, k: cm.autokey_cipher(t, k)),
+    _case('beaufort_cipher', lambda t, k: cm.beaufort_cipher(t, k)),
+    _case('VigenereAutokeyCipher.encode', lambda t, k: cm.VigenereAutokeyCipher(k).encode(t)),
+    _case('VigenereAutokeyCipher.decode', lambda t, k: cm.VigenereAutokeyCipher(k).decode(t)),
+    _case('playfair_cipher', lambda t, k: cm.playfair_cipher(t, k), letters=True),
+    _case('playfair_cipher.decrypt', lambda t, k: cm.playfair_cipher(t, k, encrypt=False), letters=True,
+          prepare=lambda t, k: cm.playfair_cipher(t, k)),
+    _case('two_square_cipher_encrypt', lambda t, k: cm.two_square_cipher_encrypt(t, k, _second_key(k)), letters=True),
+    _case('two_square_cipher_decrypt', lambda t, k: cm.two_square_cipher_decrypt(t, k, _second_key(k)), letters=True,
+          prepare=lambda t, k: cm.two_square_cipher_encrypt(t, k, _second_key(k))),
+    _case('four_square_cipher_encrypt', lambda t, k: cm.four_square_cipher_encrypt(t, k, _second_key(k)), letters=True),
+    _case('four_square_cipher_decrypt', lambda t, k: cm.four_square_cipher_decrypt(t, k, _second_key(k)), letters=True,
+          prepare=lambda t, k: cm.four_square_cipher_encrypt(t, k, _second_key(k))),
+    _case('rail_fence_cipher', lambda t, k: cm.rail_fence_cipher(t, len(k) + 1)),
+    _case('rail_fence_cipher.decrypt', lambda t, k: cm.rail_fence_cipher(t, len(k) + 1, encrypt=False)),
+    _case('testing.four_square_encrypt', lambda t, k: testing.four_square_encrypt([k, _second_key(k)], t)),
+    _case('testing.four_square_decrypt', lambda t, k: testing.four_square_decrypt([k, _second_key(k)], t),
+          prepare=lambda t, k: testing.four_square_encrypt([k, _second_key(k)], t)),
+]
+
+
+def make_text(size, kind, letters_only=False, seed=0):
+    """Deterministic benchmark text: A-Z only, or letters mixed with spaces and punctuation."""
+    rng = random.Random(seed)
+    if kind == 'letters':
+        alphabet = string.ascii_uppercase
+    elif letters_only:
+        alphabet = string.ascii_uppercase * 4 + ' '
+    else:
+        alphabet = string.ascii_letters * 2 + '     ,.;!?\n0123456789'
+    # Repeat a random block so that 100 MB inputs are cheap to generate
+    block = ''.join(rng.choice(alphabet) for _ in range(min(size, 64 * 1024)))
+    return (block * (size // len(block) + 1))[:size]
+
+
+def make_key(length, seed=0):
+    rng = random.Random(seed + length)
+    return ''.join(rng.choice(string.ascii_uppercase) for _ in range(length))
+
+
+def measure(func, repeat=3, min_time=0.2):
+    """Best per-call time over repeat rounds, each running func enough times to last min_time."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, timer.timeit(number) / number)
+    return best
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, key_lengths=DEFAULT_KEY_LENGTHS, kinds=TEXT_KINDS, names=None,
+                   repeat=3, min_time=0.2, progress=None):
+    """Runs every selected case and returns a list of result dicts."""
+    results = []
+    for case in CASES:
+        if names and not any(name in case.name for name in names):
+            continue
+        for kind in kinds:
+            for size in sizes:
+                text = make_text(size, kind, case.letters)
+                for key_length in (key_lengths if case.keyed else [1]):
+                    key = make_key(key_length)
+                    data = case.prepare(text, key) if case.prepare else text
+                    seconds = measure(lambda: case.run(data, key), repeat, min_time)
+                    result = {
+                        'name': case.name,
+                        'text': kind,
+                        'size': size,
+                        'key_length': key_length,
+                        'seconds_per_call': seconds,
+                        'mb_per_s': size / seconds / 1e6,
+                    }
+                    results.append(result)
+                    if progress:
+                        progress(result)
+    return results
+
+
+def _result_id(result):
+    return result['name'], result['text'], result['size'], result['key_length']
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Returns (result, baseline seconds) for every result slower than its baseline by more than tolerance."""
+    previous = {_result_id(r): r['seconds_per_call'] for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(_result_id(result))
+        if before is not None and result['seconds_per_call'] > before * (1 + tolerance):
+            regressions.append((result, before))
+    return regressions
+
+
+def _parse_size(text):
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmarks for every cipher.")
+    parser.add_argument('--sizes', help="comma-separated input sizes, e.g. 16,1K,1M (default: 16B-1MB)")
+    parser.add_argument('--full', action='store_true', help="sizes from 16 bytes up to 100 MB")
+    parser.add_argument('--key-lengths', help="comma-separated key lengths (default: 1,8,64,1024)")
+    parser.add_argument('--text', choices=TEXT_KINDS, action='append', help="text kind to run (default: both)")
+    parser.add_argument('--filter', action='append', help="only run cases whose name contains this")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument('--output', '-o', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before a regression")
+    parser.add_argument('--update-baseline', action='store_true', help="write the results to --baseline")
+    args = parser.parse_args(argv)
+
+    sizes = FULL_SIZES if args.full else DEFAULT_SIZES
+    if args.sizes:
+        sizes = [_parse_size(s) for s in args.sizes.split(',')]
+    key_lengths = [int(n) for n in args.key_lengths.split(',')] if args.key_lengths else DEFAULT_KEY_LENGTHS
+
+    def progress(r):
+        print(f"{r['name']:30} {r['text']:8} {r['size']:>10} B  key {r['key_length']:>5}  "
+              f"{r['seconds_per_call'] * 1e6:12.1f} us/call  {r['mb_per_s']:9.2f} MB/s", flush=True)
+
+    results = run_benchmarks(sizes, key_lengths, args.text or TEXT_KINDS, args.filter, args.repeat,
+                             args.min_time, progress)
+    report = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        return 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for result, before in regressions:
+            print(f"REGRESSION {result['name']} {result['text']} {result['size']} B key {result['key_length']}: "
+                  f"{before * 1e6:.1f} -> {result['seconds_per_call'] * 1e6:.1f} us/call", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_every_case_runs(self):
+        results = run_benchmarks(sizes=[16], key_lengths=[3], repeat=1, min_time=0.0)
+        self.assertEqual(len(results), len(CASES) * len(TEXT_KINDS))
+        self.assertTrue(all(r['mb_per_s'] > 0 for r in results))
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': [{'name': 'rot13', 'text': 'mixed', 'size': 16, 'key_length': 1, 'seconds_per_call': 1e-6}]}
+        slow = dict(baseline['results'][0], seconds_per_call=2e-6)
+        self.assertEqual(compare([slow], baseline), [(slow, 1e-6)])
+        self.assertEqual(compare([baseline['results'][0]], baseline), [])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import re
+import string
+from functools import lru_cache
+
+from crytography_machine import _splice, beaufort_tables, translate_periodic, vigenere_tables
+
+CHUNK_SIZE = 1 << 20  # Bytes transformed per step; bounds the temporary copies whatever the input size
+UPPER = bytes.maketrans(string.ascii_lowercase.encode(), string.ascii_uppercase.encode())
+NON_LETTER_RUNS = re.compile(rb'([^A-Z]+)')
+
+
+@lru_cache(maxsize=None)
+def upper_shift_table(shift):
+    """Builds (once per shift) a 256-entry table that upper-cases ASCII letters and shifts them."""
+    upper, lower = string.ascii_uppercase, string.ascii_lowercase
+    shift %= 26
+    shifted = upper[shift:] + upper[:shift]
+    return bytes.maketrans((upper + lower).encode(), (shifted + shifted).encode())
+
+
+def _views(data, out):
+    """Returns flat byte views of data and out, checking that out is writable and as large as data."""
+    src = memoryview(data).cast('B')
+    dst = memoryview(out).cast('B')
+    if dst.readonly:
+        raise ValueError("Output buffer is read-only.")
+    _check_room(dst, len(src))
+    return src, dst
+
+
+def _check_room(dst, needed):
+    if len(dst) < needed:
+        raise ValueError(f"Output buffer holds {len(dst)} bytes, {needed} are needed.")
+
+
+def caesar_into(data, out, shift, encrypt=True):
+    """Caesar cipher from any bytes-like data into the writable buffer out; returns bytes written.
+
+    out may be data itself to transform in place. ASCII letters are upper-cased like
+    caesar_cipher(); every other byte is copied unchanged.
+    """
+    table = upper_shift_table(shift if encrypt else -shift)
+    src, dst = _views(data, out)
+    with src, dst:
+        for i in range(0, len(src), CHUNK_SIZE):
+            j = min(i + CHUNK_SIZE, len(src))
+            dst[i:j] = src[i:j].tobytes().translate(table)
+        return len(src)
+
+
+def rot13_into(data, out):
+    """ROT13 from data into out (or in place); returns bytes written."""
+    return caesar_into(data, out, 13)
+
+
+def vigenere_into(data, out, key, encrypt=True, offset=0):
+    """Vigenère cipher from data into out (or in place); returns bytes written.
+
+    The key advances on ASCII letters only, starting at key position offset, so for ASCII
+    input the result matches vigenere_cipher(). Other bytes, including non-ASCII ones,
+    are copied unchanged.
+    """
+    tables = vigenere_tables(key, encrypt)
+    src, dst = _views(data, out)
+    with src, dst:
+        for i in range(0, len(src), CHUNK_SIZE):
+            j = min(i + CHUNK_SIZE, len(src))
+            chunk = src[i:j].tobytes().translate(UPPER)
+            parts = NON_LETTER_RUNS.split(chunk)
+            letters = b''.join(parts[::2]) if len(parts) > 1 else chunk
+            translated = translate_periodic(letters, tables, offset)
+            offset += len(letters)
+            dst[i:j] = _splice(parts, translated, False) if len(parts) > 1 else translated
+        return len(src)
+
+
+def beaufort_into(data, out, key, offset=0):
+    """Beaufort cipher from data into out (or in place); returns bytes written.
+
+    Spaces are dropped like beaufort_cipher() does, so fewer bytes than len(data) may be
+    written; the key advances on every remaining byte, starting at key position offset.
+    """
+    tables = beaufort_tables(key)
+    src = memoryview(data).cast('B')
+    dst = memoryview(out).cast('B')
+    if dst.readonly:
+        raise ValueError("Output buffer is read-only.")
+    written = 0
+    with src, dst:
+        for i in range(0, len(src), CHUNK_SIZE):
+            chunk = src[i:i + CHUNK_SIZE].tobytes().translate(UPPER, b' ')
+            _check_room(dst, written + len(chunk))
+            dst[written:written + len(chunk)] = translate_periodic(chunk, tables, offset + written)
+            written += len(chunk)
+        return written
+
+
+def caesar_bytes(data, shift, encrypt=True):
+    """Caesar cipher on bytes-like data; returns a new bytearray."""
+    out = bytearray(memoryview(data).nbytes)
+    caesar_into(data, out, shift, encrypt)
+    return out
+
+
+def rot13_bytes(data):
+    """ROT13 on bytes-like data; returns a new bytearray."""
+    return caesar_bytes(data, 13)
+
+
+def vigenere_bytes(data, key, encrypt=True, offset=0):
+    """Vigenère cipher on bytes-like data; returns a new bytearray."""
+    out = bytearray(memoryview(data).nbytes)
+    vigenere_into(data, out, key, encrypt, offset)
+    return out
+
+
+def beaufort_bytes(data, key, offset=0):
+    """Beaufort cipher on bytes-like data; returns a new bytearray without the spaces."""
+    out = bytearray(memoryview(data).nbytes)
+    del out[beaufort_into(data, out, key, offset):]
+    return out
+
+
+import unittest
+
+
+class TestByteCiphers(unittest.TestCase):
+    TEXT = "Attack at dawn, then retreat!\n Ünïcode bytes pass through; 12345 zz " * 5
+
+    def test_matches_text_functions(self):
+        from crytography_machine import beaufort_cipher, caesar_cipher, rot13, vigenere_cipher
+        data = self.TEXT.encode('ascii', 'replace')
+        text = data.decode('ascii')
+        self.assertEqual(caesar_bytes(data, 3).decode(), caesar_cipher(text, 3))
+        self.assertEqual(caesar_bytes(caesar_bytes(data, 3), 3, encrypt=False).decode(), text.upper())
+        self.assertEqual(rot13_bytes(data).decode(), rot13(text))
+        self.assertEqual(vigenere_bytes(data, "LEMON").decode(), vigenere_cipher(text, "LEMON"))
+        self.assertEqual(vigenere_bytes(data, "LEMON", encrypt=False).decode(),
+                         vigenere_cipher(text, "LEMON", encrypt=False))
+        self.assertEqual(beaufort_bytes(data, "FORTIFY").decode(), beaufort_cipher(text, "FORTIFY"))
+
+    def test_in_place_and_chunk_boundaries(self):
+        from unittest import mock
+        from crytography_machine import beaufort_cipher, vigenere_cipher
+        data = self.TEXT.encode('utf-8')
+        expected = vigenere_bytes(data, "KEY")
+        with mock.patch(__name__ + '.CHUNK_SIZE', 7):
+            buf = bytearray(data)
+            self.assertEqual(vigenere_into(buf, buf, "KEY"), len(data))
+            self.assertEqual(buf, expected)
+            text = "Hide the gold in the tree stump, then run."
+            buf = bytearray(text.encode())
+            n = beaufort_into(memoryview(buf), buf, "KEY")
+            self.assertEqual(buf[:n].decode(), beaufort_cipher(text, "KEY"))
+        array_input = memoryview(bytearray(b"HELLO")).cast('B')
+        out = memoryview(bytearray(8))
+        self.assertEqual(rot13_into(array_input, out[2:]), 5)
+        self.assertEqual(bytes(out), b"\0\0URYYB\0")
+        with self.assertRaises(ValueError):
+            caesar_into(b"HELLO", b"12345", 3)  # Read-only output
+        with self.assertRaises(ValueError):
+            caesar_into(b"HELLO", bytearray(4), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import argparse
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from crytography_machine import (AutokeyStream, BeaufortStream, CaesarStream, FourSquareStream, PlayfairStream,
+                                 RailFenceStream, TwoSquareStream, VigenereStream, stream_chunks)
+
+BLOCK_SIZE = 1 << 20  # Characters read per block
+CIPHERS = ['caesar', 'rot13', 'vigenere', 'autokey', 'beaufort', 'playfair', 'two-square', 'four-square', 'rail-fence']
+
+
+def make_stream(cipher, encrypt=True, key=None, key2=None, shift=None, rails=None):
+    """Builds the update()/finalize() stream object for a cipher name and its parameters."""
+    def need(value, option):
+        if value is None:
+            raise ValueError(f"The {cipher} cipher needs {option}.")
+        return value
+
+    if cipher == 'caesar':
+        return CaesarStream(need(shift, '--shift'), encrypt)
+    if cipher == 'rot13':
+        return CaesarStream(13)
+    if cipher == 'vigenere':
+        return VigenereStream(need(key, '--key'), encrypt)
+    if cipher == 'autokey':
+        return AutokeyStream(need(key, '--key'), encrypt)
+    if cipher == 'beaufort':
+        return BeaufortStream(need(key, '--key'))  # Symmetric
+    if cipher == 'playfair':
+        return PlayfairStream(need(key, '--key'), encrypt)
+    if cipher == 'two-square':
+        return TwoSquareStream(need(key, '--key'), need(key2, '--key2'), encrypt)
+    if cipher == 'four-square':
+        return FourSquareStream(need(key, '--key'), need(key2, '--key2'), encrypt)
+    if cipher == 'rail-fence':
+        return RailFenceStream(need(rails, '--rails'), encrypt)
+    raise ValueError(f"Unknown cipher: {cipher}")
+
+
+def read_blocks(f, block_size=BLOCK_SIZE):
+    """Yields a text file's contents in blocks of block_size characters."""
+    return iter(lambda: f.read(block_size), '')
+
+
+def transform(src, dst, options):
+    """Runs everything readable from src through a fresh stream and writes it to dst."""
+    stream = make_stream(**options)
+    for out in stream_chunks(stream, read_blocks(src)):
+        dst.write(out)
+
+
+def process_file(path, output_path, options):
+    """Transforms one file; returns None on success or an error message."""
+    try:
+        with open(path, encoding='utf-8', newline='') as src, _open_text(output_path, 'w') as dst:
+            transform(src, dst, options)
+    except (OSError, ValueError, KeyError) as e:
+        return f"{path}: {_describe(e)}"
+    return None
+
+
+def _describe(error):
+    if isinstance(error, KeyError):
+        return f"{error.args[0]!r} contains a character that is not in the key square"
+    return str(error)
+
+
+@contextmanager
+def _open_text(path, mode):
+    """Opens a UTF-8 text file, or standard input/output when path is None, without newline translation.
+
+    A file opened for writing is written under a temporary name next to path and renamed
+    over it only once the block completes, so a failure never leaves a partial output behind.
+    """
+    if path is not None and mode == 'w':
+        directory, name = os.path.split(path)
+        partial = os.path.join(directory, f".{name}.{os.getpid()}.part")
+        try:
+            with open(partial, 'w', encoding='utf-8', newline='') as f:
+                yield f
+            os.replace(partial, path)
+        except BaseException:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+        return
+    if path is not None:
+        with open(path, mode, encoding='utf-8', newline='') as f:
+            yield f
+        return
+    f = io.TextIOWrapper(sys.stdin.buffer if mode == 'r' else sys.stdout.buffer, encoding='utf-8', newline='')
+    try:
+        yield f
+    finally:
+        if mode == 'w':
+            f.flush()
+        f.detach()  # Leave the process's standard streams open
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='crypto', description="Encrypt or decrypt text with classical ciphers.")
+    parser.add_argument('operation', choices=['encrypt', 'decrypt'])
+    parser.add_argument('files', nargs='*', help="input files (default: standard input)")
+    parser.add_argument('--cipher', '-c', required=True, choices=CIPHERS)
+    parser.add_argument('--key', '-k')
+    parser.add_argument('--key2', help="second key for the two-square and four-square ciphers")
+    parser.add_argument('--shift', type=int, help="shift for the caesar cipher")
+    parser.add_argument('--rails', type=int, help="number of rails for the rail-fence cipher")
+    parser.add_argument('--output', '-o', help="output file for a single input (default: standard output)")
+    parser.add_argument('--output-dir', help="directory for the outputs of several input files")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="files processed in parallel")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_intermixed_args(argv)
+    options = dict(cipher=args.cipher, encrypt=args.operation == 'encrypt', key=args.key, key2=args.key2,
+                   shift=args.shift, rails=args.rails)
+    try:
+        make_stream(**options)  # Reject missing or invalid keys before touching any file
+    except (ValueError, KeyError) as e:
+        parser.error(_describe(e))
+
+    if len(args.files) > 1 and not args.output_dir:
+        parser.error("--output-dir is required with several input files")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if len(args.files) <= 1 and not args.output_dir:
+        # One input (a file or standard input) to one output (a file or standard output)
+        name = args.files[0] if args.files else '<stdin>'
+        try:
+            with _open_text(args.files[0] if args.files else None, 'r') as src, \
+                    _open_text(args.output, 'w') as dst:
+                transform(src, dst, options)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"crypto: error: {name}: {_describe(e)}", file=sys.stderr)
+            return 1
+        return 0
+
+    outputs = [os.path.join(args.output_dir, os.path.basename(path)) for path in args.files]
+    seen = {}
+    for path, out in zip(args.files, outputs):
+        if out in seen:
+            parser.error(f"{seen[out]} and {path} would both be written to {out}")
+        seen[out] = path
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.jobs == 1:
+        errors = [process_file(path, out, options) for path, out in zip(args.files, outputs)]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            errors = list(pool.map(process_file, args.files, outputs, [options] * len(outputs),
+                                   chunksize=max(1, len(outputs) // (4 * args.jobs))))
+    errors = [e for e in errors if e]
+    for error in errors:
+        print(f"crypto: error: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+import unittest
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        return path
+
+    def read(self, path):
+        with open(path, encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def test_round_trip_with_jobs(self):
+        from crytography_machine import vigenere_cipher
+        paths = [self.write(f"m{i}.txt", f"Attack at dawn, message {i}!\n" * 50) for i in range(4)]
+        enc, dec = os.path.join(self.tmp.name, 'enc'), os.path.join(self.tmp.name, 'dec')
+        self.assertEqual(main(['encrypt', '-c', 'vigenere', '-k', 'LEMON', '-j', '2', '--output-dir', enc] + paths), 0)
+        self.assertEqual(self.read(os.path.join(enc, 'm0.txt')), vigenere_cipher(self.read(paths[0]), "LEMON"))
+        encrypted = [os.path.join(enc, os.path.basename(p)) for p in paths]
+        self.assertEqual(main(['decrypt', '-c', 'vigenere', '-k', 'LEMON', '--output-dir', dec] + encrypted), 0)
+        self.assertEqual(self.read(os.path.join(dec, 'm3.txt')), self.read(paths[3]).upper())
+
+    def test_errors_exit_nonzero(self):
+        good = self.write('good.txt', "HELLO WORLD")
+        bad = self.write('bad.txt', "HELLO, WORLD")  # ',' is not in a Playfair square
+        out = os.path.join(self.tmp.name, 'out')
+        self.assertEqual(main(['encrypt', '-c', 'playfair', '-k', 'KEY', '--output-dir', out, good, bad]), 1)
+        self.assertEqual(sorted(os.listdir(out)), ['good.txt'])  # No partial output for the failed file
+        os.makedirs(os.path.join(self.tmp.name, 'other'))
+        twin = self.write(os.path.join('other', 'good.txt'), "HELLO AGAIN")
+        with self.assertRaises(SystemExit):
+            main(['encrypt', '-c', 'playfair', '-k', 'KEY', '--output-dir', out, good, twin])  # Same output name
+        self.assertEqual(main(['encrypt', '-c', 'playfair', '-k', 'KEY', '-o', os.path.join(out, 'x'), good]), 0)
+        self.assertEqual(main(['encrypt', '-c', 'playfair', '-k', 'KEY', '-o', os.path.join(out, 'y'), bad]), 1)
+        self.assertEqual(sorted(os.listdir(out)), ['good.txt', 'x'])  # The failed -o output was not left behind
+        with self.assertRaises(SystemExit):
+            main(['encrypt', '-c', 'vigenere', good])  # Missing --key
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+from crytography_machine import NormalizedText, caesar_cipher, vigenere_cipher
+from numpy_backend import np
+
+# Relative frequencies of A-Z in English text
+ENGLISH_FREQUENCIES = [
+    0.08167, 0.01492, 0.02782, 0.04253, 0.12702, 0.02228, 0.02015, 0.06094, 0.06966,
+    0.00153, 0.00772, 0.04025, 0.02406, 0.06749, 0.07507, 0.01929, 0.00095, 0.05987,
+    0.06327, 0.09056, 0.02758, 0.00978, 0.02360, 0.00150, 0.01974, 0.00074,
+]
+ENGLISH_IC = 0.0667  # Index of coincidence of English; uniformly random letters give 1/26
+PARALLEL_THRESHOLD = 200_000  # Below this many letters a process pool costs more than it saves
+
+# Plain English prose used by the tests and as a fallback training text for n-gram tables
+ENGLISH_SAMPLE = """
+The old lighthouse stood at the edge of the harbour for more than a hundred years, and
+in all that time the keepers who lived there wrote down everything they saw. They wrote
+about the weather and the ships, about storms that came in from the west without warning,
+and about the long quiet evenings when nothing moved on the water at all. Most of the
+notebooks were lost when the town library burned, but a few of them were found many years
+later in a wooden chest under the stairs of the keeper's cottage. The people who read
+them were surprised to learn how much of the life of the town had passed through that
+small room at the top of the tower. There were notes about fishing boats that went out
+before dawn and came back late with their nets full, and about the children who climbed
+the rocks at low tide to look for crabs and shells. One keeper described a winter so cold
+that the harbour froze from one side to the other, and the men of the town walked across
+the ice to bring bread and coal to the families on the far shore. Another wrote about the
+night a great ship ran aground on the sandbank beyond the point, and how the whole town
+worked until morning to bring the passengers and the crew safely to land. The last keeper
+left the tower when the light was replaced by an automatic lamp, and he wrote in his final
+entry that he had never once felt alone, because the sea was always there, and the ships
+were always passing, and somewhere out in the dark there was always someone who needed
+the light to find their way home. Today the tower is a small museum, and visitors can
+climb the narrow stairs and stand in the room where the keepers worked, and read copies
+of the notebooks that survived, and look out at the same grey water that they watched for
+so many years.
+"""
+
+NON_LETTERS = re.compile(r'[^A-Z]+')
+
+
+def letters_only(text):
+    """Upper-cases text and drops everything that is not a letter A-Z."""
+    if isinstance(text, NormalizedText):
+        return text.letters
+    return NON_LETTERS.sub('', text.upper())
+
+
+def letter_counts(text):
+    """Counts the letters A-Z with one C-level str.count() scan per letter."""
+    return [text.count(c) for c in string.ascii_uppercase]
+
+
+def column_counts(letters, period):
+    """Letter counts of each column letters[j::period], in a single bincount pass when NumPy is available."""
+    if np is None:
+        return [letter_counts(letters[j::period]) for j in range(period)]
+    codes = np.frombuffer(letters.encode('ascii'), dtype=np.uint8).astype(np.int32) - 65
+    full = len(codes) - len(codes) % period
+    # Give column j its own block of 26 bins, then count every letter in one pass
+    offsets = np.arange(period, dtype=np.int32) * 26
+    bins = np.concatenate(((codes[:full].reshape(-1, period) + offsets).ravel(), codes[full:] + offsets[:len(codes) - full]))
+    return np.bincount(bins, minlength=26 * period).reshape(period, 26).tolist()
+
+
+def index_of_coincidence(counts):
+    """Probability that two letters drawn from a text with these letter counts are equal."""
+    total = sum(counts)
+    if total < 2:
+        return 0.0
+    return sum(n * (n - 1) for n in counts) / (total * (total - 1))
+
+
+def chi_squared_shifts(counts):
+    """Chi-squared distance from English after undoing each of the 26 possible shifts."""
+    total = sum(counts)
+    expected = [total * f for f in ENGLISH_FREQUENCIES]
+    return [
+        sum((counts[(i + shift) % 26] - expected[i]) ** 2 / expected[i] for i in range(26))
+        for shift in range(26)
+    ] if total else [0.0] * 26
+
+
+def kasiski_votes(letters, max_period, ngram=3, limit=20_000):
+    """Counts how often each period divides the distance between repeated n-grams.
+
+    Only the first limit letters are examined; that is plenty for the repeats to show.
+    """
+    votes = [0] * (max_period + 1)
+    sample = letters[:limit]
+    last_seen = {}
+    for i in range(len(sample) - ngram + 1):
+        gram = sample[i:i + ngram]
+        previous = last_seen.get(gram)
+        if previous is not None:
+            distance = i - previous
+            for period in range(2, max_period + 1):
+                if distance % period == 0:
+                    votes[period] += 1
+        last_seen[gram] = i
+    return votes
+
+
+def _best_key(counts_by_column):
+    """Picks the lowest chi-squared shift of every column; returns (key, total chi-squared per letter).
+
+    Per letter, not per column: a correctly decrypted column scores about its 25 degrees of
+    freedom whatever its length, so averaging over columns would favour noisy multiples of
+    the true period, whose short columns each fit English too easily.
+    """
+    key = []
+    total = 0.0
+    letters = 0
+    for counts in counts_by_column:
+        scores = chi_squared_shifts(counts)
+        shift = min(range(26), key=scores.__getitem__)
+        key.append(string.ascii_uppercase[shift])
+        total += scores[shift]
+        letters += sum(counts)
+    return ''.join(key), total / max(letters, 1)
+
+
+def analyse_period(letters, period):
+    """Statistics for one candidate period: (period, mean column IoC, best key, its mean chi-squared)."""
+    counts_by_column = column_counts(letters, period)
+    ic = sum(map(index_of_coincidence, counts_by_column)) / period
+    return (period, ic) + _best_key(counts_by_column)
+
+
+def solve_period(letters, period):
+    """Finds the best key of a given period; returns (key, mean chi-squared per column)."""
+    return _best_key(column_counts(letters, period))
+
+
+def _primitive_key(key):
+    """Reduces a key such as LEMONLEMON to the shortest key that repeats to it."""
+    for period in range(1, len(key) + 1):
+        if len(key) % period == 0 and key[:period] * (len(key) // period) == key:
+            return key[:period]
+    return key
+
+
+def _analyse_periods(letters, periods, processes):
+    if processes == 1 or len(letters) < PARALLEL_THRESHOLD:
+        return [analyse_period(letters, period) for period in periods]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(analyse_period, [letters] * len(periods), periods))
+
+
+def recover_vigenere_key(ciphertext, top_n=3, max_period=20, candidates=6, processes=None):
+    """Recovers the most likely Vigenère keys; returns up to top_n (key, score) pairs, lowest score first.
+
+    Every period up to max_period is analysed (column counts, index of coincidence and the
+    chi-squared best key), fanned out over a process pool for large ciphertexts. The keys
+    kept are those of the best periods by index of coincidence plus the best by Kasiski
+    examination.
+    """
+    letters = letters_only(ciphertext)
+    if not letters:
+        return []
+    max_period = max(1, min(max_period, len(letters) // 2))
+    votes = kasiski_votes(letters, max_period)
+    analyses = _analyse_periods(letters, range(1, max_period + 1), processes or os.cpu_count())
+
+    chosen = sorted(analyses, key=lambda entry: abs(entry[1] - ENGLISH_IC))[:candidates]
+    chosen += [entry for entry in sorted(analyses, key=lambda entry: -votes[entry[0]])[:2]
+               if votes[entry[0]] and entry not in chosen]
+    best = {}
+    for _, _, key, score in chosen:
+        key = _primitive_key(key)
+        if key not in best or score < best[key]:
+            best[key] = score
+    return sorted(best.items(), key=lambda item: item[1])[:top_n]
+
+
+def recover_caesar_shift(ciphertext, top_n=3):
+    """Ranks Caesar shifts by chi-squared; returns up to top_n (shift, score) pairs, best first."""
+    scores = chi_squared_shifts(letter_counts(letters_only(ciphertext)))
+    return sorted(enumerate(scores), key=lambda item: item[1])[:top_n]
+
+
+def crack_vigenere(ciphertext, **options):
+    """Returns (key, plaintext) for the best recovered Vigenère key, or None if there are no letters."""
+    keys = recover_vigenere_key(ciphertext, top_n=1, **options)
+    if not keys:
+        return None
+    key = keys[0][0]
+    return key, vigenere_cipher(ciphertext, key, encrypt=False)
+
+
+def crack_caesar(ciphertext):
+    """Returns (shift, plaintext) for the most likely Caesar shift."""
+    shift = recover_caesar_shift(ciphertext, top_n=1)[0][0]
+    return shift, caesar_cipher(ciphertext, shift, encrypt=False)
+
+
+import unittest
+
+
+class TestCryptanalysis(unittest.TestCase):
+    def test_index_of_coincidence(self):
+        self.assertAlmostEqual(index_of_coincidence(letter_counts(letters_only(ENGLISH_SAMPLE))), ENGLISH_IC, delta=0.01)
+        self.assertEqual(index_of_coincidence([1] * 26), 0.0)
+
+    def test_recover_caesar_shift(self):
+        ciphertext = caesar_cipher(ENGLISH_SAMPLE, 11)
+        self.assertEqual(recover_caesar_shift(ciphertext)[0][0], 11)
+        self.assertEqual(crack_caesar(ciphertext)[1], ENGLISH_SAMPLE.upper())
+
+    def test_recover_vigenere_key(self):
+        ciphertext = vigenere_cipher(ENGLISH_SAMPLE, "LIGHTHOUSE")
+        self.assertEqual(recover_vigenere_key(ciphertext, processes=1)[0][0], "LIGHTHOUSE")
+        self.assertEqual(crack_vigenere(vigenere_cipher(ENGLISH_SAMPLE, "LEMON"), processes=1),
+                         ("LEMON", ENGLISH_SAMPLE.upper()))
+
+    def test_recover_vigenere_key_from_short_text(self):
+        plain = letters_only(ENGLISH_SAMPLE)[:300]  # Too short for longer multiples of the key to look better
+        for key in ("KEY", "LEMON", "CRYPTO"):
+            self.assertEqual(crack_vigenere(vigenere_cipher(plain, key), processes=1), (key, plain))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,116 +1,408 @@
+import re
 import string
-from itertools import cycle
+import threading
+from array import array
+from collections import OrderedDict, deque
+from functools import cached_property, lru_cache
+from itertools import accumulate
+from math import isqrt
+
+LETTER_RUNS = re.compile(r'([^A-Z]+)')  # Splits upper-cased text into letter runs and the gaps between them
+NON_ASCII_RUNS = re.compile(r'([^\x00-\x7f]+)')
+LETTER_INDICES = bytes.maketrans(string.ascii_uppercase.encode(), bytes(range(26)))
+
+def symbol_index(abc):
+    """Maps each symbol of an alphabet to its position (first occurrence, like abc.index)."""
+    index = {}
+    for i, symbol in enumerate(abc):
+        index.setdefault(symbol, i)
+    return index
+
+class Alphabet:
+    """An ordered set of distinct symbols with O(1) symbol-to-index lookup, whatever its size or script.
+
+    Text is upper-cased before lookup only when the alphabet has upper-case symbols and no
+    lower-case ones (like A-Z), so mixed-case and non-Latin alphabets keep every character.
+    pad is the symbol the square ciphers insert between doubled letters and after an odd
+    last one: 'X' (or 'x') when the alphabet has it.
+    """
+    def __init__(self, symbols, fold_case=None, pad=None):
+        self.symbols = ''.join(symbols)
+        if not self.symbols:
+            raise ValueError("Alphabet must not be empty.")
+        self.index = symbol_index(self.symbols)
+        if len(self.index) != len(self.symbols):
+            raise ValueError("Alphabet symbols must be distinct.")
+        if fold_case is None:
+            fold_case = any(c.isupper() for c in self.symbols) and not any(c.islower() for c in self.symbols)
+        self.fold_case = fold_case
+        if pad is None:
+            pad = next((c for c in 'Xx' if c in self.index), None)
+        elif pad not in self.index:
+            raise ValueError(f"Padding symbol {pad!r} is not in the alphabet.")
+        self.pad = pad
+        self._tables = {}
+        self._runs = None
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def __getitem__(self, i):
+        return self.symbols[i]
+
+    def __eq__(self, other):
+        return isinstance(other, Alphabet) and self._identity() == other._identity()
+
+    def __hash__(self):
+        return hash(self._identity())
+
+    def _identity(self):
+        return self.symbols, self.fold_case, self.pad
+
+    def __repr__(self):
+        return f"Alphabet({self.symbols!r})"
+
+    def normalize(self, text):
+        return upper_text(text) if self.fold_case else text
+
+    def indices(self, text):
+        """Returns the index of every symbol of text (a key), rejecting symbols outside the alphabet."""
+        try:
+            return [self.index[c] for c in text]
+        except KeyError as e:
+            raise ValueError(f"Symbol {e.args[0]!r} is not in the alphabet.") from None
+
+    def shift_table(self, shift):
+        """Builds (once per shift) the str.translate table adding shift to every symbol."""
+        return self._table('shift', shift % len(self), lambda i: i + shift)
+
+    def reflect_table(self, k):
+        """Builds (once per key index) the str.translate table mapping each symbol t to k - t, as in Beaufort."""
+        return self._table('reflect', k, lambda i: k - i)
+
+    def _table(self, kind, k, position):
+        table = self._tables.get((kind, k))
+        if table is None:
+            n = len(self)
+            table = self._tables[kind, k] = {ord(c): self.symbols[position(i) % n] for i, c in enumerate(self.symbols)}
+        return table
+
+    @property
+    def runs(self):
+        """Regex splitting text into runs of alphabet symbols and the gaps between them."""
+        if self._runs is None:
+            self._runs = re.compile('([^' + ''.join(map(re.escape, self.symbols)) + ']+)')
+        return self._runs
+
+UPPERCASE = Alphabet(string.ascii_uppercase)
+SQUARE_LETTERS = Alphabet('ABCDEFGHIKLMNOPQRSTUVWXYZ')  # The classic 5x5 square, J merged into I
+PRINTABLE_ASCII = Alphabet(''.join(map(chr, range(0x20, 0x7f))))
+LATIN_1 = Alphabet(PRINTABLE_ASCII.symbols + ''.join(map(chr, range(0xa0, 0x100))))
+
+@lru_cache(maxsize=256)
+def as_alphabet(abc):
+    """Returns abc as an Alphabet, building (once per string) its index and tables."""
+    return abc if isinstance(abc, Alphabet) else Alphabet(abc)
+
+class AutokeyState:
+    """Resumable autokey engine with O(1) work per symbol and memory bounded by the key length.
+
+    The running key is a ring buffer holding the next len(key) key symbols as alphabet
+    indices. Every plaintext symbol is pushed on the right while the key symbol it is
+    combined with is popped from the left. running_key is the whole state: building a
+    new AutokeyState from it continues the stream exactly where this one stopped.
+    """
+    def __init__(self, key, abc=string.ascii_uppercase, encrypt=True):
+        if not key:
+            raise ValueError("Autokey key must not be empty.")
+        alphabet = as_alphabet(abc)
+        self.abc = alphabet.symbols
+        self.index = alphabet.index
+        missing = [k for k in key if k not in self.index]
+        if missing:
+            raise ValueError(f"Key symbol {missing[0]!r} is not in the alphabet.")
+        self.ring = deque(self.index[k] for k in key)
+        self.encrypt = encrypt
+
+    @property
+    def running_key(self):
+        return ''.join(self.abc[i] for i in self.ring)
+
+    def update(self, text):
+        abc, index, ring, size = self.abc, self.index, self.ring, len(self.abc)
+        push, pop = ring.append, ring.popleft
+        result = []
+        append = result.append
+        if self.encrypt:
+            for c in text:
+                i = index.get(c)
+                if i is None:
+                    append(c)
+                else:
+                    push(i)  # Plaintext feeds the key
+                    append(abc[(i + pop()) % size])
+        else:
+            for c in text:
+                i = index.get(c)
+                if i is None:
+                    append(c)
+                else:
+                    decoded = (i - pop()) % size
+                    push(decoded)
+                    append(abc[decoded])
+        return ''.join(result)
 
 class VigenereAutokeyCipher:
     def __init__(self, key, abc=string.ascii_uppercase):
-        self.key = key.upper()
-        self.abc = abc.upper()
+        self.alphabet = as_alphabet(abc)
+        self.abc = self.alphabet.symbols
+        self.key = self.alphabet.normalize(key)
+
+    def encoder(self):
+        """Returns a resumable AutokeyState for encoding a text piece by piece."""
+        return AutokeyState(self.key, self.alphabet, encrypt=True)
+
+    def decoder(self):
+        """Returns a resumable AutokeyState for decoding a text piece by piece."""
+        return AutokeyState(self.key, self.alphabet, encrypt=False)
 
     def encode(self, text):
-        result = []
-        key = self.key + ''.join([t for t in text.upper() if t in self.abc])
-        index = 0
-        for c in text.upper():
-            if c in self.abc:
-                offset = self.abc.index(key[index])
-                result.append(self.abc[(self.abc.index(c) + offset) % len(self.abc)])
-                index += 1
-            else:
-                result.append(c)
-        return ''.join(result)
+        return self.encoder().update(self.alphabet.normalize(text))
 
     def decode(self, text):
-        result = []
-        key = self.key
-        index = 0
-        for c in text.upper():
-            if c in self.abc:
-                offset = self.abc.index(key[index])
-                decoded = self.abc[(self.abc.index(c) - offset) % len(self.abc)]
-                result.append(decoded)
-                key += decoded
-                index += 1
-            else:
-                result.append(c)
-        return ''.join(result)
+        return self.decoder().update(self.alphabet.normalize(text))
 
-def caesar_cipher(text, shift, encrypt=True):
-    """Implements Caesar cipher for encryption and decryption."""
-    shift = shift if encrypt else -shift
+@lru_cache(maxsize=None)
+def caesar_table(shift):
+    """Builds (once per shift) the str.translate table for a Caesar shift."""
     alphabet = string.ascii_uppercase
+    shift %= 26  # Slicing alone would turn shifts beyond ±26 into no shift at all
     shifted_alphabet = alphabet[shift:] + alphabet[:shift]
-    table = str.maketrans(alphabet, shifted_alphabet)
-    return text.upper().translate(table)
+    return str.maketrans(alphabet, shifted_alphabet)
+
+@lru_cache(maxsize=None)
+def shift_table(shift):
+    """Builds (once per shift) a bytes.translate table adding shift to every letter A-Z."""
+    alphabet = string.ascii_uppercase
+    shift %= 26
+    return bytes.maketrans(alphabet.encode(), (alphabet[shift:] + alphabet[:shift]).encode())
+
+@lru_cache(maxsize=None)
+def beaufort_table(k):
+    """Builds (once per key letter) a bytes.translate table mapping each letter t to k - t."""
+    alphabet = string.ascii_uppercase
+    k = alphabet.index(k)
+    return bytes.maketrans(alphabet.encode(), ''.join(alphabet[(k - t) % 26] for t in range(26)).encode())
+
+def _key_tables(tables):
+    if not tables:
+        raise ValueError("key must contain at least one letter")  # An empty key would leave the text unchanged
+    return tables
+
+def vigenere_tables(key, encrypt=True, alphabet=None):
+    """Compiles a Vigenère key into one translation table per key letter."""
+    if alphabet is not None:
+        alphabet = as_alphabet(alphabet)
+        return _key_tables([alphabet.shift_table(k if encrypt else -k)
+                            for k in alphabet.indices(alphabet.normalize(key))])
+    alphabet = string.ascii_uppercase
+    return _key_tables([shift_table(alphabet.index(k) if encrypt else -alphabet.index(k)) for k in key.upper()])
+
+def beaufort_tables(key, alphabet=None):
+    """Compiles a Beaufort key into one translation table per key letter."""
+    if alphabet is not None:
+        alphabet = as_alphabet(alphabet)
+        key = alphabet.normalize(key)
+        return _key_tables([alphabet.reflect_table(k)
+                            for k in alphabet.indices(key if ' ' in alphabet else key.replace(' ', ''))])
+    return _key_tables([beaufort_table(k) for k in key.upper().replace(' ', '')])
+
+class NormalizedText(str):
+    """A message whose normalized forms are computed on first use and kept, so several ciphers share them.
+
+    It is the original text (a str), so every cipher accepts it; the ciphers below read the
+    cached forms instead of upper-casing, stripping and re-splitting the text on each call.
+    """
+    def __new__(cls, text=''):
+        return text if type(text) is cls else super().__new__(cls, text)
+
+    @cached_property
+    def upper_text(self):
+        return self.upper()
+
+    @cached_property
+    def parts(self):
+        """LETTER_RUNS.split() of the upper-cased text: letter runs at even indices, the gaps between them at odd ones."""
+        return LETTER_RUNS.split(self.upper_text)
+
+    @cached_property
+    def letters(self):
+        """The letters A-Z only, upper-cased."""
+        return ''.join(self.parts[::2]) if len(self.parts) > 1 else self.upper_text
+
+    @cached_property
+    def letter_bytes(self):
+        return self.letters.encode('ascii')
+
+    @cached_property
+    def indices(self):
+        """The letters as alphabet indices 0-25, one byte each."""
+        return self.letter_bytes.translate(LETTER_INDICES)
+
+    @cached_property
+    def gaps(self):
+        """Run-length list of the non-letters: (position in the upper-cased text, run) pairs."""
+        gaps, position = [], 0
+        for i, part in enumerate(self.parts):
+            if i % 2:
+                gaps.append((position, part))
+            position += len(part)
+        return gaps
+
+    def restore(self, letters):
+        """Puts the non-letters back around letters, a transformed copy of self.letters."""
+        return _splice(list(self.parts), letters, False) if len(self.parts) > 1 else letters
+
+    @cached_property
+    def no_spaces(self):
+        """Upper-cased without spaces, as the Beaufort cipher reads it."""
+        return self.upper_text.replace(' ', '')
+
+    @cached_property
+    def square(self):
+        """Upper-cased without spaces and with J merged into I, as the 5x5 square ciphers read it."""
+        return self.no_spaces.replace('J', 'I')
+
+    @cached_property
+    def word_chars(self):
+        """Upper-cased with every non-word character removed, as testing.py's Four-Square reads it."""
+        return re.sub(r'[\W]', '', self).upper()
+
+    @cached_property
+    def without_q(self):
+        """word_chars with Q dropped, for the 25-letter square that omits Q."""
+        return self.word_chars.replace('Q', '')
+
+def upper_text(text):
+    """Upper-cases text, reusing the cached copy of a NormalizedText."""
+    return text.upper_text if isinstance(text, NormalizedText) else text.upper()
+
+def translate_periodic(data, tables, offset=0):
+    """Translates byte i of data with tables[(offset + i) % len(tables)], one strided slice per table."""
+    period = len(tables)
+    buf = bytearray(data)
+    for j in range(min(period, len(buf))):
+        buf[j::period] = buf[j::period].translate(tables[(offset + j) % period])
+    return buf
+
+def translate_periodic_text(text, tables, offset=0):
+    """str counterpart of translate_periodic for alphabets beyond ASCII, one strided slice per table."""
+    period = len(tables)
+    chars = list(text)
+    for j in range(min(period, len(text))):
+        chars[j::period] = text[j::period].translate(tables[(offset + j) % period])
+    return ''.join(chars)
+
+def _splice(parts, translated, gaps_translated):
+    """Rebuilds text from re.split() parts, taking the even-indexed runs from translated."""
+    runs = parts if gaps_translated else parts[::2]
+    ends = list(accumulate(map(len, runs)))
+    pieces = list(map(translated.__getitem__, map(slice, [0] + ends[:-1], ends)))
+    join = translated[:0].join  # str or bytes alike
+    if gaps_translated:
+        pieces[1::2] = parts[1::2]
+        return join(pieces)
+    parts[::2] = pieces
+    return join(parts)
+
+def vigenere_translate(text, tables, offset=0):
+    """Applies compiled Vigenère tables to upper-cased text; returns (result, letters consumed)."""
+    parts = LETTER_RUNS.split(text)
+    letters = ''.join(parts[::2]) if len(parts) > 1 else text
+    if not letters:
+        return text, 0
+    translated = translate_periodic(letters.encode('ascii'), tables, offset).decode('ascii')
+    if len(parts) == 1:
+        return translated, len(letters)
+    return _splice(parts, translated, False), len(letters)
+
+def beaufort_translate(text, tables, offset=0):
+    """Applies compiled Beaufort tables to upper-cased, space-free text; the key advances on every character."""
+    if not text:
+        return text
+    if text.isascii():
+        return translate_periodic(text.encode('ascii'), tables, offset).decode('ascii')
+    # Every non-ASCII character becomes one '?' so key positions stay aligned, then is put back
+    translated = translate_periodic(text.encode('ascii', 'replace'), tables, offset).decode('ascii')
+    return _splice(NON_ASCII_RUNS.split(text), translated, True)
+
+def caesar_cipher(text, shift, encrypt=True, alphabet=None):
+    """Implements Caesar cipher for encryption and decryption."""
+    shift = shift if encrypt else -shift
+    if alphabet is not None:
+        alphabet = as_alphabet(alphabet)
+        return alphabet.normalize(text).translate(alphabet.shift_table(shift))
+    return upper_text(text).translate(caesar_table(shift))
 
 def rot13(text):
     """Special case of Caesar cipher with a shift of 13."""
     return caesar_cipher(text, 13)
 
-def vigenere_cipher(text, key, encrypt=True):
+def vigenere_cipher(text, key, encrypt=True, alphabet=None):
     """Implements Vigenère cipher for encryption and decryption."""
-    alphabet = string.ascii_uppercase
-
-    def compute_shift(c, encrypt):
-        return alphabet.index(c) if encrypt else -alphabet.index(c)
-
-    key_cycle = cycle(key.upper())
-    result = []
-    for char in text.upper():
-        if char in alphabet:
-            shift = compute_shift(next(key_cycle), encrypt)
-            result.append(alphabet[(alphabet.index(char) + shift) % 26])
-        else:
-            result.append(char)
-    return ''.join(result)
-
-def autokey_cipher(text, key, encrypt=True):
+    return _vigenere(text, vigenere_tables(key, encrypt, alphabet), alphabet and as_alphabet(alphabet))
+
+def _vigenere(text, tables, alphabet=None):
+    """Applies compiled Vigenère tables to the letters (or alphabet symbols) of text."""
+    if alphabet is None:
+        if isinstance(text, NormalizedText):
+            return text.restore(translate_periodic(text.letter_bytes, tables).decode('ascii'))
+        return vigenere_translate(text.upper(), tables)[0]
+    text = alphabet.normalize(text)
+    parts = alphabet.runs.split(text)
+    if len(parts) == 1:
+        return translate_periodic_text(text, tables)
+    return _splice(parts, translate_periodic_text(''.join(parts[::2]), tables), False)
+
+def autokey_cipher(text, key, encrypt=True, alphabet=None):
     """Implements Autokey cipher for encryption and decryption."""
-    text = text.upper()
-    key = key.upper()
-    alphabet = string.ascii_uppercase
-    result = []
-    full_key = key
+    alphabet = UPPERCASE if alphabet is None else as_alphabet(alphabet)
+    return AutokeyState(alphabet.normalize(key), alphabet, encrypt).update(alphabet.normalize(text))
 
-    if encrypt:
-        for char in text:
-            if char in alphabet:
-                offset = alphabet.index(full_key[0])
-                full_key += char  # Append plaintext progressively to key
-                result.append(alphabet[(alphabet.index(char) + offset) % 26])
-                full_key = full_key[1:]  # Remove used key character
-            else:
-                result.append(char)
-    else:
-        for char in text:
-            if char in alphabet:
-                offset = alphabet.index(full_key[0])
-                decoded_char = alphabet[(alphabet.index(char) - offset) % 26]
-                full_key += decoded_char  # Append decoded character to key
-                result.append(decoded_char)
-                full_key = full_key[1:]  # Remove used key character
-            else:
-                result.append(char)
-
-    return ''.join(result)
-
-def beaufort_cipher(text, key):
+def beaufort_cipher(text, key, alphabet=None):
     """Implements Beaufort cipher for symmetric encryption/decryption."""
-    alphabet = string.ascii_uppercase
-    text = text.upper().replace(' ', '')
-    key = key.upper().replace(' ', '')
-    key = (key * (len(text) // len(key) + 1))[:len(text)]
-    result = []
-
-    for t, k in zip(text, key):
-        if t in alphabet:
-            idx = (alphabet.index(k) - alphabet.index(t)) % 26
-            result.append(alphabet[idx])
-        else:
-            result.append(t)
-    return ''.join(result)
-
-def create_playfair_matrix(key):
-    """Creates a 5x5 matrix for Playfair cipher, merging J into I."""
+    return _beaufort(text, beaufort_tables(key, alphabet), alphabet and as_alphabet(alphabet))
+
+def _beaufort(text, tables, alphabet=None):
+    """Applies compiled Beaufort tables to text, dropping spaces unless the alphabet has them."""
+    if alphabet is None:
+        text = text.no_spaces if isinstance(text, NormalizedText) else text.upper().replace(' ', '')
+        return beaufort_translate(text, tables)
+    text = alphabet.normalize(text)
+    if ' ' not in alphabet:
+        text = text.replace(' ', '')
+    return translate_periodic_text(text, tables)
+
+def create_playfair_matrix(key, alphabet=None):
+    """Creates a 5x5 matrix for Playfair cipher, merging J into I.
+
+    With an alphabet of n * n symbols, builds an n x n matrix from it instead, keeping only key symbols in it.
+    """
+    if alphabet is not None:
+        alphabet = as_alphabet(alphabet)
+        size = isqrt(len(alphabet))
+        if size * size != len(alphabet):
+            raise ValueError("A key square needs an alphabet of n * n symbols.")
+        if alphabet.pad is None:
+            raise ValueError("A key square alphabet needs a padding symbol: include 'X' or pass pad= to Alphabet.")
+        matrix = ''.join(dict.fromkeys(c for c in _square_text(key, alphabet) + alphabet.symbols if c in alphabet))
+        return [matrix[i:i + size] for i in range(0, len(matrix), size)]
     alphabet = 'ABCDEFGHIKLMNOPQRSTUVWXYZ'
     key = key.upper().replace(' ', '').replace('J', 'I')
     matrix = ''
@@ -119,96 +411,142 @@ def create_playfair_matrix(key):
             matrix += char
     return [matrix[i:i+5] for i in range(0, 25, 5)]
 
-def playfair_cipher(text, key, encrypt=True):
-    """Implements Playfair cipher for encryption and decryption."""
-    matrix = create_playfair_matrix(key)
-    text = text.upper().replace(' ', '').replace('J', 'I')
+def _square_text(text, alphabet=None):
+    """Normalizes text for the square ciphers: no spaces, and upper case with J merged into I for the 5x5 square."""
+    if alphabet is None:
+        if isinstance(text, NormalizedText):
+            return text.square
+        return text.upper().replace(' ', '').replace('J', 'I')
+    text = alphabet.normalize(text)
+    return text if ' ' in alphabet else text.replace(' ', '')
+
+class PolybiusSquare:
+    """A compiled n x n key square (5x5 for the classic ciphers): letter positions plus lazily precomputed digraph tables."""
+    def __init__(self, matrix):
+        self.matrix = [''.join(row) for row in matrix]
+        self.positions = {}
+        for r, line in enumerate(self.matrix):
+            for c, char in enumerate(line):
+                self.positions.setdefault(char, (r, c))  # First occurrence wins, like a linear scan
+        self._playfair = {}
+
+    def playfair_digraphs(self, encrypt=True):
+        """Maps every digraph of the square to its Playfair encryption (or decryption)."""
+        if encrypt not in self._playfair:
+            matrix = self.matrix
+            size = len(matrix)
+            step = 1 if encrypt else -1
+            table = {}
+            for a, (row1, col1) in self.positions.items():
+                for b, (row2, col2) in self.positions.items():
+                    if row1 == row2:
+                        table[a + b] = matrix[row1][(col1 + step) % size] + matrix[row2][(col2 + step) % size]
+                    elif col1 == col2:
+                        table[a + b] = matrix[(row1 + step) % size][col1] + matrix[(row2 + step) % size][col2]
+                    else:
+                        table[a + b] = matrix[row1][col2] + matrix[row2][col1]
+            self._playfair[encrypt] = table
+        return self._playfair[encrypt]
+
+def square_digraphs(in1, in2, out1, out2):
+    """Maps every digraph ab, with a at in1[r1][c1] and b at in2[r2][c2], to out1[r1][c2] + out2[r2][c1].
+
+    This is the Two-Square (in = out = key squares) and Four-Square (plain squares on one side) rule.
+    """
+    return {a + b: out1.matrix[row1][col2] + out2.matrix[row2][col1]
+            for a, (row1, col1) in in1.positions.items()
+            for b, (row2, col2) in in2.positions.items()}
+
+@lru_cache(maxsize=256)
+def playfair_square(key, alphabet=None):
+    """Returns the compiled PolybiusSquare for a key, built once per key."""
+    return PolybiusSquare(create_playfair_matrix(key, alphabet))
+
+@lru_cache(maxsize=256)
+def two_square_digraphs(key1, key2, alphabet=None):
+    """Two-Square digraph table; the cipher is its own inverse, so it serves both directions."""
+    square1, square2 = playfair_square(key1, alphabet), playfair_square(key2, alphabet)
+    return square_digraphs(square1, square2, square1, square2)
+
+@lru_cache(maxsize=256)
+def four_square_digraphs(key1, key2, encrypt=True, alphabet=None):
+    """Four-Square digraph table for one direction."""
+    square1, square2 = playfair_square(key1, alphabet), playfair_square(key2, alphabet)
+    alphabet_square = playfair_square("", alphabet)  # Default alphabet matrix
+    if encrypt:
+        return square_digraphs(alphabet_square, alphabet_square, square1, square2)
+    return square_digraphs(square1, square2, alphabet_square, alphabet_square)
+
+def _even_digraphs(text, cipher_name):
+    """Splits text into consecutive digraphs, rejecting an odd number of letters."""
+    if len(text) % 2 != 0:
+        raise ValueError(f"{cipher_name} ciphertext must have an even number of letters.")
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+def _pad(alphabet):
+    """The padding symbol of the square ciphers: the alphabet's, or 'X' for the classic 5x5 square."""
+    return 'X' if alphabet is None else alphabet.pad
+
+def playfair_pairs(text, stop=None, pad='X'):
+    """Splits text into the digraphs starting before stop, separating doubled letters with pad.
+
+    A digraph may take its second letter from text[stop]; a lone final letter is padded with pad.
+    """
+    stop = len(text) if stop is None else stop
     pairs = []
     i = 0
-    while i < len(text):
+    while i < stop:
         a = text[i]
-        b = text[i + 1] if i + 1 < len(text) else 'X'
+        b = text[i + 1] if i + 1 < len(text) else pad
         if a == b:
-            pairs.append((a, 'X'))
+            pairs.append(a + pad)
             i += 1
         else:
-            pairs.append((a, b))
+            pairs.append(a + b)
             i += 2
+    return pairs
 
-    result = []
-    for a, b in pairs:
-        row1, col1 = next((r, c) for r, line in enumerate(matrix) for c, char in enumerate(line) if char == a)
-        row2, col2 = next((r, c) for r, line in enumerate(matrix) for c, char in enumerate(line) if char == b)
-
-        if row1 == row2:
-            col1 = (col1 + 1) % 5 if encrypt else (col1 - 1) % 5
-            col2 = (col2 + 1) % 5 if encrypt else (col2 - 1) % 5
-        elif col1 == col2:
-            row1 = (row1 + 1) % 5 if encrypt else (row1 - 1) % 5
-            row2 = (row2 + 1) % 5 if encrypt else (row2 - 1) % 5
-        else:
-            col1, col2 = col2, col1
+def playfair_cipher(text, key, encrypt=True, alphabet=None):
+    """Implements Playfair cipher for encryption and decryption."""
+    digraphs = playfair_square(key, alphabet).playfair_digraphs(encrypt)
+    return _playfair(text, digraphs, encrypt, alphabet and as_alphabet(alphabet))
 
-        result.append(matrix[row1][col1])
-        result.append(matrix[row2][col2])
+def _playfair(text, digraphs, encrypt=True, alphabet=None):
+    """Applies a compiled Playfair digraph table to text."""
+    text = _square_text(text, alphabet)
+    pairs = playfair_pairs(text, pad=_pad(alphabet))
 
-    decrypted_text = ''.join(result)
-    if not encrypt and decrypted_text.endswith('X'):
+    decrypted_text = ''.join([digraphs[pair] for pair in pairs])
+    if not encrypt and decrypted_text.endswith(_pad(alphabet)):
         decrypted_text = decrypted_text[:-1]
 
     return decrypted_text
 
-def two_square_cipher_encrypt(text, key1, key2):
+def two_square_cipher_encrypt(text, key1, key2, alphabet=None):
     """Encrypt using the Two-Square cipher."""
-    alphabet = 'ABCDEFGHIKLMNOPQRSTUVWXYZ'
-    key1_matrix = create_playfair_matrix(key1)
-    key2_matrix = create_playfair_matrix(key2)
+    return _two_square_encrypt(text, two_square_digraphs(key1, key2, alphabet), alphabet and as_alphabet(alphabet))
 
-    text = text.upper().replace(' ', '').replace('J', 'I')
-    pairs = []
-    i = 0
-    while i < len(text):
-        a = text[i]
-        b = text[i + 1] if i + 1 < len(text) else 'X'
-        if a == b:
-            pairs.append((a, 'X'))
-            i += 1
-        else:
-            pairs.append((a, b))
-            i += 2
+def _two_square_encrypt(text, digraphs, alphabet=None):
+    text = _square_text(text, alphabet)
+    pairs = playfair_pairs(text, pad=_pad(alphabet))
 
-    result = []
-    for a, b in pairs:
-        row1, col1 = next((r, c) for r, line in enumerate(key1_matrix) for c, char in enumerate(line) if char == a)
-        row2, col2 = next((r, c) for r, line in enumerate(key2_matrix) for c, char in enumerate(line) if char == b)
+    return ''.join([digraphs[pair] for pair in pairs])
 
-        result.append(key1_matrix[row1][col2])
-        result.append(key2_matrix[row2][col1])
-
-    return ''.join(result)
-
-def two_square_cipher_decrypt(text, key1, key2):
+def two_square_cipher_decrypt(text, key1, key2, alphabet=None):
     """Decrypt using the Two-Square cipher."""
-    key1_matrix = create_playfair_matrix(key1)
-    key2_matrix = create_playfair_matrix(key2)
-
-    text = text.upper().replace(" ", "").replace("J", "I")
-    pairs = [(text[i], text[i + 1]) for i in range(0, len(text), 2)]
-
-    result = []
-    for a, b in pairs:
-        row1, col1 = next((r, c) for r, row in enumerate(key1_matrix) for c, val in enumerate(row) if val == a)
-        row2, col2 = next((r, c) for r, row in enumerate(key2_matrix) for c, val in enumerate(row) if val == b)
+    return _two_square_decrypt(text, two_square_digraphs(key1, key2, alphabet), alphabet and as_alphabet(alphabet))
 
-        result.append(key1_matrix[row1][col2])
-        result.append(key2_matrix[row2][col1])
+def _two_square_decrypt(text, digraphs, alphabet=None):
+    text = _square_text(text, alphabet)
+    pairs = _even_digraphs(text, "Two-Square")
 
     # Remove intercalated 'X' padding only if the character before and after the 'X' make sense together
-    plaintext = ''.join(result)
-    if 'X' in plaintext:
+    plaintext = ''.join([digraphs[pair] for pair in pairs])
+    pad = _pad(alphabet)
+    if pad in plaintext:
         fixed_plaintext = []
         for i, char in enumerate(plaintext):
-            if char == 'X' and i > 0 and i < len(plaintext) - 1:
+            if char == pad and i > 0 and i < len(plaintext) - 1:
                 # Avoid the 'X' if the adjacent characters can form a valid pair
                 if plaintext[i - 1] == plaintext[i + 1]:
                     continue
@@ -218,111 +556,455 @@ def two_square_cipher_decrypt(text, key1, key2):
     return plaintext
 
 
-def four_square_cipher_encrypt(text, key1, key2):
+def four_square_cipher_encrypt(text, key1, key2, alphabet=None):
     """Encrypt using the Four-Square cipher."""
-    key1_matrix = create_playfair_matrix(key1)
-    key2_matrix = create_playfair_matrix(key2)
-    alphabet_matrix = create_playfair_matrix("")  # Default alphabet matrix
+    return _four_square_encrypt(text, four_square_digraphs(key1, key2, True, alphabet), alphabet and as_alphabet(alphabet))
 
-    text = text.upper().replace(" ", "").replace("J", "I")
-    if len(text) % 2 != 0:
-        text += "X"  # Padding for odd length
-
-    result = []
-    for i in range(0, len(text), 2):
-        char1, char2 = text[i], text[i + 1]
-        row1, col1 = next((r, c) for r, row in enumerate(alphabet_matrix) for c, val in enumerate(row) if val == char1)
-        row2, col2 = next((r, c) for r, row in enumerate(alphabet_matrix) for c, val in enumerate(row) if val == char2)
 
-        # Encrypt: Swap rows and columns
-        result.append(key1_matrix[row1][col2])
-        result.append(key2_matrix[row2][col1])
+def _four_square_encrypt(text, digraphs, alphabet=None):
+    text = _square_text(text, alphabet)
+    if len(text) % 2 != 0:
+        text += _pad(alphabet)  # Padding for odd length
 
-    return "".join(result)
+    return "".join([digraphs[pair] for pair in _even_digraphs(text, "Four-Square")])
 
 
-def four_square_cipher_decrypt(text, key1, key2):
+def four_square_cipher_decrypt(text, key1, key2, alphabet=None):
     """Decrypt using the Four-Square cipher."""
-    key1_matrix = create_playfair_matrix(key1)
-    key2_matrix = create_playfair_matrix(key2)
-    alphabet_matrix = create_playfair_matrix("")  # Default alphabet matrix
+    return _four_square_decrypt(text, four_square_digraphs(key1, key2, False, alphabet), alphabet and as_alphabet(alphabet))
 
-    text = text.upper().replace(" ", "").replace("J", "I")
-    result = []
 
-    for i in range(0, len(text), 2):
-        char1, char2 = text[i], text[i + 1]
-        row1, col1 = next((r, c) for r, row in enumerate(key1_matrix) for c, val in enumerate(row) if val == char1)
-        row2, col2 = next((r, c) for r, row in enumerate(key2_matrix) for c, val in enumerate(row) if val == char2)
-
-        # Decrypt: Swap rows and columns back
-        result.append(alphabet_matrix[row1][col2])
-        result.append(alphabet_matrix[row2][col1])
-
-    plaintext = "".join(result)
+def _four_square_decrypt(text, digraphs, alphabet=None):
+    text = _square_text(text, alphabet)
+    plaintext = "".join([digraphs[pair] for pair in _even_digraphs(text, "Four-Square")])
 
     # Remove padding 'X' only if it was artificially added
-    if plaintext.endswith("X"):
+    if plaintext.endswith(_pad(alphabet)):
         plaintext = plaintext[:-1]
 
     return plaintext
 
 
+RAIL_FENCE_CACHE_LENGTH = 1 << 16  # Longer permutations (8 bytes per character) are rebuilt, not kept
+
+def rail_fence_permutation(length, num_rails, encrypt=True):
+    """Computes the zigzag permutation for a message length, cached for repeated record sizes.
+
+    Encryption gets order, with ciphertext[j] = text[order[j]]; decryption gets its inverse, with
+    text[i] = ciphertext[inverse[i]], which is only built when asked for.
+    Rail r holds positions r, cycle - r, cycle + r, 2 * cycle - r, ... with cycle = 2 * (num_rails - 1).
+    Only lengths up to RAIL_FENCE_CACHE_LENGTH are cached, so the cache stays under 32 MiB.
+    """
+    if length > RAIL_FENCE_CACHE_LENGTH:
+        return _rail_fence_permutation(length, num_rails, encrypt)
+    return _cached_rail_fence_permutation(length, num_rails, encrypt)
+
+def _rail_fence_permutation(length, num_rails, encrypt=True):
+    if not encrypt:
+        inverse = array('q', bytes(8 * length))
+        for j, i in enumerate(rail_fence_permutation(length, num_rails)):
+            inverse[i] = j
+        return inverse
+    cycle = 2 * (num_rails - 1)
+    order = array('q')
+    for row in range(num_rails):
+        down = range(row, length, cycle)
+        if row == 0 or row == num_rails - 1:
+            order.extend(down)
+            continue
+        up = range(cycle - row, length, cycle)
+        merged = [0] * (len(down) + len(up))
+        merged[::2] = down
+        merged[1::2] = up
+        order.extend(merged)
+    return order
+
+_cached_rail_fence_permutation = lru_cache(maxsize=64)(_rail_fence_permutation)
+
 def rail_fence_cipher(text, num_rails, encrypt=True):
     """Encrypt or decrypt using Rail Fence cipher."""
     if num_rails <= 1:
         return text  # No encryption if rails are 1 or less
 
-    if encrypt:
-        # Create an empty array for rails
-        rails = [''] * num_rails
-        direction_down = False
-        row = 0
+    return ''.join(map(text.__getitem__, rail_fence_permutation(len(text), num_rails, encrypt)))
+
+class CaesarCipher:
+    """Caesar cipher with the translation tables of both directions built at construction."""
+    def __init__(self, shift, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        if self.alphabet is None:
+            self.tables = caesar_table(shift), caesar_table(-shift)
+        else:
+            self.tables = self.alphabet.shift_table(shift), self.alphabet.shift_table(-shift)
+
+    def _normalize(self, text):
+        return upper_text(text) if self.alphabet is None else self.alphabet.normalize(text)
+
+    def encode(self, text):
+        return self._normalize(text).translate(self.tables[0])
+
+    def decode(self, text):
+        return self._normalize(text).translate(self.tables[1])
+
+class VigenereCipher:
+    """Vigenère cipher with the shift tables of both directions built at construction."""
+    def __init__(self, key, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        self.tables = vigenere_tables(key, True, self.alphabet), vigenere_tables(key, False, self.alphabet)
+
+    def encode(self, text):
+        return _vigenere(text, self.tables[0], self.alphabet)
+
+    def decode(self, text):
+        return _vigenere(text, self.tables[1], self.alphabet)
+
+class BeaufortCipher:
+    """Beaufort cipher with its reflection tables built at construction; decode is encode."""
+    def __init__(self, key, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        self.tables = beaufort_tables(key, self.alphabet)
+
+    def encode(self, text):
+        return _beaufort(text, self.tables, self.alphabet)
+
+    decode = encode
 
-        # Fill the rails in a zigzag manner
+def _key_square(key, alphabet):
+    return PolybiusSquare(create_playfair_matrix(key, alphabet))
+
+class PlayfairCipher:
+    """Playfair cipher with its key square (matrix and letter positions) and both digraph tables built at construction."""
+    def __init__(self, key, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        self.square = _key_square(key, self.alphabet)
+        self.digraphs = self.square.playfair_digraphs(True), self.square.playfair_digraphs(False)
+
+    def encode(self, text):
+        return _playfair(text, self.digraphs[0], True, self.alphabet)
+
+    def decode(self, text):
+        return _playfair(text, self.digraphs[1], False, self.alphabet)
+
+class TwoSquareCipher:
+    """Two-Square cipher with its key squares and digraph table built at construction."""
+    def __init__(self, key1, key2, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        self.squares = _key_square(key1, self.alphabet), _key_square(key2, self.alphabet)
+        self.digraphs = square_digraphs(*self.squares, *self.squares)
+
+    def encode(self, text):
+        return _two_square_encrypt(text, self.digraphs, self.alphabet)
+
+    def decode(self, text):
+        return _two_square_decrypt(text, self.digraphs, self.alphabet)
+
+class FourSquareCipher:
+    """Four-Square cipher with its key squares and the digraph tables of both directions built at construction."""
+    def __init__(self, key1, key2, abc=None):
+        self.alphabet = None if abc is None else as_alphabet(abc)
+        self.squares = _key_square(key1, self.alphabet), _key_square(key2, self.alphabet)
+        plain = _key_square("", self.alphabet)
+        self.digraphs = square_digraphs(plain, plain, *self.squares), square_digraphs(*self.squares, plain, plain)
+
+    def encode(self, text):
+        return _four_square_encrypt(text, self.digraphs[0], self.alphabet)
+
+    def decode(self, text):
+        return _four_square_decrypt(text, self.digraphs[1], self.alphabet)
+
+class RailFenceCipher:
+    """Rail Fence cipher; its permutations depend on the message length and are cached by rail_fence_permutation."""
+    def __init__(self, num_rails):
+        self.num_rails = num_rails
+
+    def encode(self, text):
+        return rail_fence_cipher(text, self.num_rails, True)
+
+    def decode(self, text):
+        return rail_fence_cipher(text, self.num_rails, False)
+
+CIPHER_CLASSES = {
+    'caesar': CaesarCipher, 'rot13': CaesarCipher, 'vigenere': VigenereCipher, 'autokey': VigenereAutokeyCipher,
+    'beaufort': BeaufortCipher, 'playfair': PlayfairCipher, 'two-square': TwoSquareCipher,
+    'four-square': FourSquareCipher, 'rail-fence': RailFenceCipher,
+}
+
+def build_cipher(name, key=None, alphabet=None):
+    """Builds the cipher object for a cipher name, e.g. build_cipher('two-square', ('EXAMPLE', 'KEYWORD')).
+
+    key is the shift for Caesar, the number of rails for Rail Fence and a (key1, key2) pair for
+    Two-Square and Four-Square; ROT13 takes none, and Rail Fence ignores the alphabet.
+    """
+    cls = CIPHER_CLASSES.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown cipher: {name}")
+    if name == 'rail-fence':
+        return cls(key)
+    if name == 'autokey' and alphabet is None:
+        return cls(key)
+    keys = tuple(key) if name in ('two-square', 'four-square') else (13 if name == 'rot13' else key,)
+    return cls(*keys, alphabet)
+
+class CipherCache:
+    """Thread-safe LRU cache of cipher objects keyed by cipher name, key and alphabet.
+
+    stats counts hits, misses and evictions; at most maxsize ciphers are kept, the least
+    recently used one going first.
+    """
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("The cache must hold at least one cipher.")
+        self.maxsize = maxsize
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._ciphers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ciphers)
+
+    def get(self, name, key=None, alphabet=None):
+        """Returns the cipher object for name, key and alphabet, building it on a miss."""
+        cache_key = (name, key, alphabet)
+        with self._lock:
+            cipher = self._ciphers.get(cache_key)
+            if cipher is not None:
+                self._ciphers.move_to_end(cache_key)
+                self.stats['hits'] += 1
+                return cipher
+        built = build_cipher(name, key, alphabet)  # Outside the lock, so hits on other keys are not held up
+        with self._lock:
+            cipher = self._ciphers.setdefault(cache_key, built)
+            # Only the thread whose object went in had a miss; one that lost the race to build it had a hit
+            self.stats['misses' if cipher is built else 'hits'] += 1
+            self._ciphers.move_to_end(cache_key)
+            while len(self._ciphers) > self.maxsize:
+                self._ciphers.popitem(last=False)
+                self.stats['evictions'] += 1
+        return cipher
+
+    def clear(self):
+        """Drops every cached cipher and resets stats."""
+        with self._lock:
+            self._ciphers.clear()
+            self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+CIPHER_CACHE = CipherCache()
+
+def get_cipher(name, key=None, alphabet=None):
+    """Returns the cipher object for name, key and alphabet from the shared CIPHER_CACHE."""
+    return CIPHER_CACHE.get(name, key, alphabet)
+
+class CaesarStream:
+    """Incremental Caesar cipher: feed chunks to update(), then call finalize()."""
+    def __init__(self, shift, encrypt=True):
+        self.table = caesar_table(shift if encrypt else -shift)
+
+    def update(self, chunk):
+        return chunk.upper().translate(self.table)
+
+    def finalize(self):
+        return ''
+
+class VigenereStream:
+    """Incremental Vigenère cipher that keeps the key position across chunks."""
+    def __init__(self, key, encrypt=True):
+        self.tables = vigenere_tables(key, encrypt)
+        self.position = 0
+
+    def update(self, chunk):
+        out, consumed = vigenere_translate(chunk.upper(), self.tables, self.position)
+        if consumed:
+            self.position = (self.position + consumed) % len(self.tables)
+        return out
+
+    def finalize(self):
+        return ''
+
+class AutokeyStream:
+    """Incremental Autokey cipher that carries the running key across chunks."""
+    def __init__(self, key, encrypt=True):
+        self.state = AutokeyState(key.upper(), encrypt=encrypt)
+
+    def update(self, chunk):
+        return self.state.update(chunk.upper())
+
+    def finalize(self):
+        return ''
+
+class BeaufortStream:
+    """Incremental Beaufort cipher; the key advances on every non-space character."""
+    def __init__(self, key):
+        self.tables = beaufort_tables(key)
+        self.position = 0
+
+    def update(self, chunk):
+        text = chunk.upper().replace(' ', '')
+        out = beaufort_translate(text, self.tables, self.position)
+        if text:
+            self.position = (self.position + len(text)) % len(self.tables)
+        return out
+
+    def finalize(self):
+        return ''
+
+class _PlayfairPairs:
+    """Splits a letter stream into Playfair digraphs, inserting 'X' between doubled letters."""
+    def __init__(self):
+        self.pending = None
+
+    def feed(self, text):
+        pairs = []
+        pending = self.pending
         for char in text:
-            rails[row] += char
-            if row == 0 or row == num_rails - 1:
-                direction_down = not direction_down
-            row += 1 if direction_down else -1
-
-        return ''.join(rails)
-
-    else:
-        # Decrypt
-        length = len(text)
-        rail_lengths = [0] * num_rails
-        direction_down = False
-        row = 0
-
-        # Calculate the length of each rail
-        for _ in range(length):
-            rail_lengths[row] += 1
-            if row == 0 or row == num_rails - 1:
-                direction_down = not direction_down
-            row += 1 if direction_down else -1
-
-        # Fill the rails with ciphertext
-        rails = []
-        index = 0
-        for rail_length in rail_lengths:
-            rails.append(text[index:index + rail_length])
-            index += rail_length
-
-        # Read the plaintext in zigzag order
-        plaintext = ''
-        row = 0
-        direction_down = False
-        rail_indices = [0] * num_rails
-
-        for _ in range(length):
-            plaintext += rails[row][rail_indices[row]]
-            rail_indices[row] += 1
-            if row == 0 or row == num_rails - 1:
-                direction_down = not direction_down
-            row += 1 if direction_down else -1
-
-        return plaintext
+            if pending is None:
+                pending = char
+            elif pending == char:
+                pairs.append(pending + 'X')
+            else:
+                pairs.append(pending + char)
+                pending = None
+        self.pending = pending
+        return pairs
+
+    def flush(self):
+        if self.pending is None:
+            return []
+        pairs = [self.pending + 'X']
+        self.pending = None
+        return pairs
+
+class _FixedPairs:
+    """Splits a letter stream into consecutive digraphs without any padding rules."""
+    def __init__(self):
+        self.pending = ''
+
+    def feed(self, text):
+        text = self.pending + text
+        end = len(text) - len(text) % 2
+        self.pending = text[end:]
+        return [text[i:i + 2] for i in range(0, end, 2)]
+
+class PlayfairStream:
+    """Incremental Playfair cipher; a digraph split across chunks is completed on the next update()."""
+    def __init__(self, key, encrypt=True):
+        self.digraphs = playfair_square(key).playfair_digraphs(encrypt)
+        self.encrypt = encrypt
+        self.pairs = _PlayfairPairs()
+        self.held = ''  # Last decrypted letter, kept back in case it is the trailing 'X'
+
+    def update(self, chunk):
+        text = chunk.upper().replace(' ', '').replace('J', 'I')
+        out = ''.join(map(self.digraphs.__getitem__, self.pairs.feed(text)))
+        if self.encrypt or not out:
+            return out
+        out, self.held = self.held + out[:-1], out[-1]
+        return out
+
+    def finalize(self):
+        out = self.held + ''.join(map(self.digraphs.__getitem__, self.pairs.flush()))
+        self.held = ''
+        if not self.encrypt and out.endswith('X'):
+            out = out[:-1]
+        return out
+
+class TwoSquareStream:
+    """Incremental Two-Square cipher for encryption (encrypt=True) or decryption."""
+    def __init__(self, key1, key2, encrypt=True):
+        self.digraphs = two_square_digraphs(key1, key2)
+        self.encrypt = encrypt
+        self.pairs = _PlayfairPairs() if encrypt else _FixedPairs()
+        # Decryption drops an 'X' whose neighbours are equal, so it needs one letter of look-behind and look-ahead
+        self.previous = None
+        self.current = None
+
+    def _remove_padding(self, plaintext):
+        result = []
+        previous, current = self.previous, self.current
+        for char in plaintext:
+            if current is not None:
+                if not (current == 'X' and previous is not None and previous == char):
+                    result.append(current)
+                previous = current
+            current = char
+        self.previous, self.current = previous, current
+        return ''.join(result)
+
+    def update(self, chunk):
+        text = chunk.upper().replace(' ', '').replace('J', 'I')
+        out = ''.join(map(self.digraphs.__getitem__, self.pairs.feed(text)))
+        return out if self.encrypt else self._remove_padding(out)
+
+    def finalize(self):
+        if self.encrypt:
+            return ''.join(map(self.digraphs.__getitem__, self.pairs.flush()))
+        if self.pairs.pending:
+            raise ValueError("Two-Square ciphertext must have an even number of letters.")
+        out = self.current or ''
+        self.previous = self.current = None
+        return out
+
+class FourSquareStream:
+    """Incremental Four-Square cipher for encryption (encrypt=True) or decryption."""
+    def __init__(self, key1, key2, encrypt=True):
+        self.digraphs = four_square_digraphs(key1, key2, encrypt)
+        self.encrypt = encrypt
+        self.pairs = _FixedPairs()
+        self.held = ''
+
+    def update(self, chunk):
+        text = chunk.upper().replace(" ", "").replace("J", "I")
+        out = "".join(map(self.digraphs.__getitem__, self.pairs.feed(text)))
+        if self.encrypt or not out:
+            return out
+        out, self.held = self.held + out[:-1], out[-1]
+        return out
+
+    def finalize(self):
+        if self.encrypt:
+            pending = self.pairs.pending
+            self.pairs.pending = ''
+            return self.digraphs[pending + "X"] if pending else ""  # Padding for odd length
+        if self.pairs.pending:
+            raise ValueError("Four-Square ciphertext must have an even number of letters.")
+        out, self.held = self.held, ''
+        if out.endswith("X"):
+            out = out[:-1]
+        return out
+
+class RailFenceStream:
+    """Incremental Rail Fence cipher.
+
+    Rail Fence is a whole-message transposition: the first output rail depends on
+    the last input character, so the rails are accumulated and emitted by finalize().
+    """
+    def __init__(self, num_rails, encrypt=True):
+        self.num_rails = num_rails
+        self.encrypt = encrypt
+        self.chunks = []
+
+    def update(self, chunk):
+        if self.num_rails <= 1:
+            return chunk  # No encryption if rails are 1 or less
+        self.chunks.append(chunk)
+        return ''
+
+    def finalize(self):
+        text = ''.join(self.chunks)
+        self.chunks = []
+        if self.num_rails <= 1:
+            return ''
+        return rail_fence_cipher(text, self.num_rails, self.encrypt)
+
+def stream_chunks(stream, chunks):
+    """Runs an iterable of text chunks through a cipher stream, yielding output as it becomes available."""
+    for chunk in chunks:
+        out = stream.update(chunk)
+        if out:
+            yield out
+    out = stream.finalize()
+    if out:
+        yield out
 
 def menu():
     """Displays the main menu for cipher selection."""
@@ -437,6 +1119,7 @@ class TestCryptographyMachine(unittest.TestCase):
     def test_caesar_cipher(self):
         self.assertEqual(caesar_cipher("HELLO", 3, encrypt=True), "KHOOR")
         self.assertEqual(caesar_cipher("KHOOR", 3, encrypt=False), "HELLO")
+        self.assertEqual(caesar_cipher("HELLO", 29), "KHOOR")
 
     def test_rot13(self):
         self.assertEqual(rot13("HELLO"), "URYYB")
@@ -451,6 +1134,75 @@ class TestCryptographyMachine(unittest.TestCase):
         # self.assertEqual(autokey_cipher("JVJAH", "KEY", encrypt=False), "HELLO")
         pass
 
+    def test_vigenere_cipher_keeps_punctuation(self):
+        self.assertEqual(vigenere_cipher("Attack at dawn!", "LEMON"), "LXFOPV EF RNHR!")
+        self.assertEqual(vigenere_cipher("LXFOPV EF RNHR!", "LEMON", encrypt=False), "ATTACK AT DAWN!")
+
+    def test_empty_key_is_rejected(self):
+        for transform in (lambda: vigenere_cipher("HELLO", ""), lambda: beaufort_cipher("HELLO", " "),
+                          lambda: VigenereStream("")):
+            with self.assertRaises(ValueError):
+                transform()
+
+    def test_autokey_state_resumes(self):
+        text = "ATTACK AT DAWN, RETREAT AT DUSK"
+        state = AutokeyState("QUEENLY")
+        head = state.update(text[:10])
+        resumed = AutokeyState(state.running_key)
+        self.assertEqual(head + resumed.update(text[10:]), autokey_cipher(text, "QUEENLY"))
+        self.assertEqual(autokey_cipher("ATTACKATDAWN", "QUEENLY"), "QNXEPVYTWTWP")
+        self.assertEqual(VigenereAutokeyCipher("QUEENLY").decode("QNXEPVYTWTWP"), "ATTACKATDAWN")
+
+    def test_alphabets(self):
+        with self.assertRaises(ValueError):
+            Alphabet("ABCA")
+        self.assertEqual(caesar_cipher("Hello, world!", 3, alphabet=UPPERCASE), caesar_cipher("Hello, world!", 3))
+        self.assertEqual(vigenere_cipher("Attack at dawn!", "LEMON", alphabet=string.ascii_uppercase), "LXFOPV EF RNHR!")
+        text = "Mixed Case, ünïcödé & digits 42 ~ Ωμέγα"
+        for alphabet in (PRINTABLE_ASCII, LATIN_1, Alphabet(LATIN_1.symbols + "ΩΑμέγα")):
+            encrypted = vigenere_cipher(text, "Key 9", alphabet=alphabet)
+            self.assertEqual(vigenere_cipher(encrypted, "Key 9", encrypt=False, alphabet=alphabet), text)
+            self.assertEqual(beaufort_cipher(beaufort_cipher(text, "Key", alphabet), "Key", alphabet), text)
+            self.assertEqual(caesar_cipher(caesar_cipher(text, 7, alphabet=alphabet), 7, False, alphabet), text)
+            self.assertEqual(autokey_cipher(autokey_cipher(text, "Key", alphabet=alphabet), "Key", False, alphabet), text)
+        greek = "αβγδεζηθικλμνξοπρστυφχψω"
+        cipher = VigenereAutokeyCipher("λογια", greek)
+        self.assertEqual(cipher.decode(cipher.encode("καλημερα κοσμε")), "καλημερα κοσμε")
+        six = string.ascii_uppercase + string.digits
+        encrypted = playfair_cipher("Meet at 1900 by gate 7", "SECRET 42", alphabet=six)
+        self.assertEqual(len(create_playfair_matrix("SECRET 42", six)), 6)
+        self.assertEqual(playfair_cipher(encrypted, "SECRET 42", False, six), "MEETAT190X0BYGATE7")  # X separates the doubled 0
+        lower = "abcdefghiklmnopqrstuvwyz0"  # No 'x': the padding symbol has to be chosen
+        with self.assertRaises(ValueError):
+            playfair_cipher("hello", "key", alphabet=lower)
+        zero = Alphabet(lower, pad='0')
+        self.assertEqual(playfair_cipher(playfair_cipher("hello", "key", alphabet=zero), "key", False, zero), "hel0lo")
+        self.assertEqual(two_square_cipher_decrypt(two_square_cipher_encrypt("hello", "key", "other", zero),
+                                                   "key", "other", zero), "hello")
+        self.assertEqual(four_square_cipher_decrypt(four_square_cipher_encrypt("hello", "key", "other", zero),
+                                                    "key", "other", zero), "hello")
+
+    def test_normalized_text(self):
+        import testing
+        from cryptanalysis import letters_only
+        plain = "Jolly jugglers, quietly meet me at 9 — über alles!"
+        message = NormalizedText(plain)
+        self.assertIs(NormalizedText(message), message)
+        self.assertEqual(message.indices[:3], bytes([9, 14, 11]))
+        self.assertEqual(message.gaps[0], (5, ' '))
+        self.assertEqual(message.restore(message.letters), plain.upper())
+        letters = ''.join(c for c in plain if c.isalpha() and c != 'ü')  # Stripped like the square ciphers need
+        for cipher in (lambda t: caesar_cipher(t, 3), lambda t: vigenere_cipher(t, "LEMON", False),
+                       lambda t: autokey_cipher(t, "KEY"), lambda t: beaufort_cipher(t, "FORTIFY"),
+                       lambda t: vigenere_cipher(t, "Ab", alphabet=LATIN_1), lambda t: rail_fence_cipher(t, 3),
+                       letters_only, lambda t: testing.four_square_encrypt(["EXAMPLE", "KEYWORD"], t)):
+            self.assertEqual(cipher(message), cipher(plain))
+        square_message = NormalizedText(letters)
+        self.assertEqual(playfair_cipher(square_message, "KEY"), playfair_cipher(letters, "KEY"))
+        self.assertEqual(four_square_cipher_encrypt(square_message, "EXAMPLE", "KEYWORD"),
+                         four_square_cipher_encrypt(letters, "EXAMPLE", "KEYWORD"))
+        self.assertIn('upper_text', vars(message))  # Computed once, then shared
+
     def test_beaufort_cipher(self):
         self.assertEqual(beaufort_cipher("HELLO", "KEY"), "DANZQ")
         self.assertEqual(beaufort_cipher("DANZQ", "KEY"), "HELLO")
@@ -461,6 +1213,13 @@ class TestCryptographyMachine(unittest.TestCase):
         # self.assertEqual(playfair_cipher("DBNVMI", "KEY", encrypt=False), "HELLO")
         pass
 
+    def test_polybius_square_digraphs(self):
+        square = playfair_square("PLAYFAIR EXAMPLE")
+        self.assertEqual(square.positions["P"], (0, 0))
+        self.assertEqual(square.playfair_digraphs()["HI"], "BM")
+        self.assertEqual(playfair_cipher("HIDE THE GOLD", "PLAYFAIR EXAMPLE"), "BMODZBXDNAGE")
+        self.assertEqual(playfair_cipher("BMODZBXDNAGE", "PLAYFAIR EXAMPLE", encrypt=False), "HIDETHEGOLD")
+
     def test_two_square_cipher(self):
         self.assertEqual(two_square_cipher_encrypt("HELLO", "EXAMPLE", "SQUARE"), "GBCVCM")
         self.assertEqual(two_square_cipher_decrypt("GBCVCM", "EXAMPLE", "SQUARE"), "HELLO")
@@ -474,6 +1233,85 @@ class TestCryptographyMachine(unittest.TestCase):
     def test_rail_fence_cipher(self):
         self.assertEqual(rail_fence_cipher("HELLO", 3, encrypt=True), "HOELL")
         self.assertEqual(rail_fence_cipher("HOELL", 3, encrypt=False), "HELLO")
+        self.assertEqual(list(rail_fence_permutation(5, 3)), [0, 4, 1, 3, 2])
+        self.assertEqual(list(rail_fence_permutation(5, 3, False)), [0, 2, 4, 3, 1])
+        _cached_rail_fence_permutation.cache_clear()
+        rail_fence_cipher("WE ARE DISCOVERED", 3)
+        self.assertEqual(_cached_rail_fence_permutation.cache_info().currsize, 1)  # Encryption builds no inverse
+        long = "".join(chr(65 + i % 26) for i in range(RAIL_FENCE_CACHE_LENGTH + 7))  # Built without the cache
+        self.assertEqual(rail_fence_cipher(rail_fence_cipher(long, 4), 4, False), long)
+
+    def test_streaming_matches_one_shot(self):
+        text = "Attack at dawn, hold the bridge! Meet me by the old mill."
+        letters = "HIDE THE GOLD IN THE TREE STUMP BALLOON"
+        cases = [
+            (lambda: CaesarStream(3), lambda t: caesar_cipher(t, 3), text),
+            (lambda: VigenereStream("LEMON", False), lambda t: vigenere_cipher(t, "LEMON", False), text),
+            (lambda: AutokeyStream("KEY"), lambda t: autokey_cipher(t, "KEY"), text),
+            (lambda: AutokeyStream("KEY", False), lambda t: autokey_cipher(t, "KEY", False), text),
+            (lambda: BeaufortStream("KEY"), lambda t: beaufort_cipher(t, "KEY"), text),
+            (lambda: PlayfairStream("KEY"), lambda t: playfair_cipher(t, "KEY"), letters),
+            (lambda: PlayfairStream("KEY", False), lambda t: playfair_cipher(t, "KEY", False), letters + "X"),
+            (lambda: TwoSquareStream("EXAMPLE", "SQUARE"), lambda t: two_square_cipher_encrypt(t, "EXAMPLE", "SQUARE"), letters),
+            (lambda: TwoSquareStream("EXAMPLE", "SQUARE", False), lambda t: two_square_cipher_decrypt(t, "EXAMPLE", "SQUARE"), "GBCVCMXAXB"),
+            (lambda: FourSquareStream("EXAMPLE", "FOURKEY"), lambda t: four_square_cipher_encrypt(t, "EXAMPLE", "FOURKEY"), letters),
+            (lambda: FourSquareStream("EXAMPLE", "FOURKEY", False), lambda t: four_square_cipher_decrypt(t, "EXAMPLE", "FOURKEY"), "FUGDIX"),
+            (lambda: RailFenceStream(3, False), lambda t: rail_fence_cipher(t, 3, False), text),
+        ]
+        for make_stream, one_shot, sample in cases:
+            for size in range(1, 8):
+                chunks = [sample[i:i + size] for i in range(0, len(sample), size)]
+                self.assertEqual(''.join(stream_chunks(make_stream(), chunks)), one_shot(sample))
+
+    def test_cipher_objects_match_functions(self):
+        text = "Attack at dawn, hold the bridge! Meet me by the old mill."
+        letters = "HIDE THE GOLD IN THE TREE STUMP BALLOON"
+        six = string.ascii_uppercase + string.digits
+        cases = [
+            ('caesar', 3, None, lambda t, e: caesar_cipher(t, 3, e), text),
+            ('rot13', None, None, lambda t, e: rot13(t), text),
+            ('vigenere', "LEMON", None, lambda t, e: vigenere_cipher(t, "LEMON", e), text),
+            ('vigenere', "Key 9", LATIN_1, lambda t, e: vigenere_cipher(t, "Key 9", e, LATIN_1), text),
+            ('autokey', "KEY", None, lambda t, e: autokey_cipher(t, "KEY", e), text),
+            ('beaufort', "KEY", PRINTABLE_ASCII, lambda t, e: beaufort_cipher(t, "KEY", PRINTABLE_ASCII), text),
+            ('playfair', "KEY", None, lambda t, e: playfair_cipher(t, "KEY", e), letters),
+            ('playfair', "SECRET 42", six, lambda t, e: playfair_cipher(t, "SECRET 42", e, six), "MEET AT 1900"),
+            ('two-square', ("EXAMPLE", "SQUARE"), None, lambda t, e: (two_square_cipher_encrypt if e else
+                two_square_cipher_decrypt)(t, "EXAMPLE", "SQUARE"), letters + "X"),
+            ('four-square', ("EXAMPLE", "FOURKEY"), None, lambda t, e: (four_square_cipher_encrypt if e else
+                four_square_cipher_decrypt)(t, "EXAMPLE", "FOURKEY"), letters),
+            ('rail-fence', 3, None, lambda t, e: rail_fence_cipher(t, 3, e), text),
+        ]
+        for name, key, alphabet, function, sample in cases:
+            cipher = build_cipher(name, key, alphabet)
+            self.assertEqual(cipher.encode(sample), function(sample, True), name)
+            ciphertext = function(sample, True)
+            self.assertEqual(cipher.decode(ciphertext), function(ciphertext, False), name)
+        with self.assertRaises(ValueError):
+            build_cipher('enigma', "KEY")
+
+    def test_cipher_cache(self):
+        from concurrent.futures import ThreadPoolExecutor
+        cache = CipherCache(maxsize=2)
+        first = cache.get('vigenere', "LEMON")
+        self.assertIs(cache.get('vigenere', "LEMON"), first)
+        self.assertIsNot(cache.get('vigenere', "LEMON", UPPERCASE), first)  # The alphabet is part of the key
+        cache.get('vigenere', "LEMON")
+        cache.get('playfair', "KEY")  # Evicts the least recently used: LEMON with the alphabet
+        self.assertIs(cache.get('vigenere', "LEMON"), first)
+        self.assertEqual(cache.stats, {'hits': 3, 'misses': 3, 'evictions': 1})
+        self.assertEqual(len(cache), 2)
+
+        cache = CipherCache(maxsize=8)
+        keys = [f"KEY{chr(65 + i)}" for i in range(12)]
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda i: cache.get('vigenere', keys[i % 12]).encode("attack"), range(2000)))
+        self.assertEqual(results[:12], [vigenere_cipher("attack", key) for key in keys])
+        self.assertEqual(cache.stats['hits'] + cache.stats['misses'], 2000)
+        self.assertEqual(cache.stats['misses'] - cache.stats['evictions'], len(cache))
+        self.assertLessEqual(len(cache), 8)
+        cache.clear()
+        self.assertEqual((len(cache), cache.stats), (0, {'hits': 0, 'misses': 0, 'evictions': 0}))
 
 if __name__ == "__main__":
     unittest.main()
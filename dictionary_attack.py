@@ -0,0 +1,307 @@
+import heapq
+import mmap
+import multiprocessing
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from crytography_machine import (autokey_cipher, beaufort_cipher, four_square_cipher_decrypt, playfair_cipher,
+                                 two_square_cipher_decrypt, vigenere_cipher)
+from cryptanalysis import letters_only
+from square_solver import QUADGRAMS, SQUARE_ALPHABET, SQUARE_TO_LETTER, _cell_pairs, default_quadgrams
+
+CIPHERS = ('vigenere', 'autokey', 'beaufort', 'playfair', 'two-square', 'four-square')
+SHARD_BYTES = 1 << 20  # Wordlist bytes per shard handed to a worker
+PREFIX = 100  # Ciphertext letters decrypted per candidate
+# Upper-cases a wordlist and deletes everything but letters and line breaks, in one pass per shard
+UPPER = bytes.maketrans(string.ascii_lowercase.encode(), string.ascii_uppercase.encode())
+NOT_WORD = bytes(sorted(set(range(256)) - set(string.ascii_letters.encode()) - {ord('\n')}))
+LETTER_INDEX = bytes.maketrans(string.ascii_uppercase.encode(), bytes(range(26)))
+GAP = 26  # Index given to a non-letter that still moves the Beaufort key along
+SQUARE_INDEX = {c: i for i, c in enumerate(SQUARE_ALPHABET)}
+# Vigenère decryption subtracts key letter k, Beaufort decryption maps t to k - t; GAP stays GAP
+MINUS = [bytes([(v - k) % 26 for v in range(26)] + list(range(26, 256))) for k in range(26)]
+REFLECT = [bytes([(k - v) % 26 for v in range(26)] + list(range(26, 256))) for k in range(26)]
+
+
+def wordlist_shards(path, shard_bytes=SHARD_BYTES):
+    """Splits a wordlist into (start, end) byte ranges of about shard_bytes that end on line breaks."""
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    shards = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as words:
+        start = 0
+        while start < size:
+            end = words.find(b'\n', min(start + shard_bytes, size) - 1)
+            end = size if end < 0 else end + 1
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def _square(key):
+    """The key square create_playfair_matrix() builds for a letters-only key, as SQUARE_ALPHABET indices."""
+    return [SQUARE_INDEX[c] for c in dict.fromkeys(key.replace('J', 'I') + SQUARE_ALPHABET)]
+
+
+class DictionaryAttack:
+    """Everything a worker needs to try keys against one ciphertext: the decryption prefix and the fitness rule.
+
+    Two-Square and Four-Square need one of their keys known: known is (key1, None) to search
+    for key2 or (None, key2) to search for key1.
+    """
+    def __init__(self, cipher, ciphertext, prefix=PREFIX, known=None, checkpoint=16, slack=0.0):
+        if cipher not in CIPHERS:
+            raise ValueError(f"Unknown cipher: {cipher}")
+        self.cipher = cipher
+        self.checkpoint = checkpoint  # Quadgrams scored before a candidate may be rejected
+        self.slack = slack  # log10 per quadgram a candidate may trail the current top-K at the checkpoint
+        letters = letters_only(ciphertext)
+        if cipher == 'beaufort':
+            # The Beaufort key also advances on punctuation, so keep it as gaps
+            text = ciphertext.upper().replace(' ', '')
+            self.prefix = bytes(GAP if c not in string.ascii_uppercase else ord(c) - 65 for c in text[:prefix])
+        elif cipher in ('vigenere', 'autokey'):
+            self.prefix = letters[:prefix].encode('ascii').translate(LETTER_INDEX)
+        else:
+            letters = letters.replace('J', 'I')[:prefix - prefix % 2]
+            cells = [SQUARE_INDEX[c] for c in letters[:len(letters) - len(letters) % 2]]
+            self.first, self.second = cells[0::2], cells[1::2]
+            self.out1, self.out2 = _cell_pairs('playfair' if cipher == 'playfair' else 'four_square')
+        self.known = None
+        if cipher in ('two-square', 'four-square'):
+            if known is None or sum(k is None for k in known) != 1:
+                raise ValueError(f"The {cipher} attack needs one of its two keys, e.g. known=(None, 'KEY2').")
+            self.known = tuple(known)
+            self.search_first = known[0] is None
+            self.fixed = _square(letters_only(known[1] if self.search_first else known[0]))
+
+    def keys(self, key):
+        """The full key for a candidate word: the word itself, or the (key1, key2) pair."""
+        if self.known is None:
+            return key
+        return (key, self.known[1]) if self.search_first else (self.known[0], key)
+
+    def plaintext(self, key):
+        """Decrypts the prefix with a candidate key, as letter indices 0-25."""
+        cipher = self.cipher
+        if cipher in ('vigenere', 'beaufort'):
+            tables = MINUS if cipher == 'vigenere' else REFLECT
+            shifts = key.encode('ascii').translate(LETTER_INDEX)
+            plain = bytearray(self.prefix)
+            period = len(shifts)
+            for j in range(min(period, len(plain))):
+                plain[j::period] = plain[j::period].translate(tables[shifts[j]])
+            return plain.translate(None, b'\x1a') if cipher == 'beaufort' else plain
+        if cipher == 'autokey':
+            running = list(key.encode('ascii').translate(LETTER_INDEX))
+            plain = bytearray()
+            for i, c in enumerate(self.prefix):
+                p = (c - running[i]) % 26
+                running.append(p)
+                plain.append(p)
+            return plain
+        square = _square(key)
+        if cipher == 'playfair':
+            in1 = in2 = map1 = map2 = square
+        elif self.search_first:
+            in1, in2 = square, self.fixed
+        else:
+            in1, in2 = self.fixed, square
+        if cipher == 'two-square':
+            map1, map2 = in1, in2
+        elif cipher == 'four-square':
+            map1 = map2 = range(25)
+        pos1 = [0] * 25
+        pos2 = [0] * 25
+        for cell in range(25):
+            pos1[in1[cell]] = cell
+            pos2[in2[cell]] = cell
+        out1, out2, letters = self.out1, self.out2, SQUARE_TO_LETTER
+        plain = bytearray()
+        append = plain.append
+        for a, b in zip(self.first, self.second):
+            pair = pos1[a] * 25 + pos2[b]
+            append(letters[map1[out1[pair]]])
+            append(letters[map2[out2[pair]]])
+        return plain
+
+    def fitness(self, plain, scores, cutoff=None):
+        """Quadgram score of decrypted letters, or None once a candidate falls clearly below cutoff.
+
+        cutoff is the total score a candidate needs to enter the current top-K; at the
+        checkpoint a candidate is dropped if its mean trails cutoff's by more than slack.
+        """
+        quadgrams = len(plain) - 3
+        if quadgrams < 1:
+            return 0.0
+        checkpoint = self.checkpoint if cutoff is not None and quadgrams > self.checkpoint else quadgrams
+        code = (plain[0] * 26 + plain[1]) * 26 + plain[2]
+        total = 0.0
+        for x in plain[3:3 + checkpoint]:
+            code = (code * 26 + x) % QUADGRAMS
+            total += scores[code]
+        if checkpoint == quadgrams:
+            return total
+        if total < (cutoff / quadgrams - self.slack) * checkpoint:
+            return None
+        for x in plain[3 + checkpoint:]:
+            code = (code * 26 + x) % QUADGRAMS
+            total += scores[code]
+        return total
+
+    def decrypt(self, key, ciphertext):
+        """Decrypts the whole ciphertext with the real cipher function."""
+        cipher = self.cipher
+        if cipher == 'vigenere':
+            return vigenere_cipher(ciphertext, key, encrypt=False)
+        if cipher == 'autokey':
+            return autokey_cipher(ciphertext, key, encrypt=False)
+        if cipher == 'beaufort':
+            return beaufort_cipher(ciphertext, key)
+        letters = letters_only(ciphertext)
+        if cipher == 'playfair':
+            return playfair_cipher(letters, key, encrypt=False)
+        if cipher == 'two-square':
+            return two_square_cipher_decrypt(letters, *key)
+        return four_square_cipher_decrypt(letters, *key)
+
+
+_worker = {}
+
+
+def _init_worker(attack, table, cutoff):
+    _worker['attack'] = attack
+    _worker['scores'] = list(table.scores)  # List indexing skips creating a float per lookup
+    _worker['cutoff'] = cutoff
+
+
+def _attack_shard(path, start, end, top):
+    """Tries every word of one wordlist shard; returns its best (score, key) pairs. Runs in a worker."""
+    attack, scores, shared = _worker['attack'], _worker['scores'], _worker['cutoff']
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as words:
+        lines = words[start:end].translate(UPPER, NOT_WORD).split(b'\n')
+    best = []
+    seen = set()
+    floor = float('-inf')
+    for i, line in enumerate(lines):
+        if not line or line in seen:
+            continue
+        seen.add(line)
+        if i % 1024 == 0:
+            floor = shared.value  # The global top-K bar, raised as other shards finish
+        cutoff = max(best[0][0] if len(best) == top else floor, floor)
+        key = line.decode('ascii')
+        score = attack.fitness(attack.plaintext(key), scores, cutoff if cutoff > float('-inf') else None)
+        if score is None:
+            continue
+        if len(best) < top:
+            heapq.heappush(best, (score, key))
+        elif score > best[0][0]:
+            heapq.heapreplace(best, (score, key))
+    return best
+
+
+def dictionary_attack(cipher, ciphertext, wordlist, top=10, processes=None, prefix=PREFIX, known=None,
+                      table=None, checkpoint=16, slack=0.0, shard_bytes=SHARD_BYTES):
+    """Tries every word of a wordlist file as the key; returns the top (key, plaintext, score) results, best first.
+
+    The wordlist (one key per line, of any size) is memory-mapped and split into line-aligned
+    shards for worker processes. Each candidate decrypts only the first prefix ciphertext
+    letters, is scored with the quadgram table, and is dropped early when it trails the
+    current top-K. For Two-Square and Four-Square, known gives the other key (see DictionaryAttack);
+    their results carry (key1, key2) pairs.
+    """
+    attack = DictionaryAttack(cipher, ciphertext, prefix, known, checkpoint, slack)
+    table = table or default_quadgrams()
+    shards = wordlist_shards(wordlist, shard_bytes)
+    best = {}
+
+    def collect(results):
+        for score, key in results:
+            if score > best.get(key, float('-inf')):
+                best[key] = score
+        ranked = heapq.nlargest(top, best.items(), key=lambda item: item[1])
+        best.clear()
+        best.update(ranked)
+        return ranked[-1][1] if len(ranked) == top else float('-inf')
+
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(shards) <= 1:
+        cutoff = multiprocessing.RawValue('d', float('-inf'))
+        _init_worker(attack, table, cutoff)
+        for start, end in shards:
+            cutoff.value = collect(_attack_shard(wordlist, start, end, top))
+    else:
+        cutoff = multiprocessing.Value('d', float('-inf'), lock=False)
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(attack, table, cutoff)) as pool:
+            futures = [pool.submit(_attack_shard, wordlist, start, end, top) for start, end in shards]
+            for future in as_completed(futures):
+                cutoff.value = collect(future.result())
+    ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    return [(attack.keys(key), attack.decrypt(attack.keys(key), ciphertext), score) for key, score in ranked]
+
+
+import unittest
+
+
+class TestDictionaryAttack(unittest.TestCase):
+    def setUp(self):
+        import random
+        import tempfile
+        from cryptanalysis import ENGLISH_SAMPLE
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        rng = random.Random(4)
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))) for _ in range(3000)]
+        words[1234] = "Lighthouse"
+        words[2500] = "harbour's"  # Punctuation is stripped from candidates
+        self.path = os.path.join(self.tmp.name, 'words.txt')
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(words) + '\n')
+        self.plaintext = letters_only(ENGLISH_SAMPLE[:400])
+
+    def test_prefix_decryption_matches_cipher_functions(self):
+        from crytography_machine import autokey_cipher, four_square_cipher_encrypt, two_square_cipher_encrypt
+        table = default_quadgrams()
+        text = "Keepers' logs, kept for years: the weather, ships & lamps, now!"
+        cases = [
+            ('vigenere', vigenere_cipher(text, "LEMON"), "LEMON", None),
+            ('autokey', autokey_cipher(text, "KEY"), "KEY", None),
+            ('beaufort', beaufort_cipher(text, "FORTIFY"), "FORTIFY", None),
+            ('playfair', playfair_cipher(letters_only(text), "LIGHTHOUSE"), "LIGHTHOUSE", None),
+            ('two-square', two_square_cipher_encrypt(letters_only(text), "KEEPER", "HARBOUR"), "HARBOUR", ("KEEPER", None)),
+            ('four-square', four_square_cipher_encrypt(letters_only(text), "KEEPER", "HARBOUR"), "KEEPER", (None, "HARBOUR")),
+        ]
+        for cipher, ciphertext, key, known in cases:
+            attack = DictionaryAttack(cipher, ciphertext, prefix=1000, known=known)
+            expected = letters_only(attack.decrypt(attack.keys(key), ciphertext)).replace('J', 'I')
+            plain = ''.join(string.ascii_uppercase[i] for i in attack.plaintext(key))
+            length = min(len(plain), len(expected))  # Playfair strips a final padding X
+            self.assertEqual(plain[:length], expected[:length], cipher)
+            self.assertAlmostEqual(attack.fitness(attack.plaintext(key), table.scores), table.score(plain))
+
+    def test_finds_the_key(self):
+        from crytography_machine import four_square_cipher_encrypt
+        shards = wordlist_shards(self.path, 1000)
+        self.assertEqual((shards[0][0], shards[-1][1]), (0, os.path.getsize(self.path)))
+        self.assertTrue(all(a[1] == b[0] for a, b in zip(shards, shards[1:])))
+        for cipher, ciphertext, key, known, processes in [
+            ('vigenere', vigenere_cipher(self.plaintext, "LIGHTHOUSE"), "LIGHTHOUSE", None, 1),
+            ('playfair', playfair_cipher(self.plaintext, "HARBOURS"), "HARBOURS", None, 2),
+            ('four-square', four_square_cipher_encrypt(self.plaintext, "KEEPER", "LIGHTHOUSE"),
+             ("KEEPER", "LIGHTHOUSE"), ("KEEPER", None), 2),
+        ]:
+            results = dictionary_attack(cipher, ciphertext, self.path, top=3, processes=processes, known=known,
+                                        shard_bytes=4096)
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[0][0], key)
+            # Playfair separates doubled letters with X
+            self.assertEqual(letters_only(results[0][1]).replace('X', '')[:50],
+                             self.plaintext.replace('J', 'I').replace('X', '')[:50])
+
+
+if __name__ == "__main__":
+    unittest.main()
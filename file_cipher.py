@@ -0,0 +1,246 @@
+import mmap
+import os
+
+import crytography_machine as cm
+from byte_ciphers import UPPER, caesar_into, vigenere_into
+from cli import CIPHERS, make_stream
+from parallel import (SQUARE_NORMALIZE, _beaufort_chunk, _count_letters, _normalize_chunk, _rail_chunk, _rail_layout,
+                      _ranges, _square_chunk, _square_digraphs, _square_plan)
+
+WINDOW = 1 << 20  # Input bytes transformed per step; the rest of the file stays on disk
+
+
+class _Output:
+    """The destination file, grown to its final size up front and memory-mapped for writing."""
+    def __init__(self, f, size):
+        self.file = f
+        f.truncate(size)
+        self.map = mmap.mmap(f.fileno(), size) if size else None
+        self.view = memoryview(self.map) if size else memoryview(bytearray())
+
+    def close(self, size):
+        """Unmaps the file and trims it to the bytes actually written."""
+        self.view.release()
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.file.truncate(size)
+        return size
+
+
+def _substitute(data, f, length, cipher, encrypt, key, shift, window):
+    if cipher == 'beaufort':
+        spaces = [data[a:b].tobytes().count(b' ') for a, b in _ranges(length, window)]
+        out = _Output(f, length - sum(spaces))
+        out_start = 0
+        for (a, b), skipped in zip(_ranges(length, window), spaces):
+            _beaufort_chunk(data, out.view, a, b, key, out_start)
+            out_start += b - a - skipped
+        return out.close(out_start)
+    out = _Output(f, length)
+    if cipher == 'autokey':
+        state = cm.AutokeyState(key.upper(), encrypt=encrypt)
+        for a, b in _ranges(length, window):
+            out.view[a:b] = state.update(data[a:b].tobytes().translate(UPPER).decode('latin-1')).encode('latin-1')
+        return out.close(length)
+    offset = 0
+    for a, b in _ranges(length, window):
+        if cipher == 'vigenere':
+            vigenere_into(data[a:b], out.view[a:b], key, encrypt, offset)
+            offset += _count_letters(data, a, b)
+        else:
+            caesar_into(data[a:b], out.view[a:b], 13 if cipher == 'rot13' else shift, encrypt)
+    return out.close(length)
+
+
+def _rail_fence(data, f, length, num_rails, encrypt, window):
+    out = _Output(f, length)
+    if num_rails <= 1:
+        for a, b in _ranges(length, window):
+            out.view[a:b] = data[a:b]
+        return out.close(length)
+    # Each step covers whole zigzag cycles: one contiguous stretch of text, a slice of every rail
+    rail_starts, cycles = _rail_layout(length, num_rails)
+    step = max(1, window // (2 * (num_rails - 1)))
+    for c in range(0, cycles, step):
+        _rail_chunk(data, out.view, c, min(c + step, cycles), rail_starts, num_rails, length, encrypt)
+    return out.close(length)
+
+
+def _normalized(data, a, b):
+    return memoryview(data[a:b].tobytes().translate(SQUARE_NORMALIZE, b' '))
+
+
+def _square(data, f, length, cipher, encrypt, key, key2, window):
+    insertions = cipher == 'playfair' or (cipher == 'two-square' and encrypt)
+    _square_digraphs(cipher, key, key2, encrypt)
+    windows = _ranges(length, window)
+    # First pass: the normalized length and boundary letters of every window give the output layout
+    found = []
+    for a, b in windows:
+        info = _normalize_chunk(memoryview(bytearray(data[a:b])), 0, b - a, insertions)
+        if info[0]:
+            found.append((a, *info))
+    tasks, size = _square_plan(found, cipher, encrypt, key, key2, insertions)
+    out = _Output(f, size)
+    # Second pass: normalize each window again and write its digraphs where the plan puts them
+    for (a, *task) in tasks:
+        _square_chunk(_normalized(data, a, a + window), out.view, 0, *task)
+    if cipher == 'two-square' and not encrypt:
+        size = _unpad(out.view, size, window)
+    elif not encrypt and size and out.view[size - 1] == ord('X'):
+        size -= 1
+    return out.close(size)
+
+
+def _unpad(plain, length, window):
+    """Two-Square padding removal in place: drops each 'X' between two equal letters; returns the new length.
+
+    Bytes only move towards the start, so every window still reads original bytes; the
+    letter before a window is carried over from the previous one.
+    """
+    written = 0
+    before = None
+    for a, b in _ranges(length, window):
+        segment = plain[a:b].tobytes()
+        after = plain[b] if b < length else None
+        kept = []
+        last = 0
+        i = segment.find(b'X')
+        while i != -1:
+            left = segment[i - 1] if i else before
+            right = segment[i + 1] if i + 1 < len(segment) else after
+            if left is not None and right is not None and left == right:
+                kept.append(segment[last:i])
+                last = i + 1
+            i = segment.find(b'X', i + 1)
+        kept.append(segment[last:])
+        before = segment[-1]
+        out = b''.join(kept)
+        plain[written:written + len(out)] = out
+        written += len(out)
+    return written
+
+
+def transform_file(src, dst, cipher, encrypt=True, key=None, key2=None, shift=None, rails=None, window=WINDOW):
+    """Encrypts or decrypts the file src into the file dst without reading either into memory.
+
+    Both files are memory-mapped and processed window bytes at a time; the output file is
+    sized beforehand (the Playfair family and Beaufort change the length, so their sizes
+    come from a first pass). Rail fence reads and writes the whole file at random through
+    the maps. Files are bytes: ASCII letters are transformed like the text functions do and
+    other bytes, such as UTF-8 sequences, are copied unchanged (the square ciphers reject
+    them). The output is written under a temporary name next to dst and renamed over it
+    once complete, so a failure leaves dst untouched. Returns the number of bytes written.
+    """
+    if cipher not in CIPHERS:
+        raise ValueError(f"Unknown cipher: {cipher}")
+    make_stream(cipher, encrypt, key, key2, shift, rails)  # Reject missing or invalid keys before touching dst
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise ValueError("The output file must differ from the input file.")
+    directory, name = os.path.split(dst)
+    partial = os.path.join(directory, f".{name}.{os.getpid()}.part")
+    try:
+        with open(src, 'rb') as fin, open(partial, 'w+b') as f:
+            written = _transform(fin, f, cipher, encrypt, key, key2, shift, rails, window)
+        os.replace(partial, dst)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def _transform(fin, f, cipher, encrypt, key, key2, shift, rails, window):
+    length = os.fstat(fin.fileno()).st_size
+    source = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) if length else bytearray()
+    try:
+        with memoryview(source) as data:
+            if cipher == 'rail-fence':
+                return _rail_fence(data, f, length, rails, encrypt, window)
+            if cipher in ('playfair', 'two-square', 'four-square'):
+                return _square(data, f, length, cipher, encrypt, key, key2, window)
+            return _substitute(data, f, length, cipher, encrypt, key, shift, window)
+    finally:
+        if length:
+            source.close()
+
+
+def encrypt_file(src, dst, cipher, key=None, **options):
+    """Encrypts the file src into dst, e.g. encrypt_file('in.txt', 'out.txt', 'vigenere', 'LEMON')."""
+    return transform_file(src, dst, cipher, True, key, **options)
+
+
+def decrypt_file(src, dst, cipher, key=None, **options):
+    """Decrypts the file src into dst."""
+    return transform_file(src, dst, cipher, False, key, **options)
+
+
+import unittest
+
+
+class TestFileCipher(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name, data=None):
+        path = os.path.join(self.tmp.name, name)
+        if data is not None:
+            with open(path, 'wb') as f:
+                f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_matches_in_memory_ciphers(self):
+        from parallel import parallel_transform
+        text = b"Meet me at the old mill; bring the lamp, the ladder and the keys! " * 9 + b"Odd"
+        letters = b"BALLOON ATTACK TOMORROW AT DAWN HOLD THE BRIDGE " * 9 + b"X"
+        options = {'key': "LEMON", 'key2': "EXAMPLE", 'shift': 3, 'rails': 4}
+        for cipher in CIPHERS:
+            plain = letters if cipher in ('playfair', 'two-square', 'four-square') else text
+            for encrypt in (True, False):
+                data = plain
+                if not encrypt and cipher in ('two-square', 'four-square'):
+                    data = parallel_transform(cipher, plain, True, workers=1, **options)
+                if cipher == 'autokey':
+                    expected = cm.autokey_cipher(data.decode(), "LEMON", encrypt).encode()
+                else:
+                    expected = parallel_transform(cipher, data, encrypt, workers=1, **options)
+                for window in (5, 64, WINDOW):
+                    src, dst = self.path('in', data), self.path('out')
+                    written = transform_file(src, dst, cipher, encrypt, window=window, **options)
+                    self.assertEqual(self.read(dst), expected, (cipher, encrypt, window))
+                    self.assertEqual(written, len(expected))
+
+    def test_round_trip_and_errors(self):
+        text = "Ünïcode stays, ASCII letters change: ‘quoted’ text\n".encode() * 50
+        src, mid, out = self.path('in', text), self.path('mid'), self.path('out')
+        encrypt_file(src, mid, 'vigenere', "LEMON", window=13)
+        decrypt_file(mid, out, 'vigenere', "LEMON", window=7)
+        self.assertEqual(self.read(out), text.translate(UPPER))  # Only ASCII letters are upper-cased
+        encrypt_file(src, mid, 'rail-fence', rails=5, window=9)
+        decrypt_file(mid, out, 'rail-fence', rails=5, window=11)
+        self.assertEqual(self.read(out), text)
+        empty = self.path('empty', b'')
+        self.assertEqual(encrypt_file(empty, out, 'playfair', "KEY"), 0)
+        with self.assertRaises(ValueError):
+            encrypt_file(src, src, 'rot13')
+        with self.assertRaises(ValueError):
+            encrypt_file(src, out, 'vigenere')  # Missing key
+        with open(out, 'wb') as f:
+            f.write(b"previous output")
+        with self.assertRaises(KeyError):
+            encrypt_file(src, out, 'playfair', "KEY", window=64)  # Punctuation is not in the key square
+        self.assertEqual(self.read(out), b"previous output")  # Neither truncated nor partially written
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), sorted(['in', 'mid', 'out', 'empty']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+import functools
+import sys
+import threading
+import time
+
+import crytography_machine
+
+# Cipher entry points: calls, input size and time are recorded for the outermost one of these
+ENTRY_POINTS = [
+    'caesar_cipher', 'rot13', 'vigenere_cipher', 'autokey_cipher', 'beaufort_cipher', 'playfair_cipher',
+    'two_square_cipher_encrypt', 'two_square_cipher_decrypt', 'four_square_cipher_encrypt',
+    'four_square_cipher_decrypt', 'rail_fence_cipher',
+]
+CIPHER_CLASSES = [
+    'CaesarCipher', 'VigenereCipher', 'VigenereAutokeyCipher', 'BeaufortCipher', 'PlayfairCipher', 'TwoSquareCipher',
+    'FourSquareCipher', 'RailFenceCipher',
+]
+ENTRY_METHODS = [(class_name, method) for class_name in CIPHER_CLASSES for method in ('encode', 'decode')]
+# Key-dependent precomputation: its time is reported as setup, separately from the transform
+KEY_SETUP = [
+    'create_playfair_matrix', 'playfair_square', 'two_square_digraphs', 'four_square_digraphs',
+    'caesar_table', 'vigenere_tables', 'beaufort_tables', 'rail_fence_permutation',
+]
+KEY_SETUP_METHODS = [('AutokeyState', '__init__')] + [
+    (class_name, '__init__') for class_name in CIPHER_CLASSES if class_name != 'VigenereAutokeyCipher'
+]
+
+_lock = threading.Lock()
+_local = threading.local()
+_counters = {}
+_callback = None
+_patches = []  # (owner, attribute, original) to restore on disable()
+
+
+def _state():
+    if not hasattr(_local, 'depth'):
+        _local.depth = 0
+        _local.setup_depth = 0
+        _local.setup_ns = 0
+    return _local
+
+
+def _record(name, size, total_ns, setup_ns):
+    with _lock:
+        counters = _counters.setdefault(name, {'calls': 0, 'bytes': 0, 'total_ns': 0, 'setup_ns': 0})
+        counters['calls'] += 1
+        counters['bytes'] += size
+        counters['total_ns'] += total_ns
+        counters['setup_ns'] += setup_ns
+    callback = _callback
+    if callback is None:
+        return
+    try:
+        callback({'function': name, 'bytes': size, 'seconds': total_ns / 1e9, 'setup_seconds': setup_ns / 1e9})
+    except Exception:
+        pass  # Runs in the wrappers' finally: a failing callback must not replace the cipher's result or error
+
+
+def _size(args, text_index):
+    try:
+        return len(args[text_index])
+    except (IndexError, TypeError):
+        return 0
+
+
+def _wrap_entry(name, func, text_index):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state = _state()
+        if state.depth:
+            return func(*args, **kwargs)  # Nested entry point, e.g. rot13 -> caesar_cipher
+        state.depth = 1
+        state.setup_ns = 0
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = time.perf_counter_ns() - start
+            state.depth = 0
+            _record(name, _size(args, text_index), total, state.setup_ns)
+    return wrapper
+
+
+def _wrap_setup(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state = _state()
+        if state.setup_depth:
+            return func(*args, **kwargs)  # Setup nested in setup is already being timed
+        state.setup_depth = 1
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            state.setup_depth = 0
+            if state.depth:
+                state.setup_ns += elapsed
+            else:
+                _record(name, 0, elapsed, elapsed)  # Setup outside any cipher call, e.g. building a stream
+    for attribute in ('cache_info', 'cache_clear'):
+        if hasattr(func, attribute):
+            setattr(wrapper, attribute, getattr(func, attribute))
+    return wrapper
+
+
+def _patch(owner, attribute, replacement):
+    _patches.append((owner, attribute, getattr(owner, attribute)))
+    setattr(owner, attribute, replacement)
+
+
+def enable(callback=None):
+    """Starts recording; callback, if given, receives one event dict per recorded call.
+
+    Entry points are swapped for timing wrappers in crytography_machine and in every loaded
+    module that imported them by name; disable() puts the originals back, so there is no
+    overhead at all while instrumentation is off.
+    """
+    global _callback
+    with _lock:
+        _callback = callback
+        if _patches:
+            return
+        module = crytography_machine
+        replacements = {}
+        for name in ENTRY_POINTS:
+            original = getattr(module, name)
+            replacements[id(original)] = (original, _wrap_entry(name, original, 0))
+        for name in KEY_SETUP:
+            original = getattr(module, name)
+            replacements[id(original)] = (original, _wrap_setup(name, original))
+        for class_name, method in ENTRY_METHODS:
+            cls = getattr(module, class_name)
+            _patch(cls, method, _wrap_entry(f"{class_name}.{method}", getattr(cls, method), 1))
+        for class_name, method in KEY_SETUP_METHODS:
+            cls = getattr(module, class_name)
+            _patch(cls, method, _wrap_setup(f"{class_name}.{method}", getattr(cls, method)))
+
+        for loaded in list(sys.modules.values()):
+            namespace = getattr(loaded, '__dict__', None)
+            if namespace is None or loaded is sys.modules[__name__]:
+                continue
+            for attribute, value in list(namespace.items()):
+                if id(value) in replacements and replacements[id(value)][0] is value:
+                    _patch(loaded, attribute, replacements[id(value)][1])
+
+
+def disable():
+    """Stops recording and restores the original functions. Counters are kept until reset()."""
+    global _callback
+    with _lock:
+        while _patches:
+            owner, attribute, original = _patches.pop()
+            setattr(owner, attribute, original)
+        _callback = None
+
+
+def is_enabled():
+    return bool(_patches)
+
+
+def reset():
+    """Clears all counters."""
+    with _lock:
+        _counters.clear()
+
+
+def snapshot():
+    """Returns {function: {'calls', 'bytes', 'seconds', 'setup_seconds', 'transform_seconds'}}.
+
+    'bytes' is the length of the input text; setup is key-dependent precomputation such as
+    create_playfair_matrix, and transform is everything else (normalization plus the cipher loop).
+    """
+    with _lock:
+        return {
+            name: {
+                'calls': c['calls'],
+                'bytes': c['bytes'],
+                'seconds': c['total_ns'] / 1e9,
+                'setup_seconds': c['setup_ns'] / 1e9,
+                'transform_seconds': (c['total_ns'] - c['setup_ns']) / 1e9,
+            }
+            for name, c in _counters.items()
+        }
+
+
+import unittest
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.addCleanup(disable)
+        self.addCleanup(reset)
+
+    def test_counts_calls_bytes_and_setup(self):
+        events = []
+        enable(callback=events.append)
+        crytography_machine.playfair_square.cache_clear()
+        crytography_machine.rot13("HELLO")
+        crytography_machine.playfair_cipher("HIDE THE GOLD", "INSTRUMENTED")
+        crytography_machine.VigenereAutokeyCipher("KEY").encode("HELLO WORLD")
+        stats = snapshot()
+        self.assertEqual(stats['rot13']['calls'], 1)
+        self.assertNotIn('caesar_cipher', stats)  # Only the outermost entry point counts
+        self.assertEqual(stats['playfair_cipher']['bytes'], len("HIDE THE GOLD"))
+        self.assertGreater(stats['playfair_cipher']['setup_seconds'], 0)
+        self.assertEqual(stats['VigenereAutokeyCipher.encode']['bytes'], len("HELLO WORLD"))
+        self.assertEqual([e['function'] for e in events], ['rot13', 'playfair_cipher', 'VigenereAutokeyCipher.encode'])
+
+    def test_failing_callback_does_not_change_results(self):
+        def callback(event):
+            raise RuntimeError("metrics backend down")
+        enable(callback=callback)
+        self.assertEqual(crytography_machine.rot13("HELLO"), "URYYB")
+        with self.assertRaises(ValueError):
+            crytography_machine.four_square_cipher_decrypt("ABC", "KEY", "OTHER")  # The cipher's own error
+        self.assertEqual(snapshot()['rot13']['calls'], 1)
+
+    def test_disable_restores_originals(self):
+        import cli
+        original_encode = crytography_machine.VigenereAutokeyCipher.encode
+        original_stream = cli.VigenereStream
+        original = crytography_machine.vigenere_cipher
+        enable()
+        self.assertIsNot(crytography_machine.vigenere_cipher, original)
+        disable()
+        self.assertIs(crytography_machine.vigenere_cipher, original)
+        self.assertIs(crytography_machine.VigenereAutokeyCipher.encode, original_encode)
+        self.assertIs(cli.VigenereStream, original_stream)
+        crytography_machine.vigenere_cipher("HELLO", "KEY")
+        self.assertEqual(snapshot(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+import argparse
+import math
+import string
+import sys
+from array import array
+from collections import Counter
+
+from cryptanalysis import ENGLISH_FREQUENCIES, index_of_coincidence
+from numpy_backend import np
+
+CHUNK_SIZE = 1 << 20  # Letters counted per step; bounds the temporary arrays whatever the input size
+DEFAULT_SIZES = (1, 2, 4)  # Unigrams, bigrams and quadgrams
+# Maps ASCII letters of either case to their index 0-25; every other byte is deleted
+LETTER_CODES = bytes.maketrans((string.ascii_uppercase + string.ascii_lowercase).encode(), bytes(range(26)) * 2)
+NON_LETTERS = bytes(sorted(set(range(256)) - set(string.ascii_letters.encode())))
+
+
+def gram_code(gram):
+    """Integer code of an n-gram of letters, base 26: 'A' is 0, 'AB' is 1, 'BA' is 26."""
+    code = 0
+    for c in gram.upper():
+        code = code * 26 + string.ascii_uppercase.index(c)
+    return code
+
+
+def gram_text(code, n):
+    """The n letters of an n-gram code."""
+    letters = []
+    for _ in range(n):
+        code, i = divmod(code, 26)
+        letters.append(string.ascii_uppercase[i])
+    return ''.join(reversed(letters))
+
+
+def letter_indices(chunk):
+    """Turns a str or bytes-like chunk into bytes of letter indices 0-25, dropping everything else."""
+    if isinstance(chunk, str):
+        chunk = chunk.upper().encode('ascii', 'ignore')
+    return bytes(chunk).translate(LETTER_CODES, NON_LETTERS)
+
+
+class NgramStats:
+    """Streaming n-gram counts of the letters A-Z, kept in fixed-size integer arrays indexed by gram_code().
+
+    Feed any number of chunks with update(); n-grams are counted across chunk boundaries (and
+    across the non-letters between words), so the counts do not depend on how the text is split.
+    Memory stays at 26 ** n counters per size plus one chunk, however large the input.
+    """
+    def __init__(self, sizes=DEFAULT_SIZES):
+        self.sizes = tuple(sorted(set(sizes)))
+        if not self.sizes or self.sizes[0] < 1:
+            raise ValueError("N-gram sizes must be positive.")
+        self.counts = {n: self._zeros(26 ** n) for n in self.sizes}
+        self.letters = 0
+        self.tail = b''  # Last max(sizes) - 1 letter indices, the start of n-grams ending in the next chunk
+        self.head = b''  # First max(sizes) - 1 letter indices, the end of n-grams spanning a merge()
+
+    @staticmethod
+    def _zeros(size):
+        return np.zeros(size, dtype=np.int64) if np is not None else array('q', bytes(8 * size))
+
+    def update(self, chunk):
+        """Counts the letters of a str or bytes-like chunk."""
+        indices = letter_indices(chunk)
+        for i in range(0, len(indices), CHUNK_SIZE):
+            self._count(indices[i:i + CHUNK_SIZE])
+        return self
+
+    def _count(self, indices):
+        sequence = self.tail + indices
+        for n in self.sizes:
+            # Only the n-grams ending in this chunk; the earlier ones were counted with the previous chunk
+            window = sequence[max(0, len(self.tail) - (n - 1)):]
+            if len(window) >= n:
+                self._add(n, window)
+        self.letters += len(indices)
+        keep = self.sizes[-1] - 1
+        self.head = (self.head + indices)[:keep] if len(self.head) < keep else self.head
+        self.tail = sequence[max(0, len(sequence) - keep):]
+
+    def _add(self, n, window):
+        counts = self.counts[n]
+        grams = len(window) - n + 1
+        if np is not None:
+            letters = np.frombuffer(window, dtype=np.uint8).astype(np.int64)
+            codes = letters[:grams].copy()
+            for k in range(1, n):
+                codes = codes * 26 + letters[k:k + grams]
+            if grams * 64 < len(counts):
+                np.add.at(counts, codes, 1)  # Small update: touch only its grams, not all 26 ** n counters
+            else:
+                counts += np.bincount(codes, minlength=len(counts))
+            return
+        for gram, count in Counter(zip(*(window[k:k + grams] for k in range(n)))).items():
+            code = 0
+            for i in gram:
+                code = code * 26 + i
+            counts[code] += count
+
+    def merge(self, other):
+        """Adds the counts of stats gathered on the text that follows, e.g. by another process."""
+        if other.sizes != self.sizes:
+            raise ValueError("Cannot merge statistics of different n-gram sizes.")
+        for n in self.sizes:
+            # The n-grams spanning the junction were seen by neither side
+            junction = self.tail[max(0, len(self.tail) - (n - 1)):] + other.head[:n - 1]
+            if self.letters and other.letters and len(junction) >= n:
+                self._add(n, junction)
+            counts = self.counts[n]
+            if np is not None:
+                counts += other.counts[n]
+            else:
+                for i, count in enumerate(other.counts[n]):
+                    counts[i] += count
+        keep = self.sizes[-1] - 1
+        self.head = (self.head + other.head)[:keep]
+        self.tail = (self.tail + other.tail)[max(0, len(self.tail) + len(other.tail) - keep):]
+        self.letters += other.letters
+        return self
+
+    def count(self, gram):
+        """How many times an n-gram such as 'TH' occurred."""
+        return int(self.counts[len(gram)][gram_code(gram)])
+
+    def total(self, n=1):
+        """Number of n-grams counted: letters - n + 1."""
+        return max(0, self.letters - n + 1)
+
+    def frequencies(self, n=1):
+        """Relative frequency of every n-gram, indexed by gram_code()."""
+        total = self.total(n)
+        return [int(c) / total if total else 0.0 for c in self.counts[n]]
+
+    def index_of_coincidence(self, n=1):
+        """Probability that two n-grams drawn from the text are equal; 1/26 for random letters, ~0.067 for English."""
+        return index_of_coincidence([int(c) for c in self.counts[n]])
+
+    def entropy(self, n=1):
+        """Shannon entropy in bits per n-gram; log2(26) = 4.70 for random letters, about 4.18 for English."""
+        total = self.total(n)
+        if not total:
+            return 0.0
+        if np is not None:
+            p = self.counts[n][self.counts[n] > 0] / total
+            return float(-(p * np.log2(p)).sum())
+        return -sum(c / total * math.log2(c / total) for c in self.counts[n] if c)
+
+    def chi_squared(self, expected=ENGLISH_FREQUENCIES):
+        """Chi-squared distance of the letter counts from expected letter frequencies (English by default)."""
+        total = self.total(1)
+        return sum((int(c) - total * f) ** 2 / (total * f) for c, f in zip(self.counts[1], expected)) if total else 0.0
+
+    def most_common(self, n=1, k=10):
+        """The k most frequent n-grams as (gram, count) pairs."""
+        counts = self.counts[n]
+        if np is not None:
+            top = np.argsort(counts)[::-1][:k]
+        else:
+            top = sorted(range(len(counts)), key=counts.__getitem__, reverse=True)[:k]
+        return [(gram_text(int(code), n), int(counts[code])) for code in top if counts[code]]
+
+
+def ngram_stats(chunks, sizes=DEFAULT_SIZES):
+    """N-gram statistics of a text given as an iterable of str or bytes chunks, in one pass."""
+    stats = NgramStats(sizes)
+    for chunk in chunks:
+        stats.update(chunk)
+    return stats
+
+
+def file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Reads a file as bytes, one chunk at a time."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def file_stats(path, sizes=DEFAULT_SIZES, chunk_size=CHUNK_SIZE):
+    """N-gram statistics of a file of any size, read in chunks of chunk_size bytes."""
+    return ngram_stats(file_chunks(path, chunk_size), sizes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming letter n-gram statistics (IoC, entropy, top n-grams).")
+    parser.add_argument('files', nargs='*', help="input files (default: standard input)")
+    parser.add_argument('--top', type=int, default=5, help="most common n-grams to list per size")
+    args = parser.parse_args(argv)
+    sources = args.files or ['-']
+    for path in sources:
+        if path == '-':
+            stats = ngram_stats(iter(lambda: sys.stdin.buffer.read(CHUNK_SIZE), b''))
+        else:
+            stats = file_stats(path)
+        print(f"{path}: {stats.letters} letters, chi-squared vs English {stats.chi_squared():.1f}")
+        for n in stats.sizes:
+            grams = ' '.join(f"{gram}:{count}" for gram, count in stats.most_common(n, args.top))
+            print(f"  {n}-grams  IoC {stats.index_of_coincidence(n):.5f}  entropy {stats.entropy(n):.3f} bits  {grams}")
+    return 0
+
+
+import unittest
+
+
+class TestNgramStats(unittest.TestCase):
+    TEXT = "It was the best of times, it was the worst of times; it was the age of wisdom. " * 7
+
+    def reference(self, n):
+        letters = ''.join(c for c in self.TEXT.upper() if c in string.ascii_uppercase)
+        return Counter(letters[i:i + n] for i in range(len(letters) - n + 1))
+
+    def test_counts_match_counter_across_chunk_boundaries(self):
+        import random
+        import numpy_backend
+        from unittest import mock
+        rng = random.Random(1)
+        for numpy_module in {np, None}:
+            with mock.patch(__name__ + '.np', numpy_module), mock.patch(__name__ + '.CHUNK_SIZE', 5):
+                cuts = sorted(rng.sample(range(len(self.TEXT)), 40))
+                chunks = [self.TEXT[i:j] for i, j in zip([0] + cuts, cuts + [len(self.TEXT)])]
+                stats = ngram_stats(chunks)
+                for n in DEFAULT_SIZES:
+                    reference = self.reference(n)
+                    self.assertEqual(stats.total(n), sum(reference.values()))
+                    self.assertEqual({gram: stats.count(gram) for gram in reference}, dict(reference))
+                self.assertEqual(stats.most_common(4, 1)[0][1], 21)  # TWAS, WAST and ASTH tie
+        from cryptanalysis import letter_counts, letters_only
+        self.assertAlmostEqual(stats.index_of_coincidence(),
+                               index_of_coincidence(letter_counts(letters_only(self.TEXT))))
+        self.assertAlmostEqual(ngram_stats([string.ascii_uppercase * 10]).entropy(), math.log2(26))
+
+    def test_many_small_updates(self):
+        import time
+        lines = self.TEXT.split('. ') * 250  # About 2000 updates
+        start = time.perf_counter()
+        stats = ngram_stats(lines)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(list(stats.counts[4]), list(ngram_stats(['. '.join(lines)]).counts[4]))
+        self.assertLess(elapsed, 0.5)  # Each update costs its own length, not a pass over 26 ** 4 counters
+
+    def test_merge_and_files(self):
+        import os
+        import tempfile
+        whole = ngram_stats([self.TEXT])
+        middle = len(self.TEXT) // 2
+        merged = ngram_stats([self.TEXT[:middle]]).merge(ngram_stats([self.TEXT[middle:]]))
+        for n in DEFAULT_SIZES:
+            self.assertEqual(list(merged.counts[n]), list(whole.counts[n]))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'corpus.txt')
+            with open(path, 'w') as f:
+                f.write(self.TEXT)
+            self.assertEqual(list(file_stats(path, chunk_size=7).counts[4]), list(whole.counts[4]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import string
+
+import crytography_machine
+
+try:
+    import numpy as np
+except ImportError:  # The pure-Python ciphers stay the fallback
+    np = None
+
+HAVE_NUMPY = np is not None
+
+
+def _to_codes(text):
+    """Converts text to an array of code points (uint8 for ASCII, uint32 otherwise)."""
+    if text.isascii():
+        return np.frombuffer(text.encode('ascii'), dtype=np.uint8).copy()
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32).copy()
+
+
+def _from_codes(codes):
+    """Converts an array built by _to_codes() back to text."""
+    if codes.dtype == np.uint8:
+        return codes.tobytes().decode('ascii')
+    return codes.tobytes().decode('utf-32-le', 'surrogatepass')
+
+
+def _key_indices(key):
+    """Turns a key into a uint8 array of alphabet indices, rejecting non-letters like the reference ciphers."""
+    if not key:
+        raise ValueError("key must contain at least one letter")
+    alphabet = string.ascii_uppercase
+    return np.array([alphabet.index(k) for k in key], dtype=np.uint8)
+
+
+def _tile(key, length, offset=0):
+    """Repeats key to length, starting at key position offset."""
+    key = np.roll(key, -(offset % len(key)))
+    reps = -(-length // len(key))
+    return np.broadcast_to(key, (reps, len(key))).reshape(-1)[:length]
+
+
+def _letter_mask(codes):
+    return (codes >= 65) & (codes <= 90)
+
+
+def caesar_cipher(text, shift, encrypt=True):
+    """Vectorized Caesar cipher, identical to crytography_machine.caesar_cipher."""
+    if np is None:
+        return crytography_machine.caesar_cipher(text, shift, encrypt)
+    shift = (shift if encrypt else -shift) % 26
+    codes = _to_codes(crytography_machine.upper_text(text))
+    mask = _letter_mask(codes)
+    letters = codes[mask].astype(np.uint8) - 65
+    codes[mask] = (letters + shift) % 26 + 65
+    return _from_codes(codes)
+
+
+def rot13(text):
+    """Vectorized ROT13."""
+    return caesar_cipher(text, 13)
+
+
+def vigenere_cipher(text, key, encrypt=True, offset=0):
+    """Vectorized Vigenère cipher, identical to crytography_machine.vigenere_cipher.
+
+    offset is the key position of the first letter, for callers processing a text in pieces.
+    """
+    if np is None:
+        return crytography_machine.vigenere_cipher(text, key, encrypt)
+    shifts = _key_indices(key.upper())  # Checked first: the reference rejects a bad key whatever the text
+    codes = _to_codes(crytography_machine.upper_text(text))
+    mask = _letter_mask(codes)
+    letters = codes[mask].astype(np.uint8) - 65
+    if letters.size == 0:
+        return _from_codes(codes)
+    if not encrypt:
+        shifts = (26 - shifts) % 26
+    codes[mask] = (letters + _tile(shifts, letters.size, offset)) % 26 + 65
+    return _from_codes(codes)
+
+
+def beaufort_cipher(text, key, offset=0):
+    """Vectorized Beaufort cipher, identical to crytography_machine.beaufort_cipher."""
+    if np is None:
+        return crytography_machine.beaufort_cipher(text, key)
+    key = _key_indices(key.upper().replace(' ', ''))
+    text = text.no_spaces if isinstance(text, crytography_machine.NormalizedText) else text.upper().replace(' ', '')
+    codes = _to_codes(text)
+    if codes.size == 0:
+        return ''
+    mask = _letter_mask(codes)
+    tiled = _tile(key, codes.size, offset)[mask]
+    letters = codes[mask].astype(np.uint8) - 65
+    codes[mask] = (tiled + 26 - letters) % 26 + 65
+    return _from_codes(codes)
+
+
+import unittest
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestNumpyBackend(unittest.TestCase):
+    TEXT = "Attack at dawn, hold the bridge! Straße über Zürich 123."
+
+    def test_caesar_cipher(self):
+        for shift in (-30, -3, 0, 3, 13, 26, 40):
+            self.assertEqual(caesar_cipher(self.TEXT, shift), crytography_machine.caesar_cipher(self.TEXT, shift))
+        self.assertEqual(rot13("URYYB"), "HELLO")
+
+    def test_vigenere_cipher(self):
+        for encrypt in (True, False):
+            self.assertEqual(vigenere_cipher(self.TEXT, "LEMON", encrypt),
+                             crytography_machine.vigenere_cipher(self.TEXT, "LEMON", encrypt))
+        self.assertEqual(vigenere_cipher("ATTACK", "LEMON"), "LXFOPV")
+
+    def test_beaufort_cipher(self):
+        self.assertEqual(beaufort_cipher(self.TEXT, "KEY"), crytography_machine.beaufort_cipher(self.TEXT, "KEY"))
+        self.assertEqual(beaufort_cipher("DANZQ", "KEY"), "HELLO")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,375 @@
+import os
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, repeat
+from multiprocessing.shared_memory import SharedMemory
+
+import crytography_machine as cm
+from byte_ciphers import beaufort_into, caesar_into, vigenere_into
+
+MIN_CHUNK = 4 << 20  # Bytes per task; inputs no longer than one chunk are transformed in-process
+SPLITTABLE = ['caesar', 'rot13', 'vigenere', 'beaufort', 'playfair', 'two-square', 'four-square', 'rail-fence']
+NON_LETTERS = bytes(b for b in range(256) if not chr(b).isascii() or not chr(b).isalpha())
+# text.upper().replace(' ', '').replace('J', 'I') for bytes: translate with this table, deleting b' '
+SQUARE_NORMALIZE = bytes.maketrans((string.ascii_lowercase + 'J').encode(),
+                                   (string.ascii_uppercase.replace('J', 'I') + 'I').encode())
+DOUBLED = re.compile(rb'(?=(.)\1)', re.DOTALL)
+
+
+class _Runner:
+    """Runs chunk functions on buffers, in worker processes through shared memory or in-process."""
+    def __init__(self, workers):
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.blocks = []
+
+    def alloc(self, size):
+        if self.pool is None:
+            return bytearray(size)
+        block = SharedMemory(create=True, size=max(size, 1))
+        self.blocks.append(block)
+        return block
+
+    def view(self, buffer, size):
+        return (buffer.buf if isinstance(buffer, SharedMemory) else memoryview(buffer))[:size]
+
+    def map(self, func, buffers, tasks):
+        if self.pool is None:
+            views = [memoryview(b) for b in buffers]
+            return [func(*views, *task) for task in tasks]
+        names = [b.name for b in buffers]
+        return list(self.pool.map(_call, repeat(func), repeat(names), tasks))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def _call(func, names, task):
+    """Worker side of _Runner.map: attaches the shared blocks by name and runs func on them."""
+    blocks = [SharedMemory(name) for name in names]
+    try:
+        return func(*[b.buf for b in blocks], *task)
+    finally:
+        for b in blocks:
+            b.close()
+
+
+def _caesar_chunk(buf, start, stop, shift, encrypt):
+    view = buf[start:stop]
+    caesar_into(view, view, shift, encrypt)
+
+
+def _count_letters(buf, start, stop):
+    return len(buf[start:stop].tobytes().translate(None, NON_LETTERS))
+
+
+def _vigenere_chunk(buf, start, stop, key, encrypt, offset):
+    view = buf[start:stop]
+    vigenere_into(view, view, key, encrypt, offset)
+
+
+def _count_spaces(buf, start, stop):
+    return buf[start:stop].tobytes().count(b' ')
+
+
+def _beaufort_chunk(src, dst, start, stop, key, out_start):
+    # Beaufort advances its key on every kept byte, so the output position is also the key offset
+    beaufort_into(src[start:stop], dst[out_start:], key, out_start)
+
+
+def _rail_chunk(src, dst, first_cycle, last_cycle, rail_starts, num_rails, length, encrypt):
+    """Moves the text positions in zigzag cycles [first_cycle, last_cycle) to or from their rails."""
+    cycle = 2 * (num_rails - 1)
+    lo, hi = first_cycle * cycle, min(last_cycle * cycle, length)
+    text, rails = (src, dst) if encrypt else (dst, src)
+    for row in range(num_rails):
+        edge = row == 0 or row == num_rails - 1
+        down = text[lo + row:hi:cycle]
+        start = rail_starts[row] + first_cycle * (1 if edge else 2)
+        if edge:
+            rail = rails[start:start + len(down)]
+            if encrypt:
+                rail[:] = down
+            else:
+                down[:] = rail
+            continue
+        up = text[lo + cycle - row:hi:cycle]
+        rail = rails[start:start + len(down) + len(up)]  # Down and up positions alternate along a middle rail
+        if encrypt:
+            rail[0::2] = down
+            rail[1::2] = up
+        else:
+            down[:] = rail[0::2]
+            up[:] = rail[1::2]
+
+
+def _square_digraphs(cipher, key, key2, encrypt):
+    if cipher == 'playfair':
+        return cm.playfair_square(key).playfair_digraphs(encrypt)
+    if cipher == 'two-square':
+        return cm.two_square_digraphs(key, key2)
+    return cm.four_square_digraphs(key, key2, encrypt)
+
+
+def _normalize_chunk(buf, start, stop, insertions):
+    """Normalizes a chunk in place; returns (length, first, last, transfer).
+
+    transfer[q] is (q after the chunk, 'X' insertions) when digraphs start at local positions
+    of parity q, counting doubled letters inside the chunk only.
+    """
+    text = buf[start:stop].tobytes().translate(SQUARE_NORMALIZE, b' ')
+    buf[start:start + len(text)] = text
+    if not text:
+        return 0, None, None, None
+    transfer = None
+    if insertions:
+        doubled = [m.start() for m in DOUBLED.finditer(text)]
+        transfer = []
+        for parity in (0, 1):
+            inserted = 0
+            for position in doubled:
+                if position % 2 == parity:  # A digraph starts on a doubled letter: 'X' goes in, parity flips
+                    inserted += 1
+                    parity ^= 1
+            transfer.append((parity, inserted))
+    return len(text), text[:1], text[-1:], transfer
+
+
+def _square_chunk(src, dst, start, length, skip, lookahead, out_start, cipher, key, key2, encrypt, insertions):
+    """Transforms the digraphs starting in a normalized chunk; lookahead is the next chunk's first letter."""
+    text = src[start + skip:start + length].tobytes().decode('latin-1') + (lookahead or '')
+    stop = length - skip
+    digraphs = _square_digraphs(cipher, key, key2, encrypt)
+    if insertions:
+        pairs = cm.playfair_pairs(text, stop)
+    else:
+        if len(text) % 2:
+            text += 'X'  # Only the last chunk of an odd-length Four-Square plaintext gets here
+        pairs = [text[i:i + 2] for i in range(0, stop, 2)]
+    out = ''.join(map(digraphs.__getitem__, pairs)).encode('latin-1')
+    dst[out_start:out_start + len(out)] = out
+    return len(out)
+
+
+def _unpad_chunk(plain, dst, start, stop, length):
+    """Two-Square padding removal: drops each 'X' between two equal letters; returns bytes kept."""
+    segment = plain[start:stop].tobytes()
+    kept = []
+    last = 0
+    i = segment.find(b'X')
+    while i != -1:
+        position = start + i
+        if 0 < position < length - 1 and plain[position - 1] == plain[position + 1]:
+            kept.append(segment[last:i])
+            last = i + 1
+        i = segment.find(b'X', i + 1)
+    kept.append(segment[last:])
+    out = b''.join(kept)
+    dst[start:start + len(out)] = out
+    return len(out)
+
+
+def _ranges(length, chunk_size):
+    return [(i, min(i + chunk_size, length)) for i in range(0, length, chunk_size)]
+
+
+def _substitute(runner, src, length, cipher, encrypt, key, shift, chunk_size):
+    chunks = _ranges(length, chunk_size)
+    if cipher in ('caesar', 'rot13'):
+        shift = 13 if cipher == 'rot13' else shift
+        runner.map(_caesar_chunk, [src], [(a, b, shift, encrypt) for a, b in chunks])
+        return [runner.view(src, length)]
+    if cipher == 'vigenere':
+        cm.vigenere_tables(key)  # Reject a bad key before starting any work
+        offsets = accumulate(runner.map(_count_letters, [src], chunks), initial=0)
+        runner.map(_vigenere_chunk, [src], [(a, b, key, encrypt, o) for (a, b), o in zip(chunks, offsets)])
+        return [runner.view(src, length)]
+    cm.beaufort_tables(key)
+    spaces = list(accumulate(runner.map(_count_spaces, [src], chunks), initial=0))
+    dst = runner.alloc(length - spaces[-1])
+    runner.map(_beaufort_chunk, [src, dst], [(a, b, key, a - s) for (a, b), s in zip(chunks, spaces)])
+    return [runner.view(dst, length - spaces[-1])]
+
+
+def _rail_layout(length, num_rails):
+    """Where each rail starts in the ciphertext, and the number of zigzag cycles covering length."""
+    cycle = 2 * (num_rails - 1)
+    sizes = [len(range(row, length, cycle)) + (len(range(cycle - row, length, cycle)) if 0 < row < num_rails - 1 else 0)
+             for row in range(num_rails)]
+    return list(accumulate(sizes, initial=0)), -(-length // cycle)
+
+
+def _rail_fence(runner, src, length, num_rails, encrypt, chunk_size):
+    if num_rails <= 1:
+        return [runner.view(src, length)]
+    rail_starts, cycles = _rail_layout(length, num_rails)
+    step = max(1, chunk_size // (2 * (num_rails - 1)))
+    dst = runner.alloc(length)
+    runner.map(_rail_chunk, [src, dst], [(c, min(c + step, cycles), rail_starts, num_rails, length, encrypt)
+                                         for c in range(0, cycles, step)])
+    return [runner.view(dst, length)]
+
+
+def _square_plan(found, cipher, encrypt, key, key2, insertions):
+    """Turns the _normalize_chunk() results of the non-empty chunks into _square_chunk() tasks.
+
+    found holds (start, length, first, last, transfer) per chunk. Walks the chunks once to find
+    where each one's first digraph starts and how long its output is; returns (tasks, output length).
+    """
+    total = sum(f[1] for f in found)
+    if total % 2 and not insertions and not (cipher == 'four-square' and encrypt):
+        name = 'Two-Square' if cipher == 'two-square' else 'Four-Square'
+        raise ValueError(f"{name} ciphertext must have an even number of letters.")
+    tasks = []
+    out_start = 0
+    at_pair_start = True
+    for k, (start, size, first, last, transfer) in enumerate(found):
+        lookahead = found[k + 1][2] if k + 1 < len(found) else None
+        parity = 0 if at_pair_start else 1
+        inserted = 0
+        if insertions:
+            parity, inserted = transfer[parity]
+            if lookahead == last and (size - 1) % 2 == parity:
+                inserted += 1
+                parity ^= 1
+        skip = 0 if at_pair_start else 1
+        at_pair_start = size % 2 == parity
+        consumed = max(size + (0 if at_pair_start else 1) - skip, 0)
+        tasks.append((start, size, skip, lookahead and lookahead.decode('latin-1'), out_start,
+                      cipher, key, key2, encrypt, insertions))
+        out_start += consumed + inserted
+    return tasks, out_start
+
+
+def _square(runner, src, length, cipher, encrypt, key, key2, chunk_size):
+    insertions = cipher == 'playfair' or (cipher == 'two-square' and encrypt)
+    _square_digraphs(cipher, key, key2, encrypt)  # Reject a bad key before starting any work
+    chunks = _ranges(length, chunk_size)
+    found = [(a, *info) for (a, _), info in zip(chunks, runner.map(_normalize_chunk, [src],
+                                                                        [(a, b, insertions) for a, b in chunks]))]
+    tasks, out_start = _square_plan([f for f in found if f[1]], cipher, encrypt, key, key2, insertions)
+
+    dst = runner.alloc(out_start)
+    runner.map(_square_chunk, [src, dst], tasks)
+    out = runner.view(dst, out_start)
+    if cipher == 'two-square' and not encrypt:
+        ranges = _ranges(out_start, chunk_size)
+        kept = runner.map(_unpad_chunk, [dst, src], [(a, b, out_start) for a, b in ranges])
+        view = runner.view(src, length)
+        return [view[a:a + n] for (a, _), n in zip(ranges, kept)]
+    if not encrypt and out_start and out[-1] == ord('X'):
+        out = out[:-1]
+    return [out]
+
+
+def parallel_transform(cipher, data, encrypt=True, key=None, key2=None, shift=None, rails=None,
+                       workers=None, chunk_size=None):
+    """Encrypts or decrypts data with a position-independent cipher, using several processes.
+
+    data may be str or any bytes-like object; the result has the same type (bytes for buffers).
+    The input is split into chunks that worker processes transform through shared memory, and
+    the pieces are joined back in order. Results equal the one-shot functions for ASCII input;
+    non-ASCII str input is transformed in-process. Autokey cannot be split, since every key
+    letter depends on all the text before it.
+    """
+    if cipher not in SPLITTABLE:
+        raise ValueError(f"The {cipher} cipher cannot be split into independent chunks.")
+    if cipher in ('vigenere', 'beaufort', 'playfair', 'two-square', 'four-square') and key is None:
+        raise ValueError(f"The {cipher} cipher needs a key.")
+    if cipher in ('two-square', 'four-square') and key2 is None:
+        raise ValueError(f"The {cipher} cipher needs a second key.")
+    if (cipher == 'caesar' and shift is None) or (cipher == 'rail-fence' and rails is None):
+        raise ValueError(f"The {cipher} cipher needs {'a shift' if cipher == 'caesar' else 'a number of rails'}.")
+    if isinstance(data, str):
+        if not data.isascii():
+            from cli import make_stream
+            stream = make_stream(cipher, encrypt, key, key2, shift, rails)
+            return stream.update(data) + stream.finalize()
+        return parallel_transform(cipher, data.encode('ascii'), encrypt, key, key2, shift, rails,
+                                  workers, chunk_size).decode('ascii')
+
+    with memoryview(data) as raw, raw.cast('B') as raw:
+        length = len(raw)
+        workers = workers or os.cpu_count()
+        chunk_size = chunk_size or max(MIN_CHUNK, -(-length // (workers * 4)))
+        runner = _Runner(workers if length > chunk_size else 1)
+        try:
+            src = runner.alloc(length)
+            runner.view(src, length)[:] = raw
+            if cipher == 'rail-fence':
+                pieces = _rail_fence(runner, src, length, rails, encrypt, chunk_size)
+            elif cipher in ('playfair', 'two-square', 'four-square'):
+                pieces = _square(runner, src, length, cipher, encrypt, key, key2, chunk_size)
+            else:
+                pieces = _substitute(runner, src, length, cipher, encrypt, key, shift, chunk_size)
+            result = b''.join(pieces)
+            for piece in pieces:
+                piece.release()
+            return result
+        finally:
+            runner.close()
+
+
+def parallel_encrypt(cipher, data, **options):
+    return parallel_transform(cipher, data, True, **options)
+
+
+def parallel_decrypt(cipher, data, **options):
+    return parallel_transform(cipher, data, False, **options)
+
+
+import unittest
+
+
+class TestParallel(unittest.TestCase):
+    TEXT = ("Attack at dawn; hold the bridge until the balloon goes up. Too many cooks! "
+            "Jolly jumping jackals jeer at the moon\n" * 7)
+
+    def check(self, cipher, expected, data=None, decrypted=None, **options):
+        data = self.TEXT if data is None else data
+        for chunk_size in (5, 16, 61):
+            encrypted = parallel_encrypt(cipher, data, workers=2, chunk_size=chunk_size, **options)
+            self.assertEqual(encrypted, expected, (cipher, chunk_size))
+            if decrypted is not None:
+                self.assertEqual(parallel_decrypt(cipher, encrypted, workers=2, chunk_size=chunk_size, **options),
+                                 decrypted, (cipher, chunk_size))
+
+    def test_substitution_and_rail_fence(self):
+        text = self.TEXT
+        self.check('caesar', cm.caesar_cipher(text, 3), shift=3, decrypted=text.upper())
+        self.check('rot13', cm.rot13(text))
+        self.check('vigenere', cm.vigenere_cipher(text, "LEMON"), key="LEMON", decrypted=text.upper())
+        self.check('beaufort', cm.beaufort_cipher(text, "FORTIFY"), key="FORTIFY")
+        for rails in (1, 2, 3, 7):
+            self.check('rail-fence', cm.rail_fence_cipher(text, rails), rails=rails, decrypted=text)
+        self.check('vigenere', cm.vigenere_cipher(text, "KEY").encode(), data=text.encode(), key="KEY")
+
+    def test_square_ciphers(self):
+        letters = ''.join(c for c in self.TEXT if c.isalpha() or c == ' ')
+        for text in (letters, letters + "Z", "BALLOON" * 9, "AAAAAAAAA"):
+            encrypted = cm.playfair_cipher(text, "MONARCHY")
+            self.check('playfair', encrypted, data=text, key="MONARCHY",
+                       decrypted=cm.playfair_cipher(encrypted, "MONARCHY", encrypt=False))
+            encrypted = cm.two_square_cipher_encrypt(text, "EXAMPLE", "KEYWORD")
+            self.check('two-square', encrypted, data=text, key="EXAMPLE", key2="KEYWORD",
+                       decrypted=cm.two_square_cipher_decrypt(encrypted, "EXAMPLE", "KEYWORD"))
+            encrypted = cm.four_square_cipher_encrypt(text, "EXAMPLE", "KEYWORD")
+            self.check('four-square', encrypted, data=text, key="EXAMPLE", key2="KEYWORD",
+                       decrypted=cm.four_square_cipher_decrypt(encrypted, "EXAMPLE", "KEYWORD"))
+
+    def test_rejects_unsplittable_and_bad_input(self):
+        with self.assertRaises(ValueError):
+            parallel_encrypt('autokey', "HELLO", key="KEY")
+        with self.assertRaises(ValueError):
+            parallel_decrypt('four-square', "ABC" * 21, key="EXAMPLE", key2="KEYWORD", workers=2, chunk_size=8)
+        with self.assertRaises(KeyError):
+            parallel_encrypt('playfair', "HELLO, WORLD" * 10, key="KEY", workers=2, chunk_size=8)
+        self.assertEqual(parallel_encrypt('vigenere', "Ünïcode", key="KEY"), cm.vigenere_cipher("Ünïcode", "KEY"))
+
+
+if __name__ == "__main__":
+    unittest.main()
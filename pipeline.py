@@ -0,0 +1,271 @@
+import string
+from collections import namedtuple
+from functools import lru_cache
+from math import lcm
+
+from cli import CIPHERS, make_stream
+from crytography_machine import (beaufort_table, beaufort_translate, rail_fence_permutation, shift_table,
+                                 stream_chunks, vigenere_translate)
+
+MAX_FUSED_PERIOD = 4096  # Longest combined key built when fusing periodic substitutions
+
+# Letter x at position i becomes sign * x + offsets[i % len(offsets)] (mod 26). Positions count
+# letters (Caesar, Vigenère) or every character once spaces are dropped (Beaufort).
+Substitution = namedtuple('Substitution', 'sign offsets by_letters drop_spaces')
+# Rail fence passes applied in order, as (num_rails, encrypt) pairs
+Permutation = namedtuple('Permutation', 'passes')
+# Any other cipher, run as its stream; spec holds make_stream() arguments
+Stage = namedtuple('Stage', 'spec')
+
+
+def _key_offsets(key, sign=1):
+    alphabet = string.ascii_uppercase
+    return tuple(sign * alphabet.index(k) % 26 for k in key)
+
+
+def lower(stage):
+    """Turns one stage spec, e.g. {'cipher': 'vigenere', 'key': 'LEMON'}, into a plan step (or None)."""
+    spec = dict(stage)
+    cipher = spec.pop('cipher', None)
+    if cipher not in CIPHERS:
+        raise ValueError(f"Unknown cipher: {cipher}")
+    encrypt = spec.pop('encrypt', True)
+    unknown = set(spec) - {'key', 'key2', 'shift', 'rails'}
+    if unknown:
+        raise ValueError(f"Unknown option for the {cipher} cipher: {sorted(unknown)[0]}")
+    make_stream(cipher, encrypt, **spec)  # Reject missing or invalid keys up front
+    sign = 1 if encrypt else -1
+    if cipher == 'caesar':
+        return Substitution(1, (sign * spec['shift'] % 26,), True, False)
+    if cipher == 'rot13':
+        return Substitution(1, (13,), True, False)
+    if cipher == 'vigenere':
+        return Substitution(1, _key_offsets(spec['key'].upper(), sign) or (0,), True, False)
+    if cipher == 'beaufort':
+        key = spec['key'].upper().replace(' ', '')
+        if not key:
+            return Substitution(1, (0,), False, True)  # Only upper-cases and drops spaces
+        return Substitution(-1, _key_offsets(key), False, True)
+    if cipher == 'rail-fence':
+        return Permutation(((spec['rails'], encrypt),)) if spec['rails'] > 1 else None
+    return Stage(dict(spec, cipher=cipher, encrypt=encrypt))
+
+
+def _fuse(first, second):
+    """Returns one Substitution doing first then second, or None when their positions do not line up."""
+    periodic = [s for s in (first, second) if len(s.offsets) > 1]
+    if len({s.by_letters for s in periodic}) > 1:
+        return None  # Letter positions and character positions drift apart at punctuation
+    period = lcm(len(first.offsets), len(second.offsets))
+    if period > MAX_FUSED_PERIOD:
+        return None
+    offsets = tuple((second.sign * first.offsets[i % len(first.offsets)] + second.offsets[i % len(second.offsets)]) % 26
+                    for i in range(period))
+    by_letters = periodic[0].by_letters if periodic else True
+    return Substitution(first.sign * second.sign, offsets, by_letters, first.drop_spaces or second.drop_spaces)
+
+
+def _commutes(step):
+    """A Caesar-like substitution acts on every character alike, so it can move past a transposition."""
+    return isinstance(step, Substitution) and len(step.offsets) == 1 and not step.drop_spaces
+
+
+def optimize(plan):
+    """Fuses adjacent substitutions and adjacent transpositions; Caesar shifts move past transpositions to fuse."""
+    out = []
+    for step in plan:
+        if step is None:
+            continue
+        if _commutes(step):
+            i = len(out)
+            while i > 0 and isinstance(out[i - 1], Permutation):
+                i -= 1
+            if 0 < i < len(out) and isinstance(out[i - 1], Substitution):
+                fused = _fuse(out[i - 1], step)
+                if fused is not None:
+                    out[i - 1] = fused
+                    continue
+        if out and isinstance(step, Substitution) and isinstance(out[-1], Substitution):
+            fused = _fuse(out[-1], step)
+            if fused is not None:
+                out[-1] = fused
+                continue
+        if out and isinstance(step, Permutation) and isinstance(out[-1], Permutation):
+            out[-1] = Permutation(out[-1].passes + step.passes)
+            continue
+        out.append(step)
+    return out
+
+
+def invert(plan):
+    """Returns the plan that undoes plan: the steps reversed, each one inverted."""
+    inverse = []
+    for step in reversed(plan):
+        if isinstance(step, Substitution):
+            # y = s * x + o  =>  x = s * y - s * o
+            inverse.append(step._replace(offsets=tuple(-step.sign * o % 26 for o in step.offsets)))
+        elif isinstance(step, Permutation):
+            inverse.append(Permutation(tuple((rails, not encrypt) for rails, encrypt in reversed(step.passes))))
+        else:
+            inverse.append(Stage(dict(step.spec, encrypt=not step.spec['encrypt'])))
+    return inverse
+
+
+@lru_cache(maxsize=64)
+def permutation(length, passes):
+    """Composes rail fence passes into one order: output[j] = text[order[j]], computed once per length."""
+    order = None
+    for num_rails, encrypt in passes:
+        step = rail_fence_permutation(length, num_rails, encrypt)
+        order = step if order is None else list(map(order.__getitem__, step))
+    return order
+
+
+class SubstitutionStream:
+    """Runs a (possibly fused) Substitution in one translate pass per chunk, carrying the key position."""
+    def __init__(self, step):
+        alphabet = string.ascii_uppercase
+        if step.sign == 1:
+            self.tables = [shift_table(o) for o in step.offsets]
+        else:
+            self.tables = [beaufort_table(alphabet[o]) for o in step.offsets]
+        self.step = step
+        self.position = 0
+
+    def update(self, chunk):
+        text = chunk.upper()
+        if self.step.drop_spaces:
+            text = text.replace(' ', '')
+        if self.step.by_letters:
+            out, consumed = vigenere_translate(text, self.tables, self.position)
+        else:
+            out, consumed = beaufort_translate(text, self.tables, self.position), len(text)
+        self.position = (self.position + consumed) % len(self.tables)
+        return out
+
+    def finalize(self):
+        return ''
+
+
+class PermutationStream:
+    """Applies several rail fence passes as one precomputed permutation once the whole text is in."""
+    def __init__(self, step):
+        self.passes = step.passes
+        self.chunks = []
+
+    def update(self, chunk):
+        self.chunks.append(chunk)
+        return ''
+
+    def finalize(self):
+        text = ''.join(self.chunks)
+        self.chunks = []
+        return ''.join(map(text.__getitem__, permutation(len(text), self.passes)))
+
+
+class PipelineStream:
+    """update()/finalize() stream running every step of a plan on each chunk in turn."""
+    def __init__(self, plan):
+        self.streams = [_step_stream(step) for step in plan]
+
+    def update(self, chunk):
+        for stream in self.streams:
+            if not chunk:
+                break
+            chunk = stream.update(chunk)
+        return chunk
+
+    def finalize(self):
+        carry = ''
+        for stream in self.streams:
+            carry = (stream.update(carry) if carry else '') + stream.finalize()
+        return carry
+
+
+def _step_stream(step):
+    if isinstance(step, Substitution):
+        return SubstitutionStream(step)
+    if isinstance(step, Permutation):
+        return PermutationStream(step)
+    return make_stream(**step.spec)
+
+
+class Pipeline:
+    """An ordered chain of cipher stages, optimized once and run in a single streaming pass.
+
+    Stages are dicts with the CLI option names, e.g.
+    Pipeline([{'cipher': 'vigenere', 'key': 'LEMON'}, {'cipher': 'rail-fence', 'rails': 3},
+              {'cipher': 'caesar', 'shift': 3}]); a stage may add 'encrypt': False.
+    decrypt() runs the inverted plan.
+    """
+    def __init__(self, stages, fuse=True):
+        self.stages = [dict(stage) for stage in stages]
+        plan = [lower(stage) for stage in self.stages]
+        self.plan = optimize(plan) if fuse else [step for step in plan if step is not None]
+        self.inverse = invert(self.plan)
+
+    def encryptor(self):
+        return PipelineStream(self.plan)
+
+    def decryptor(self):
+        return PipelineStream(self.inverse)
+
+    def encrypt(self, text):
+        return ''.join(stream_chunks(self.encryptor(), [text]))
+
+    def decrypt(self, text):
+        return ''.join(stream_chunks(self.decryptor(), [text]))
+
+
+import unittest
+
+
+class TestPipeline(unittest.TestCase):
+    def test_fusion_matches_sequential_calls(self):
+        import random
+        import crytography_machine as cm
+        one_shot = {
+            'caesar': lambda t, s: cm.caesar_cipher(t, s['shift'], s.get('encrypt', True)),
+            'rot13': lambda t, s: cm.rot13(t),
+            'vigenere': lambda t, s: cm.vigenere_cipher(t, s['key'], s.get('encrypt', True)),
+            'beaufort': lambda t, s: cm.beaufort_cipher(t, s['key']),
+            'autokey': lambda t, s: cm.autokey_cipher(t, s['key'], s.get('encrypt', True)),
+            'rail-fence': lambda t, s: cm.rail_fence_cipher(t, s['rails'], s.get('encrypt', True)),
+        }
+        rng = random.Random(3)
+        text = "Attack at dawn, hold the bridge! Meet me by the old mill at 9."
+        for _ in range(300):
+            stages = []
+            for _ in range(rng.randint(1, 5)):
+                cipher = rng.choice(list(one_shot))
+                stage = {'cipher': cipher}
+                if cipher == 'caesar':
+                    stage['shift'] = rng.randint(-30, 30)
+                elif cipher == 'rail-fence':
+                    stage['rails'] = rng.randint(1, 6)
+                elif cipher != 'rot13':
+                    stage['key'] = ''.join(rng.choice("ABCXYZ") for _ in range(rng.randint(1, 6)))
+                if cipher in ('caesar', 'vigenere', 'rail-fence') and rng.random() < 0.3:
+                    stage['encrypt'] = False
+                stages.append(stage)
+            expected = text
+            for stage in stages:
+                expected = one_shot[stage['cipher']](expected, stage)
+            pipeline = Pipeline(stages)
+            self.assertEqual(pipeline.encrypt(text), expected, stages)
+            self.assertEqual(''.join(stream_chunks(pipeline.encryptor(), text)), expected, stages)
+            if not any(s['cipher'] == 'beaufort' for s in stages):
+                plain = text if all(s['cipher'] == 'rail-fence' for s in stages) else text.upper()
+                self.assertEqual(pipeline.decrypt(expected), plain, stages)
+
+    def test_plan_is_fused(self):
+        pipeline = Pipeline([{'cipher': 'vigenere', 'key': 'LEMON'}, {'cipher': 'rail-fence', 'rails': 3},
+                             {'cipher': 'caesar', 'shift': 3}, {'cipher': 'rail-fence', 'rails': 4}])
+        self.assertEqual(pipeline.plan, [Substitution(1, _key_offsets("OHPRQ"), True, False),
+                                         Permutation(((3, True), (4, True)))])
+        self.assertEqual(pipeline.inverse[0], Permutation(((4, False), (3, False))))
+        self.assertEqual(len(Pipeline([{'cipher': 'playfair', 'key': 'KEY'}, {'cipher': 'rot13'}]).plan), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
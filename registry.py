@@ -0,0 +1,308 @@
+import importlib
+import importlib.util
+import json
+import os
+
+# Minimum input length (characters or bytes) from which a backend is picked over slower ones;
+# None means never pick it automatically. calibrate() measures per-cipher values on this host.
+DEFAULT_THRESHOLDS = {'pure': 0, 'table': 1024, 'numpy': 16 * 1024, 'parallel': 16 << 20}
+PREFERENCE = ['parallel', 'numpy', 'table', 'pure']  # Fastest first, once past its threshold
+THRESHOLDS_ENV = 'CRYPTO_THRESHOLDS'  # Optional JSON file written by save_thresholds(), loaded on first use
+
+SUBSTITUTION = ['pure', 'table', 'numpy', 'parallel']
+REGISTRY = {
+    'caesar': SUBSTITUTION,
+    'rot13': SUBSTITUTION,
+    'vigenere': SUBSTITUTION,
+    'beaufort': SUBSTITUTION,
+    'autokey': ['pure'],
+    'playfair': ['pure', 'parallel'],
+    'two-square': ['pure', 'parallel'],
+    'four-square': ['pure', 'parallel'],
+    'four-square-noq': ['pure'],  # testing.py variant: 25 letters without Q, J kept
+    'rail-fence': ['pure', 'parallel'],
+}
+REQUIRED = {
+    'caesar': ['shift'], 'vigenere': ['key'], 'autokey': ['key'], 'beaufort': ['key'], 'playfair': ['key'],
+    'two-square': ['key', 'key2'], 'four-square': ['key', 'key2'], 'four-square-noq': ['key', 'key2'],
+    'rail-fence': ['rails'],
+}
+
+_thresholds = {}  # cipher -> backend -> threshold, overriding DEFAULT_THRESHOLDS
+_thresholds_loaded = False
+
+
+def _load(module):
+    """Imports a backend module on first use, so callers only pay for the backends they run."""
+    return importlib.import_module(module)
+
+
+def _pure(cipher, text, encrypt, key=None, key2=None, shift=None, rails=None, alphabet=None, workers=None):
+    if cipher == 'four-square-noq':
+        testing = _load('testing')
+        return (testing.four_square_encrypt if encrypt else testing.four_square_decrypt)([key, key2], text)
+    cm = _load('crytography_machine')
+    extra = {} if alphabet is None else {'alphabet': alphabet}
+    if cipher == 'caesar':
+        return cm.caesar_cipher(text, shift, encrypt, **extra)
+    if cipher == 'rot13':
+        return cm.caesar_cipher(text, 13, True, **extra)
+    if cipher == 'vigenere':
+        return cm.vigenere_cipher(text, key, encrypt, **extra)
+    if cipher == 'autokey':
+        return cm.autokey_cipher(text, key, encrypt, **extra)
+    if cipher == 'beaufort':
+        return cm.beaufort_cipher(text, key, **extra)
+    if cipher == 'playfair':
+        return cm.playfair_cipher(text, key, encrypt, **extra)
+    if cipher == 'two-square':
+        return (cm.two_square_cipher_encrypt if encrypt else cm.two_square_cipher_decrypt)(text, key, key2, **extra)
+    if cipher == 'four-square':
+        return (cm.four_square_cipher_encrypt if encrypt else cm.four_square_cipher_decrypt)(text, key, key2, **extra)
+    return cm.rail_fence_cipher(text, rails, encrypt)
+
+
+def _table(cipher, data, encrypt, key=None, shift=None, **_):
+    byte_ciphers = _load('byte_ciphers')
+    if cipher == 'caesar':
+        return bytes(byte_ciphers.caesar_bytes(data, shift, encrypt))
+    if cipher == 'rot13':
+        return bytes(byte_ciphers.rot13_bytes(data))
+    if cipher == 'vigenere':
+        return bytes(byte_ciphers.vigenere_bytes(data, key, encrypt))
+    return bytes(byte_ciphers.beaufort_bytes(data, key))
+
+
+def _numpy(cipher, text, encrypt, key=None, shift=None, **_):
+    numpy_backend = _load('numpy_backend')
+    if cipher == 'caesar':
+        return numpy_backend.caesar_cipher(text, shift, encrypt)
+    if cipher == 'rot13':
+        return numpy_backend.rot13(text)
+    if cipher == 'vigenere':
+        return numpy_backend.vigenere_cipher(text, key, encrypt)
+    return numpy_backend.beaufort_cipher(text, key)
+
+
+def _parallel(cipher, data, encrypt, key=None, key2=None, shift=None, rails=None, workers=None, **_):
+    return _load('parallel').parallel_transform(cipher, data, encrypt, key, key2, shift, rails, workers)
+
+
+BACKENDS = {'pure': _pure, 'table': _table, 'numpy': _numpy, 'parallel': _parallel}
+TEXT_ONLY = {'pure', 'numpy'}  # Backends that take str; bytes are decoded as UTF-8 for them
+
+
+def available(backend):
+    """Whether a backend can run here, checked without importing it."""
+    if backend == 'numpy':
+        return importlib.util.find_spec('numpy') is not None
+    if backend == 'parallel':
+        return (os.cpu_count() or 1) > 1
+    return backend in BACKENDS
+
+
+def backends(cipher):
+    """Lists the backends registered for a cipher, reference implementation first."""
+    if cipher not in REGISTRY:
+        raise ValueError(f"Unknown cipher: {cipher}")
+    return list(REGISTRY[cipher])
+
+
+def threshold(cipher, backend):
+    global _thresholds_loaded
+    if not _thresholds_loaded:
+        _thresholds_loaded = True
+        path = os.environ.get(THRESHOLDS_ENV)
+        if path and os.path.exists(path):
+            load_thresholds(path)
+    return _thresholds.get(cipher, {}).get(backend, DEFAULT_THRESHOLDS[backend])
+
+
+def set_threshold(cipher, backend, size):
+    """Sets the input length from which backend is used for cipher (None: never automatically)."""
+    _thresholds.setdefault(cipher, {})[backend] = size
+
+
+def _is_ascii(data):
+    return (data if isinstance(data, (str, bytes, bytearray)) else bytes(data)).isascii()
+
+
+def _accepts(backend, data, alphabet):
+    if backend == 'pure':
+        return True
+    if alphabet is not None:
+        return False  # Custom alphabets only exist in the reference implementation
+    if backend == 'table':
+        return _is_ascii(data)  # Raw bytes only match the reference's characters for ASCII
+    return True
+
+
+def select_backend(cipher, data, alphabet=None):
+    """Picks the fastest backend for cipher and this input's type and length."""
+    registered = backends(cipher)
+    if not isinstance(data, str) and alphabet is None and _is_ascii(data):
+        # ASCII buffers are already in the byte-native backends' format, so those come first
+        for backend in ('parallel', 'table'):
+            if backend in registered and available(backend) and (backend == 'table' or _past(cipher, backend, data)):
+                return backend
+    ascii = _is_ascii(data)
+    for backend in PREFERENCE:
+        if backend == 'parallel' and not ascii:
+            continue  # parallel_transform runs non-ASCII text in-process, behind numpy
+        if backend in registered and available(backend) and _accepts(backend, data, alphabet) and _past(cipher, backend, data):
+            return backend
+    return 'pure'
+
+
+def _past(cipher, backend, data):
+    size = threshold(cipher, backend)
+    return size is not None and len(data) >= size
+
+
+def transform(cipher, data, encrypt=True, key=None, backend=None, **opts):
+    """Encrypts or decrypts str or bytes-like data with the best (or the forced) backend.
+
+    opts are key2, shift, rails, alphabet and workers, as each cipher needs. bytes-like input
+    is UTF-8 text and gives bytes back, so every backend returns what the reference does;
+    the table backend only takes ASCII input.
+    """
+    if cipher not in REGISTRY:
+        raise ValueError(f"Unknown cipher: {cipher}")
+    if not isinstance(data, str) and not _is_ascii(data):
+        return transform(cipher, bytes(data).decode('utf-8'), encrypt, key, backend, **opts).encode('utf-8')
+    opts['key'] = key
+    missing = [option for option in REQUIRED.get(cipher, []) if opts.get(option) is None]
+    if missing:
+        raise ValueError(f"The {cipher} cipher needs {missing[0]}.")
+    if backend is None:
+        backend = select_backend(cipher, data, opts.get('alphabet'))
+    elif backend not in REGISTRY[cipher]:
+        raise ValueError(f"The {cipher} cipher has no {backend} backend; it has {', '.join(REGISTRY[cipher])}.")
+    elif not _accepts(backend, data, opts.get('alphabet')):
+        raise ValueError(f"The {backend} backend takes neither non-ASCII input nor custom alphabets.")
+    if backend in TEXT_ONLY and not isinstance(data, str):
+        return BACKENDS[backend](cipher, bytes(data).decode('utf-8'), encrypt, **opts).encode('utf-8')
+    if backend == 'table' and isinstance(data, str):
+        return BACKENDS[backend](cipher, data.encode('ascii'), encrypt, **opts).decode('ascii')
+    return BACKENDS[backend](cipher, data, encrypt, **opts)
+
+
+def encrypt(cipher, data, key=None, backend=None, **opts):
+    """Encrypts data with cipher, e.g. encrypt('vigenere', text, 'LEMON'); backend forces an implementation."""
+    return transform(cipher, data, True, key, backend, **opts)
+
+
+def decrypt(cipher, data, key=None, backend=None, **opts):
+    """Decrypts data with cipher; backend forces an implementation."""
+    return transform(cipher, data, False, key, backend, **opts)
+
+
+def calibrate(ciphers=None, sizes=(256, 4096, 64 * 1024, 1 << 20), min_time=0.05):
+    """Times every available backend against the reference at each size and stores the crossover points.
+
+    A backend's threshold becomes the smallest size from which it is faster at every larger
+    size measured, or None if it never is. Returns the thresholds set.
+    """
+    from benchmark import make_key, make_text, measure
+    options = {'shift': 3, 'rails': 5, 'key2': make_key(7, seed=1)}
+    calibrated = {}
+    for cipher in ciphers or list(REGISTRY):
+        letters = cipher in ('playfair', 'two-square', 'four-square', 'four-square-noq')
+        for backend in backends(cipher)[1:]:
+            if not available(backend):
+                continue
+            faster = []
+            for size in sizes:
+                text = make_text(size, 'mixed', letters)
+                key = make_key(8)
+                timings = [measure(lambda: transform(cipher, text, True, key, name, **options), 1, min_time)
+                           for name in ('pure', backend)]
+                faster.append(timings[1] < timings[0])
+            crossover = None
+            for size, wins in zip(reversed(sizes), reversed(faster)):
+                if not wins:
+                    break
+                crossover = size
+            set_threshold(cipher, backend, crossover)
+            calibrated.setdefault(cipher, {})[backend] = crossover
+    return calibrated
+
+
+def save_thresholds(path):
+    with open(path, 'w') as f:
+        json.dump(_thresholds, f, indent=2)
+
+
+def load_thresholds(path):
+    with open(path) as f:
+        for cipher, values in json.load(f).items():
+            for backend, size in values.items():
+                set_threshold(cipher, backend, size)
+
+
+import unittest
+
+
+class TestRegistry(unittest.TestCase):
+    TEXT = "Attack at dawn, hold the bridge until the balloon goes up"
+
+    def setUp(self):
+        saved = {cipher: dict(values) for cipher, values in _thresholds.items()}
+        self.addCleanup(lambda: (_thresholds.clear(), _thresholds.update(saved)))
+
+    def test_every_backend_matches_the_reference(self):
+        options = {'key': "LEMON", 'key2': "EXAMPLE", 'shift': 5, 'rails': 4}
+        for cipher in REGISTRY:
+            text = self.TEXT.replace(',', '') if cipher.endswith('square') or cipher == 'playfair' else self.TEXT
+            expected = encrypt(cipher, text, backend='pure', **options)
+            for backend in backends(cipher):
+                if backend == 'numpy' and not available('numpy'):
+                    continue
+                extra = {'workers': 2} if backend == 'parallel' else {}
+                self.assertEqual(encrypt(cipher, text, backend=backend, **options, **extra), expected, (cipher, backend))
+                self.assertEqual(decrypt(cipher, expected, backend=backend, **options, **extra),
+                                 decrypt(cipher, expected, backend='pure', **options), (cipher, backend))
+
+    def test_selection_by_type_size_and_alphabet(self):
+        self.assertEqual(select_backend('vigenere', "SHORT"), 'pure')
+        self.assertEqual(select_backend('vigenere', b"SHORT"), 'table')
+        self.assertEqual(select_backend('autokey', b"SHORT"), 'pure')
+        self.assertEqual(encrypt('vigenere', b"Attack", "LEMON"), b"LXFOPV")
+        set_threshold('vigenere', 'table', 0)
+        self.assertEqual(select_backend('vigenere', "ATTACK"), 'table')
+        self.assertEqual(select_backend('vigenere', "ÜBER"), 'pure')
+        self.assertEqual(select_backend('vigenere', "ATTACK", alphabet="ABC"), 'pure')
+        self.assertEqual(encrypt('four-square-noq', "HELLO WORLD", "EXAMPLE", key2="KEYWORD"),
+                         _load('testing').four_square_encrypt(["EXAMPLE", "KEYWORD"], "HELLO WORLD"))
+        with self.assertRaises(ValueError):
+            encrypt('vigenere', "TEXT")  # Missing key
+        with self.assertRaises(ValueError):
+            encrypt('autokey', "TEXT", "KEY", backend='numpy')
+
+    def test_non_ascii_bytes_agree_across_backends(self):
+        data = "Ünïcode straße, café".encode()
+        options = {'key': "LEMON", 'key2': "EXAMPLE", 'shift': 5, 'rails': 3}
+        self.assertEqual(select_backend('caesar', "é".encode()), 'pure')
+        for cipher in ('caesar', 'vigenere', 'rail-fence'):
+            expected = encrypt(cipher, data, backend='pure', **options)
+            self.assertEqual(expected, encrypt(cipher, data.decode(), backend='pure', **options).encode())
+            self.assertEqual(encrypt(cipher, data, **options), expected)
+            for backend in backends(cipher):
+                if backend == 'table':
+                    with self.assertRaises(ValueError):
+                        encrypt(cipher, data, backend=backend, **options)  # Raw bytes would not match
+                elif backend != 'numpy' or available('numpy'):
+                    self.assertEqual(encrypt(cipher, data, backend=backend, **options), expected, (cipher, backend))
+
+    def test_backends_load_lazily(self):
+        import subprocess
+        import sys
+        code = ("import sys, registry; registry.encrypt('caesar', 'HI', shift=1); "
+                "print(sorted(m for m in ('numpy', 'parallel', 'byte_ciphers', 'numpy_backend') if m in sys.modules))")
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        self.assertEqual(out.strip(), '[]')
+
+
+if __name__ == "__main__":
+    unittest.main()
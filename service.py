@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from batch import transform_many
+from cli import CIPHERS, _describe, make_stream
+from registry import REQUIRED
+
+# Request fields that select the cipher and key; requests that agree on all of them can share a batch
+OPTION_FIELDS = ('cipher', 'key', 'key2', 'shift', 'rails')
+FIELD_TYPES = {'key': str, 'key2': str, 'shift': int, 'rails': int}
+
+
+def run_batch(options, texts):
+    """Transforms a batch of texts with one cipher and key; runs in a worker process.
+
+    Returns one (ok, result or error message) pair per text, so a bad text only fails itself.
+    Compiled key material stays cached in the worker between batches.
+    """
+    try:
+        return [(True, result) for result in transform_many(texts, **options)]
+    except (ValueError, TypeError, KeyError):
+        pass  # Some text is invalid: retry them one by one to find it
+    results = []
+    for text in texts:
+        try:
+            stream = make_stream(**options)
+            results.append((True, stream.update(text) + stream.finalize()))
+        except (ValueError, TypeError, KeyError) as e:
+            results.append((False, _describe(e)))
+    return results
+
+
+class CipherService:
+    """Serves cipher requests over a newline-delimited JSON protocol.
+
+    Each request line is an object such as
+    {"id": 1, "op": "encrypt", "cipher": "vigenere", "key": "LEMON", "text": "..."}
+    and gets one response line {"id": 1, "result": "..."} or {"id": 1, "error": "..."}.
+    Responses on a connection may arrive out of order; match them by id.
+    """
+    def __init__(self, workers=None, max_request_bytes=1 << 20, max_pending=1024, batch_window=0.002,
+                 batch_size=256, batch_bytes=64 * 1024):
+        self.workers = workers or os.cpu_count()
+        self.max_request_bytes = max_request_bytes
+        self.max_pending = max_pending  # Requests in flight before connections stop being read
+        self.batch_window = batch_window  # Seconds a small request waits for others with the same key
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes  # Requests larger than this run on their own
+        self.stats = {'requests': 0, 'batches': 0, 'errors': 0}
+        self._batches = {}
+        self._pool = None
+        self._pending = None
+        self._server = None
+        self._connections = set()
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """Starts listening on a Unix socket when path is given, otherwise on TCP host:port."""
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._pending = asyncio.Semaphore(self.max_pending)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path, limit=self.max_request_bytes)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=self.max_request_bytes)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    async def submit(self, options, text):
+        """Transforms one text, batched with concurrent small requests that use the same cipher and key."""
+        loop = asyncio.get_running_loop()
+        if len(text) > self.batch_bytes:
+            return self._unpack(await self._run(options, [text]))
+        batch_key = tuple(sorted(options.items()))
+        batch = self._batches.get(batch_key)
+        if batch is None:
+            batch = self._batches[batch_key] = []
+            loop.call_later(self.batch_window, self._flush, batch_key, batch)
+        future = loop.create_future()
+        batch.append((text, future))
+        if len(batch) >= self.batch_size:
+            self._flush(batch_key, batch)
+        return self._unpack(await future)
+
+    def _run(self, options, texts):
+        self.stats['batches'] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return loop.run_in_executor(self._pool, run_batch, options, texts)
+        except BrokenExecutor:
+            # A worker died (e.g. killed for memory); its batch has failed, but later ones get a fresh pool
+            self._pool.shutdown(wait=False)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return loop.run_in_executor(self._pool, run_batch, options, texts)
+
+    @staticmethod
+    def _unpack(result):
+        if isinstance(result, list):
+            result = result[0]
+        ok, value = result
+        if not ok:
+            raise ValueError(value)
+        return value
+
+    def _flush(self, batch_key, batch):
+        if self._batches.get(batch_key) is not batch:
+            return  # Already sent because it filled up
+        del self._batches[batch_key]
+        futures = [future for _, future in batch]
+        try:
+            done = self._run(dict(batch_key), [text for text, _ in batch])
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def deliver(task):
+            error = task.exception()
+            for i, future in enumerate(futures):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(task.result()[i])
+        asyncio.ensure_future(done).add_done_callback(deliver)
+
+    async def _serve_line(self, line, writer, lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            op = request.get('op', 'encrypt')
+            if op not in ('encrypt', 'decrypt'):
+                raise ValueError("op must be 'encrypt' or 'decrypt'")
+            if request.get('cipher') not in CIPHERS:
+                raise ValueError(f"cipher must be one of {', '.join(CIPHERS)}")
+            text = request.get('text')
+            if not isinstance(text, str):
+                raise ValueError("text must be a string")
+            options = {field: request.get(field) for field in OPTION_FIELDS}
+            missing = [field for field in REQUIRED.get(options['cipher'], []) if options[field] is None]
+            if missing:
+                raise ValueError(f"the {options['cipher']} cipher needs the {missing[0]!r} field")
+            for field, kind in FIELD_TYPES.items():
+                value = options[field]
+                if value is not None and (not isinstance(value, kind) or isinstance(value, bool)):
+                    raise ValueError(f"{field} must be {'a string' if kind is str else 'an integer'}")
+            options['encrypt'] = op == 'encrypt'
+            response = {'id': request_id, 'result': await self.submit(options, text)}
+        except (ValueError, TypeError, AttributeError) as e:
+            self.stats['errors'] += 1
+            response = {'id': request_id, 'error': str(e) or type(e).__name__}
+        except BrokenExecutor:
+            self.stats['errors'] += 1
+            response = {'id': request_id, 'error': "worker process failed; retry the request"}
+        except Exception as e:  # Whatever goes wrong, the client still gets its one response
+            self.stats['errors'] += 1
+            response = {'id': request_id, 'error': f"internal error: {type(e).__name__}"}
+        async with lock:
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                await self._pending.acquire()  # Backpressure: stop reading while too much is in flight
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    self._pending.release()
+                    async with lock:
+                        writer.write(json.dumps({'id': None, 'error': "request too large"}).encode() + b'\n')
+                        await writer.drain()
+                    break
+                if not line.strip():
+                    self._pending.release()
+                    if not line:
+                        break
+                    continue
+                self.stats['requests'] += 1
+                task = asyncio.create_task(self._serve_line(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: self._pending.release())
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            pass  # close() cancels open connections; end quietly (3.11's stream callback would log it)
+        finally:
+            self._connections.discard(connection)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+
+async def serve(host='127.0.0.1', port=8765, path=None, **options):
+    """Runs a CipherService until cancelled."""
+    service = CipherService(**options)
+    server = await service.start(host, port, path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local cipher service with a newline-delimited JSON protocol.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--max-request-bytes', type=int, default=1 << 20)
+    parser.add_argument('--max-pending', type=int, default=1024)
+    parser.add_argument('--batch-window', type=float, default=0.002, help="seconds to wait for a batch to fill")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, workers=args.workers,
+                          max_request_bytes=args.max_request_bytes, max_pending=args.max_pending,
+                          batch_window=args.batch_window))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+import unittest
+
+
+class TestCipherService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cipher.sock')
+        self.service = CipherService(workers=1, max_request_bytes=4096, batch_window=0.05)
+        await self.service.start(path=self.path)
+
+    async def asyncTearDown(self):
+        await self.service.close()
+        self.tmp.cleanup()
+
+    async def exchange(self, *requests):
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=1 << 16)
+        for request in requests:
+            writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in requests]
+        writer.close()
+        await writer.wait_closed()
+        return {response['id']: response for response in responses}
+
+    async def test_concurrent_requests_are_batched(self):
+        from crytography_machine import vigenere_cipher
+        requests = [{'id': i, 'op': 'encrypt', 'cipher': 'vigenere', 'key': 'LEMON', 'text': f"attack {i}"}
+                    for i in range(20)]
+        responses = await self.exchange(*requests)
+        self.assertEqual(responses[7]['result'], vigenere_cipher("attack 7", "LEMON"))
+        self.assertEqual(self.service.stats['batches'], 1)
+
+    async def test_errors_and_size_limit(self):
+        responses = await self.exchange(
+            {'id': 1, 'cipher': 'playfair', 'key': 'KEY', 'text': "HELLO, WORLD"},
+            {'id': 2, 'cipher': 'enigma', 'text': "HELLO"},
+            {'id': 3, 'op': 'decrypt', 'cipher': 'rail-fence', 'rails': 3, 'text': "HOELL"},
+        )
+        self.assertIn('error', responses[1])
+        self.assertIn('error', responses[2])
+        self.assertEqual(responses[3]['result'], "HELLO")
+        responses = await self.exchange(
+            {'id': 5, 'op': 'decrypt', 'cipher': 'rail-fence', 'rails': "3", 'text': "HOELL"},
+            {'id': 6, 'cipher': 'vigenere', 'key': ["L"], 'text': "HELLO"},
+            {'id': 7, 'cipher': 'caesar', 'shift': "x", 'text': "HELLO"},
+        )
+        self.assertEqual(responses[5]['error'], "rails must be an integer")
+        self.assertEqual(responses[6]['error'], "key must be a string")
+        self.assertEqual(responses[7]['error'], "shift must be an integer")
+        responses = await self.exchange({'id': 8, 'cipher': 'two-square', 'key': "KEY", 'text': "HELLO"})
+        self.assertEqual(responses[8]['error'], "the two-square cipher needs the 'key2' field")
+        responses = await self.exchange({'id': 4, 'cipher': 'rot13', 'text': "A" * 5000})
+        self.assertEqual(responses[None]['error'], "request too large")
+
+    async def test_worker_failure_gets_a_response(self):
+        self.assertIn('result', (await self.exchange({'id': 1, 'cipher': 'rot13', 'text': "HELLO"}))[1])
+        for process in list(self.service._pool._processes.values()):
+            process.kill()  # As if the OS had killed the worker
+        response = (await self.exchange({'id': 2, 'cipher': 'rot13', 'text': "HELLO"}))[2]
+        if 'error' in response:
+            self.assertEqual(response['error'], "worker process failed; retry the request")
+        self.assertEqual((await self.exchange({'id': 3, 'cipher': 'rot13', 'text': "HELLO"}))[3]['result'], "URYYB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import math
+import multiprocessing
+import os
+import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from crytography_machine import (create_playfair_matrix, four_square_cipher_decrypt, four_square_cipher_encrypt,
+                                 playfair_cipher)
+from cryptanalysis import ENGLISH_SAMPLE, letters_only
+from numpy_backend import np
+
+SQUARE_ALPHABET = 'ABCDEFGHIKLMNOPQRSTUVWXYZ'
+QUADGRAMS = 26 ** 4
+# Letter of the 25-letter square alphabet -> index in A-Z, used to build quadgram codes
+SQUARE_TO_LETTER = [ord(c) - 65 for c in SQUARE_ALPHABET]
+
+
+def quadgram_code(gram):
+    """Integer code of a four-letter A-Z string: base-26 digits, most significant first."""
+    a, b, c, d = (ord(ch) - 65 for ch in gram)
+    return ((a * 26 + b) * 26 + c) * 26 + d
+
+
+class QuadgramTable:
+    """Log10 quadgram probabilities in a flat array indexed by quadgram_code()."""
+    def __init__(self, counts):
+        total = sum(counts.values())
+        self.floor = math.log10(0.01 / total)  # Score of a quadgram never seen in training
+        self.scores = array('d', [self.floor]) * QUADGRAMS
+        for gram, count in counts.items():
+            self.scores[quadgram_code(gram)] = math.log10(count / total)
+
+    @classmethod
+    def from_text(cls, text):
+        """Builds the table from the quadgrams of a training text."""
+        letters = letters_only(text)
+        counts = {}
+        for i in range(len(letters) - 3):
+            gram = letters[i:i + 4]
+            counts[gram] = counts.get(gram, 0) + 1
+        return cls(counts)
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads a quadgram count file with one 'TION 13168375' pair per line."""
+        counts = {}
+        with open(path) as f:
+            for line in f:
+                gram, count = line.split()
+                counts[gram.upper()] = int(count)
+        return cls(counts)
+
+    def score(self, text):
+        """Total log10 probability of the quadgrams of text's letters."""
+        letters = letters_only(text)
+        return sum(self.scores[quadgram_code(letters[i:i + 4])] for i in range(len(letters) - 3))
+
+
+@lru_cache(maxsize=None)
+def default_quadgrams():
+    """Quadgram table trained on the bundled English sample.
+
+    It is small; for real ciphertexts load a full count file with QuadgramTable.from_file().
+    """
+    return QuadgramTable.from_text(ENGLISH_SAMPLE)
+
+
+def _cell_pairs(cipher):
+    """Key-independent decryption rule: for cells (c1, c2) of a ciphertext digraph, the output cells."""
+    out1, out2 = [], []
+    for c1 in range(25):
+        row1, col1 = divmod(c1, 5)
+        for c2 in range(25):
+            row2, col2 = divmod(c2, 5)
+            if cipher == 'playfair' and row1 == row2:
+                out1.append(row1 * 5 + (col1 - 1) % 5)
+                out2.append(row2 * 5 + (col2 - 1) % 5)
+            elif cipher == 'playfair' and col1 == col2:
+                out1.append((row1 - 1) % 5 * 5 + col1)
+                out2.append((row2 - 1) % 5 * 5 + col2)
+            else:
+                out1.append(row1 * 5 + col2)
+                out2.append(row2 * 5 + col1)
+    return out1, out2
+
+
+class SquareScorer:
+    """Decrypts a fixed ciphertext under candidate squares and scores the result with quadgrams.
+
+    A square is a list of 25 indices into SQUARE_ALPHABET, row by row. Playfair uses one
+    square for both lookup and output; Four-Square looks letters up in two key squares and
+    reads the output from the plain alphabet square.
+    """
+    def __init__(self, ciphertext, cipher, table):
+        letters = [SQUARE_ALPHABET.index(c) for c in letters_only(ciphertext).replace('J', 'I')]
+        if len(letters) % 2:
+            letters.pop()
+        self.cipher = cipher
+        self.first, self.second = letters[0::2], letters[1::2]
+        self.out1, self.out2 = _cell_pairs(cipher)
+        self.quadgrams = max(0, len(letters) - 3)
+        self.table = table.scores
+        if np is not None:
+            self.np_first = np.array(self.first, dtype=np.intp)
+            self.np_second = np.array(self.second, dtype=np.intp)
+            self.np_out1 = np.array(self.out1, dtype=np.intp)
+            self.np_out2 = np.array(self.out2, dtype=np.intp)
+            self.np_table = np.frombuffer(table.scores, dtype=np.float64)
+            self.np_letters = np.array(SQUARE_TO_LETTER, dtype=np.intp)
+            self.score = self._score_numpy
+
+    def _maps(self, squares):
+        identity = range(25)
+        if self.cipher == 'playfair':
+            square = squares[0]
+            return square, square, square, square
+        return squares[0], squares[1], identity, identity
+
+    def score(self, squares):
+        in1, in2, map1, map2 = self._maps(squares)
+        pos1 = [0] * 25
+        pos2 = [0] * 25
+        for cell in range(25):
+            pos1[in1[cell]] = cell
+            pos2[in2[cell]] = cell
+        out1, out2, letters = self.out1, self.out2, SQUARE_TO_LETTER
+        plain = []
+        append = plain.append
+        for a, b in zip(self.first, self.second):
+            pair = pos1[a] * 25 + pos2[b]
+            append(letters[map1[out1[pair]]])
+            append(letters[map2[out2[pair]]])
+        table = self.table
+        total = 0.0
+        code = 0
+        for i, x in enumerate(plain):
+            code = (code * 26 + x) % QUADGRAMS
+            if i >= 3:
+                total += table[code]
+        return total
+
+    def _score_numpy(self, squares):
+        in1, in2, map1, map2 = (np.asarray(s, dtype=np.intp) for s in self._maps(squares))
+        pos1 = np.empty(25, dtype=np.intp)
+        pos2 = np.empty(25, dtype=np.intp)
+        pos1[in1] = np.arange(25)
+        pos2[in2] = np.arange(25)
+        pair = pos1[self.np_first] * 25 + pos2[self.np_second]
+        plain = np.empty(2 * len(pair), dtype=np.intp)
+        plain[0::2] = self.np_letters[map1[self.np_out1[pair]]]
+        plain[1::2] = self.np_letters[map2[self.np_out2[pair]]]
+        codes = ((plain[:-3] * 26 + plain[1:-2]) * 26 + plain[2:-1]) * 26 + plain[3:]
+        return float(self.np_table[codes].sum())
+
+
+def _mutate(square, rng):
+    """Returns a copy of a square with one random change: mostly a letter swap, sometimes a row/column move."""
+    square = square[:]
+    choice = rng.random()
+    if choice < 0.9:
+        i, j = rng.randrange(25), rng.randrange(25)
+        square[i], square[j] = square[j], square[i]
+    elif choice < 0.93:
+        i, j = rng.randrange(5) * 5, rng.randrange(5) * 5
+        square[i:i + 5], square[j:j + 5] = square[j:j + 5], square[i:i + 5]
+    elif choice < 0.96:
+        i, j = rng.randrange(5), rng.randrange(5)
+        square[i::5], square[j::5] = square[j::5], square[i::5]
+    elif choice < 0.98:
+        square.reverse()
+    else:
+        square = [cell for row in range(4, -1, -1) for cell in square[row * 5:row * 5 + 5]]
+    return square
+
+
+def anneal(scorer, squares, iterations, rng, temperature=None, threshold=None, stop=None):
+    """Simulated annealing over key squares; returns (best score, best squares).
+
+    Stops early once the score per quadgram reaches threshold, or when stop (an Event) is set.
+    """
+    if temperature is None:
+        temperature = 10 + 0.087 * (2 * len(scorer.first) - 84)
+    temperature = max(temperature, 1.0)
+    current = best = scorer.score(squares)
+    best_squares = squares
+    for step in range(iterations):
+        if stop is not None and step % 1000 == 0 and stop.is_set():
+            break
+        heat = temperature * (1 - step / iterations)
+        which = rng.randrange(len(squares))
+        candidate = list(squares)
+        candidate[which] = _mutate(squares[which], rng)
+        score = scorer.score(candidate)
+        delta = score - current
+        if delta >= 0 or (heat > 0 and rng.random() < math.exp(delta / heat)):
+            squares, current = candidate, score
+            if current > best:
+                best, best_squares = current, squares
+                if threshold is not None and scorer.quadgrams and best / scorer.quadgrams >= threshold:
+                    break
+    return best, best_squares
+
+
+_worker = {}
+
+
+def _init_worker(table, stop):
+    _worker['table'] = table
+    _worker['stop'] = stop
+
+
+def _restart(cipher, ciphertext, iterations, temperature, threshold, seed):
+    """One annealing run from a random starting key; runs inside a worker process."""
+    rng = random.Random(seed)
+    scorer = SquareScorer(ciphertext, cipher, _worker['table'])
+    count = 1 if cipher == 'playfair' else 2
+    squares = [rng.sample(range(25), 25) for _ in range(count)]
+    score, squares = anneal(scorer, squares, iterations, rng, temperature, threshold, _worker.get('stop'))
+    return score, tuple(''.join(SQUARE_ALPHABET[i] for i in square) for square in squares), scorer.quadgrams
+
+
+def _search(cipher, ciphertext, restarts, iterations, processes, threshold, temperature, seed, table):
+    table = table or default_quadgrams()
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(restarts)]
+    best = None
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        _init_worker(table, None)
+        for restart_seed in seeds:
+            result = _restart(cipher, ciphertext, iterations, temperature, threshold, restart_seed)
+            if best is None or result[0] > best[0]:
+                best = result
+            if threshold is not None and best[2] and best[0] / best[2] >= threshold:
+                break
+        return best
+
+    stop = multiprocessing.Event()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(table, stop)) as pool:
+        futures = [pool.submit(_restart, cipher, ciphertext, iterations, temperature, threshold, s) for s in seeds]
+        for future in as_completed(futures):
+            result = future.result()
+            if best is None or result[0] > best[0]:
+                best = result
+            if threshold is not None and best[2] and best[0] / best[2] >= threshold:
+                stop.set()  # Running restarts notice within 1000 iterations
+                for other in futures:
+                    other.cancel()
+                break
+    return best
+
+
+def solve_playfair(ciphertext, restarts=8, iterations=20_000, processes=None, threshold=None,
+                   temperature=None, seed=None, table=None):
+    """Searches for a Playfair key square; returns (key, plaintext, score).
+
+    key is the 25-letter square read row by row; it can be passed straight to playfair_cipher().
+    threshold is a log10 score per quadgram at which the search stops early.
+    """
+    ciphertext = letters_only(ciphertext)
+    score, (key,), _ = _search('playfair', ciphertext, restarts, iterations, processes,
+                               threshold, temperature, seed, table)
+    return key, playfair_cipher(ciphertext, key, encrypt=False), score
+
+
+def solve_four_square(ciphertext, restarts=8, iterations=20_000, processes=None, threshold=None,
+                      temperature=None, seed=None, table=None):
+    """Searches for the two Four-Square key squares; returns ((key1, key2), plaintext, score)."""
+    ciphertext = letters_only(ciphertext)
+    score, keys, _ = _search('four_square', ciphertext, restarts, iterations, processes,
+                             threshold, temperature, seed, table)
+    return keys, four_square_cipher_decrypt(ciphertext, *keys), score
+
+
+def square_from_key(key):
+    """The key square create_playfair_matrix() builds for a keyword, as a list of SQUARE_ALPHABET indices."""
+    return [SQUARE_ALPHABET.index(c) for c in ''.join(create_playfair_matrix(key))]
+
+
+import unittest
+
+
+class TestSquareSolver(unittest.TestCase):
+    def test_quadgram_table(self):
+        table = default_quadgrams()
+        self.assertEqual(quadgram_code("AAAB"), 1)
+        self.assertGreater(table.score("the keepers wrote about the weather"), table.score("qzxv jwkq pzzq vxjq mmmm zzzzz"))
+
+    def test_scorer_matches_reference_decryption(self):
+        table = default_quadgrams()
+        plaintext = letters_only(ENGLISH_SAMPLE[:405])  # Even length, so no trailing X is stripped
+        ciphertext = playfair_cipher(plaintext, "LIGHTHOUSE")
+        scorer = SquareScorer(ciphertext, 'playfair', table)
+        expected = table.score(playfair_cipher(ciphertext, "LIGHTHOUSE", encrypt=False))
+        self.assertAlmostEqual(scorer.score([square_from_key("LIGHTHOUSE")]), expected)
+
+        ciphertext = four_square_cipher_encrypt(plaintext, "KEEPER", "HARBOUR")
+        scorer = SquareScorer(ciphertext, 'four_square', table)
+        expected = table.score(four_square_cipher_decrypt(ciphertext, "KEEPER", "HARBOUR"))
+        self.assertAlmostEqual(scorer.score([square_from_key("KEEPER"), square_from_key("HARBOUR")]), expected)
+
+    def test_anneal_improves_score(self):
+        rng = random.Random(1)
+        scorer = SquareScorer(playfair_cipher(letters_only(ENGLISH_SAMPLE[:600]), "LIGHTHOUSE"), 'playfair', default_quadgrams())
+        start = [rng.sample(range(25), 25)]
+        best, squares = anneal(scorer, start, 2000, rng)
+        self.assertGreaterEqual(best, scorer.score(start))
+        self.assertEqual(sorted(squares[0]), list(range(25)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,7 @@
 import re
+from functools import lru_cache
+
+from crytography_machine import NormalizedText, PolybiusSquare, square_digraphs
 
 def generate_table(key=''):
     """Generates a Polybius square for the Four-Square Cipher."""
@@ -27,41 +30,42 @@ def position(table, char):
     return None, None
 
 
+@lru_cache(maxsize=256)
+def four_square_digraphs(key1, key2, encrypt=True):
+    """Precomputes the Four-Square digraph table for a pair of keys and one direction."""
+    square1 = PolybiusSquare(generate_table(key1))  # Top-right
+    square2 = PolybiusSquare(generate_table(key2))  # Bottom-left
+    alphabet = PolybiusSquare(generate_table(''))  # Default alphabet matrix
+    if encrypt:
+        return square_digraphs(alphabet, alphabet, square1, square2)
+    return square_digraphs(square1, square2, alphabet, alphabet)
+
+
 def four_square_encrypt(keys, plaintext):
     """Encrypts the plaintext using the Four-Square Cipher."""
-    plaintext = re.sub(r'[\W]', '', plaintext).upper().replace('Q', '')
+    if isinstance(plaintext, NormalizedText):
+        plaintext = plaintext.without_q
+    else:
+        plaintext = re.sub(r'[\W]', '', plaintext).upper().replace('Q', '')
     if len(plaintext) % 2 != 0:
         plaintext += 'X'  # Padding if odd length
 
-    square1 = generate_table(keys[0])  # Top-right
-    square2 = generate_table(keys[1])  # Bottom-left
-    alphabet = generate_table('')  # Default alphabet matrix
-
-    ciphertext = ''
-    for i in range(0, len(plaintext), 2):
-        a, b = plaintext[i], plaintext[i + 1]
-        row1, col1 = position(alphabet, a)
-        row2, col2 = position(alphabet, b)
-        if row1 is not None and row2 is not None:
-            ciphertext += square1[row1][col2] + square2[row2][col1]
-    return ciphertext
+    digraphs = four_square_digraphs(keys[0], keys[1], True)
+    # Pairs with a character missing from the squares are skipped
+    return ''.join([digraphs.get(plaintext[i:i + 2], '') for i in range(0, len(plaintext), 2)])
 
 
 def four_square_decrypt(keys, ciphertext):
     """Decrypts the ciphertext using the Four-Square Cipher."""
-    ciphertext = re.sub(r'[\W]', '', ciphertext).upper()
-
-    square1 = generate_table(keys[0])  # Top-right
-    square2 = generate_table(keys[1])  # Bottom-left
-    alphabet = generate_table('')  # Default alphabet matrix
-
-    plaintext = ''
-    for i in range(0, len(ciphertext), 2):
-        a, b = ciphertext[i], ciphertext[i + 1]
-        row1, col1 = position(square1, a)
-        row2, col2 = position(square2, b)
-        if row1 is not None and row2 is not None:
-            plaintext += alphabet[row1][col2] + alphabet[row2][col1]
+    if isinstance(ciphertext, NormalizedText):
+        ciphertext = ciphertext.word_chars
+    else:
+        ciphertext = re.sub(r'[\W]', '', ciphertext).upper()
+    if len(ciphertext) % 2 != 0:
+        raise ValueError("Four-Square ciphertext must have an even number of characters.")
+
+    digraphs = four_square_digraphs(keys[0], keys[1], False)
+    plaintext = ''.join([digraphs.get(ciphertext[i:i + 2], '') for i in range(0, len(ciphertext), 2)])
     return plaintext.lower()
 
 